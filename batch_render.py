@@ -0,0 +1,90 @@
+# batch_render.py
+#
+# Renders operation scripts (see utils_updated/batch.py) to images without
+# opening a window, one document per script, spread over worker processes.
+#
+#   python batch_render.py scripts/*.jsonl -o renders
+#   python batch_render.py poster.jsonl -o renders --scale 1 --backend tiled
+#   python batch_render.py poster.jsonl -o print --scale 32 --format bmp
+#   python batch_render.py scripts/*.jsonl -j 1 --timings   # time the grid primitives
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from utils_updated.settings import PIXEL_SIZE
+from utils_updated.canvas import GRID_BACKENDS
+from utils_updated.batch import render_script
+from utils_updated.export import EXPORT_FORMATS
+
+
+def render_all(tasks, jobs):
+    # tasks are render_script argument tuples. Documents don't depend on
+    # each other, so each goes to whichever worker is free. Yields results
+    # in task order
+    if jobs == 1:
+        for task in tasks:
+            yield render_script(*task)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(render_script, *zip(*tasks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render paint operation scripts to image files")
+    parser.add_argument('scripts', nargs='+', help="JSON lines operation scripts, one document each")
+    parser.add_argument('-o', '--output', default='renders', help="directory for the images (default: renders)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per core)")
+    parser.add_argument('--scale', type=int, default=PIXEL_SIZE,
+                        help=f"pixels per cell (default: {PIXEL_SIZE}, like the window)")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='png',
+                        help="image format, raw is RGB bytes without a header (default: png)")
+    parser.add_argument('--backend', choices=sorted(GRID_BACKENDS), help="grid backend, overrides the scripts'")
+    parser.add_argument('--timings', action='store_true', help="print the time spent in each kind of op")
+    args = parser.parse_args()
+    if args.jobs < 1 or args.scale < 1:
+        parser.error("--jobs and --scale must be at least 1")
+
+    tasks = []
+    for script in args.scripts:
+        name = os.path.splitext(os.path.basename(script))[0] + '.' + args.format
+        tasks.append((script, os.path.join(args.output, name), args.scale, args.backend))
+    if len({output for _, output, _, _ in tasks}) < len(tasks):
+        parser.error("two scripts have the same name, their images would overwrite each other")
+
+    start = time.perf_counter()
+    failed = 0
+    ops = 0
+    timings = {}
+    for result in render_all(tasks, min(args.jobs, len(tasks))):
+        if result['error'] is not None:
+            failed += 1
+            print(f"Error rendering {result['script']}: {result['error']}", file=sys.stderr)
+            continue
+        ops += result['ops']
+        for kind, (count, seconds) in result['timings'].items():
+            timing = timings.setdefault(kind, [0, 0.0])
+            timing[0] += count
+            timing[1] += seconds
+        print(f"{result['output']}  {result['ops']} ops  {result['seconds'] * 1000:.1f} ms")
+    elapsed = time.perf_counter() - start
+
+    done = len(tasks) - failed
+    print(f"{done} documents, {ops} ops in {elapsed:.2f} s "
+          f"({done / elapsed:.1f} documents/s, {ops / elapsed:.0f} ops/s) with {min(args.jobs, len(tasks))} workers")
+    if args.timings:
+        print(f"{'op':<8}{'count':>8}{'total ms':>11}{'mean ms':>10}")
+        for kind, (count, seconds) in sorted(timings.items()):
+            print(f"{kind:<8}{count:>8}{seconds * 1000:>11.1f}{seconds * 1000 / count:>10.3f}")
+    if failed:
+        print(f"{failed} of {len(tasks)} documents failed", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/bench_batch.py
+#
+# Renders a set of random operation scripts with batch_render's process
+# pool at 1 worker and up to one per core, and reports documents per
+# second and the speedup over one worker. Also checks every worker count
+# writes the same PNGs, and that the list and array backends agree.
+#
+#   python benchmarks/bench_batch.py
+#   python benchmarks/bench_batch.py --documents 64
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils_updated.settings import *
+from batch_render import render_all
+
+COLORS = [BLACK, RED, GREEN, BLUE, ORANGE, PURPLE, YELLOW, CYAN, PINK, BROWN]
+
+
+def write_script(path, rng):
+    # Strokes with the occasional colour change and fill, like a drawing
+    width, height = COLS * PIXEL_SIZE, ROWS * PIXEL_SIZE
+    with open(path, 'w') as f:
+        for _ in range(120):
+            action = rng.random()
+            if action < 0.1:
+                record = {'op': 'color', 'color': list(rng.choice(COLORS))}
+            elif action < 0.2:
+                record = {'op': 'fill', 'pos': [rng.randrange(width), rng.randrange(height)]}
+            else:
+                points = [[rng.randrange(width), rng.randrange(height)] for _ in range(rng.randint(2, 12))]
+                record = {'op': 'stroke', 'points': points, 'size': rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE)}
+            f.write(json.dumps(record) + '\n')
+
+
+def render(scripts, output, jobs, backend=None):
+    tasks = [(script, os.path.join(output, f"{i}.png"), 1, backend) for i, script in enumerate(scripts)]
+    start = time.perf_counter()
+    results = list(render_all(tasks, jobs))
+    elapsed = time.perf_counter() - start
+    assert all(result['error'] is None for result in results), results
+    return elapsed
+
+
+def read_outputs(output):
+    images = {}
+    for name in os.listdir(output):
+        with open(os.path.join(output, name), 'rb') as f:
+            images[name] = f.read()
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="batch_render throughput per worker count")
+    parser.add_argument('--documents', type=int, default=32)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    rng = random.Random(0)
+    scripts = []
+    for i in range(args.documents):
+        scripts.append(os.path.join(root, f"{i}.jsonl"))
+        write_script(scripts[-1], rng)
+
+    # The original list backend paints the same pixels as the array one
+    render(scripts[:2], os.path.join(root, 'list'), 1, 'list')
+    render(scripts[:2], os.path.join(root, 'array'), 1, 'array')
+    assert read_outputs(os.path.join(root, 'list')) == read_outputs(os.path.join(root, 'array'))
+    print("list and array backends write the same PNGs")
+
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    print(f"{args.documents} documents, {cores} cores")
+    print(f"{'workers':>7}{'seconds':>10}{'docs/s':>9}{'speedup':>9}")
+    reference = None
+    base = None
+    for jobs in counts:
+        output = os.path.join(root, f"jobs{jobs}")
+        elapsed = render(scripts, output, jobs)
+        images = read_outputs(output)
+        if reference is None:
+            reference, base = images, elapsed
+        assert images == reference, f"{jobs} workers wrote different PNGs"
+        print(f"{jobs:>7}{elapsed:>10.2f}{args.documents / elapsed:>9.1f}{base / elapsed:>8.2f}x")
+    shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# benchmarks/bench_brush.py
+#
+# Time per motion event of the soft (anti-aliased) brush against the hard
+# one on fast scribbles, painting a layer like the app does, one call per
+# event and with a frame's events merged into one polyline. Fails if the
+# soft brush costs more than the hard one with frames merged, as the app
+# paints, by more than TOLERANCE in the median of strokes timed in pairs.
+# Checks a soft dot is at least half covered exactly where the
+# hard brush paints, and that a soft stroke comes out the same however it
+# is split up. Then paints a stroke across the whole tiled document with
+# both and fails if the soft brush's events cost more than the hard one's
+# by TOLERANCE as the stroke gets longer, or it takes more than
+# LONG_MEMORY while at it.
+#
+#   python benchmarks/bench_brush.py
+
+import os
+import sys
+import gc
+import math
+import time
+import random
+import statistics
+import tracemalloc
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from utils_updated.settings import *
+from utils_updated.array_grid import ArrayGrid
+from utils_updated.brush import stamp_kernels, stroke_alpha
+from utils_updated.layers import LayerStack
+
+FRAME_EVENTS = 8  # Motion events merged into one polyline per frame
+REPEATS = 15  # Pairs of a hard and a soft stroke timed, the median counts
+# How much more the soft brush may cost. The two are about even, the soft
+# one a few percent dearer with brush sizes spread from 1 to 20, and the
+# median soft to hard ratio still moves by 5% or so with the machine's load
+TOLERANCE = 1.15
+LONG_STEP = 10  # Cells between the motion events of the long stroke
+LONG_EXTENTS = (1000, 3000, 16000)  # Cells it has gone when its events are timed
+LONG_EVENTS = 100  # Events up to each of those timed, the median counts
+LONG_MEMORY = 64 * 1024 * 1024  # Bytes painting it soft may take, about 48 MB with the layer's own tiles
+
+
+def spiral_stroke(events, step):
+    # Fast circular scribble, `step` pixels between motion events
+    points = []
+    angle = 0.0
+    for i in range(events):
+        radius = 60 + i * 0.4
+        angle += step / radius
+        points.append((int(400 + radius * math.cos(angle)), int(250 + radius * math.sin(angle))))
+    return points
+
+
+def check_dots(rng):
+    # alpha >= 0.5 is the hard brush's cell-centre distance test
+    for _ in range(500):
+        center = (rng.randrange(COLS * PIXEL_SIZE), rng.randrange(ROWS * PIXEL_SIZE))
+        radius = rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE)
+        grid = ArrayGrid(ROWS, COLS, BG_COLOR)
+        grid.set_cell_color_circle(center, radius, BLACK)
+        hard = np.all(grid.grid == BLACK, axis=2)
+        soft = np.zeros_like(hard)
+        row0, col0, alpha = stroke_alpha([center], radius, ROWS, COLS)
+        soft[row0:row0 + alpha.shape[0], col0:col0 + alpha.shape[1]] = alpha >= 0.5
+        assert np.array_equal(hard, soft), (center, radius)
+    print("a soft dot is half covered or more exactly where the hard brush paints")
+
+
+def check_split(rng):
+    points = [(rng.randrange(COLS * PIXEL_SIZE), rng.randrange(ROWS * PIXEL_SIZE)) for _ in range(60)]
+    sizes = [rng.uniform(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE) for _ in range(59)]
+    whole = LayerStack(ROWS, COLS, BG_COLOR, 'array')
+    whole.soft_stroke(RED).add(points, sizes)
+    split = LayerStack(ROWS, COLS, BG_COLOR, 'array')
+    stroke = split.soft_stroke(RED)
+    for i in range(59):
+        stroke.add(points[i:i + 2], sizes[i:i + 1])
+    assert np.array_equal(whole.read_region(0, 0, ROWS, COLS), split.read_region(0, 0, ROWS, COLS))
+    print("a soft stroke painted a segment at a time equals it painted at once")
+
+
+def event_us(points, sizes, per_call):
+    # Microseconds per motion event of the hard and the soft brush, in
+    # calls of per_call events each, and the soft to hard ratio. The two
+    # take turns stroke by stroke and the ratio is taken pair by pair, so
+    # whatever else slows the machine down hits both alike
+    calls = [(points[i:i + per_call + 1], sizes[i:i + per_call]) for i in range(0, len(points) - 1, per_call)]
+    times = ([], [])
+    gc.disable()
+    try:
+        for _ in range(REPEATS):
+            for soft in (False, True):
+                stack = LayerStack(ROWS, COLS, BG_COLOR, 'array')
+                stroke = stack.soft_stroke(RED)
+                start = time.perf_counter()
+                for call_points, call_sizes in calls:
+                    if soft:
+                        stroke.add(call_points, call_sizes)
+                    else:
+                        stack.set_cell_color_polyline(call_points, call_sizes, RED)
+                times[soft].append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    hard_us, soft_us = (statistics.median(kind) / (len(points) - 1) * 1e6 for kind in times)
+    return hard_us, soft_us, statistics.median(soft / hard for hard, soft in zip(*times))
+
+
+def long_stroke():
+    # Events of a stroke down the tiled document's diagonal
+    step = LONG_STEP * PIXEL_SIZE
+    points = [(i * step, i * step) for i in range(LONG_EXTENTS[-1] // LONG_STEP + 1)]
+    return [points[i:i + 2] for i in range(len(points) - 1)]
+
+
+def check_long_stroke():
+    # The soft brush keeps what its stroke covered tile by tile, an event
+    # costs as much far down a stroke as at its start. The two brushes
+    # take turns event by event, with brush 5
+    events = long_stroke()
+    hard = LayerStack(DOCUMENT_ROWS, DOCUMENT_COLS, BG_COLOR, 'tiled')
+    soft = LayerStack(DOCUMENT_ROWS, DOCUMENT_COLS, BG_COLOR, 'tiled')
+    stroke = soft.soft_stroke(RED)
+    times = ([], [])
+    gc.disable()
+    try:
+        for points in events:
+            start = time.perf_counter()
+            hard.set_cell_color_polyline(points, [5], RED)
+            middle = time.perf_counter()
+            stroke.add(points, [5])
+            times[0].append(middle - start)
+            times[1].append(time.perf_counter() - middle)
+    finally:
+        gc.enable()
+    print(f"{'long stroke, cells':<22}{'hard us/event':>15}{'soft us/event':>15}{'soft/hard':>11}")
+    for extent in LONG_EXTENTS:
+        timed = slice(extent // LONG_STEP - LONG_EVENTS, extent // LONG_STEP)
+        hard_us, soft_us = (statistics.median(kind[timed]) * 1e6 for kind in times)
+        ratio = statistics.median(s / h for h, s in zip(times[0][timed], times[1][timed]))
+        print(f"{extent:<22}{hard_us:>15.1f}{soft_us:>15.1f}{ratio:>11.2f}")
+        assert ratio <= TOLERANCE, f"soft brush events cost more {extent} cells down a stroke"
+    del hard, soft, stroke
+    tracemalloc.start()
+    try:
+        stroke = LayerStack(DOCUMENT_ROWS, DOCUMENT_COLS, BG_COLOR, 'tiled').soft_stroke(RED)
+        for points in events:
+            stroke.add(points, [5])
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    print(f"painting it soft peaks at {peak / 2 ** 20:.1f} MB")
+    assert peak <= LONG_MEMORY, "a long soft stroke takes too much memory"
+
+
+def main():
+    rng = random.Random(0)
+    check_dots(rng)
+    check_split(rng)
+
+    print(f"{'stroke':<22}{'hard us/event':>15}{'soft us/event':>15}"
+          f"{'hard, frames':>14}{'soft, frames':>14}{'soft/hard':>11}")
+    for name, step, sizes in (
+        ('fast, brush 1-5', 25, (1, 5)),
+        ('fast, brush 5', 25, (5, 5)),
+        ('fast, brush 20', 25, (20, 20)),
+        ('very fast, brush 1-20', 60, (1, 20)),
+    ):
+        points = spiral_stroke(800, step)
+        # Brush sizes vary from event to event like the speed based ones
+        brush = [rng.randint(*sizes) for _ in points[1:]]
+        hard_us, soft_us, _ = event_us(points, brush, 1)
+        hard_frames, soft_frames, ratio = event_us(points, brush, FRAME_EVENTS)
+        print(f"{name:<22}{hard_us:>15.1f}{soft_us:>15.1f}{hard_frames:>14.1f}{soft_frames:>14.1f}{ratio:>11.2f}")
+        # The app merges a frame's events, there the soft brush must cost
+        # no more than the hard one
+        assert ratio <= TOLERANCE, f"{name}: the soft brush costs more than the hard one per event"
+    check_long_stroke()
+    print(f"kernel cache: {stamp_kernels.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# benchmarks/bench_export.py
+#
+# Exports a painted document at 1x up to 32x in each format and reports
+# the time, the image size and the peak memory the export allocated,
+# next to scaling the whole image up before writing it as save_image used
+# to (only at the scales where that fits in --old-limit MB). Checks that
+# every format decodes back to the cells scaled up, also with bands so
+# small that single pixel rows are written at a time. Last, saves at 1x
+# through the app's path, the saver thread asking the main loop for a band
+# at a time while the canvas is painted over, and checks that the image
+# is the canvas as it was when saved and what that peaked at.
+#
+#   python benchmarks/bench_export.py
+#   python benchmarks/bench_export.py --size 2048 --scales 1 8 32
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pygame
+from utils_updated.settings import *
+from utils_updated.canvas import create_grid
+from utils_updated.export import export_image, EXPORT_FORMATS
+from utils_updated.importer import load_image
+from utils_updated.png import write_png
+from utils_updated.saver import BackgroundSaver, CanvasSnapshot, SAVE_FINISHED, SAVE_READ
+
+
+def painted_grid(size, rng):
+    # Rectangles of colour on white, as flat as a drawing
+    grid = create_grid(size, size, BG_COLOR, 'tiled')
+    for _ in range(200):
+        row, col = rng.integers(0, size, 2)
+        rows, cols = rng.integers(1, size // 4, 2)
+        block = np.empty((min(rows, size - row), min(cols, size - col), 3), dtype=np.uint8)
+        block[...] = rng.integers(0, 256, 3)
+        grid.write_region(row, col, block)
+    return grid
+
+
+def decode(path, width, height):
+    if path.endswith('.raw'):
+        return np.fromfile(path, dtype=np.uint8).reshape(height, width, 3)
+    return np.array(load_image(path))
+
+
+def check_formats(directory, rng):
+    cells = rng.integers(0, 256, (37, 53, 3), dtype=np.uint8)
+    for scale in (1, 3, 32):
+        expected = cells.repeat(scale, axis=0).repeat(scale, axis=1)
+        for band_bytes in (EXPORT_BAND_BYTES, 1):
+            for fmt in EXPORT_FORMATS:
+                path = os.path.join(directory, f'check.{fmt}')
+                width, height = export_image(path, lambda row0, row1: cells[row0:row1], *cells.shape[:2], scale,
+                                             band_bytes)
+                assert np.array_equal(decode(path, width, height), expected), f"{fmt} at {scale}x"
+                os.remove(path)
+
+
+def measure(run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def app_save(grid, path, rng):
+    # What PaintApp.save_image and its main loop do, painting a stripe
+    # every frame the save is running
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    saver = BackgroundSaver(1)
+    saver.save(CanvasSnapshot(grid, 0, 0, grid.rows, grid.cols), path)
+    finished = None
+    while finished is None:
+        for event in [pygame.event.wait()] + pygame.event.get():
+            if event.type == SAVE_READ:
+                saver.serve()
+            elif event.type == SAVE_FINISHED:
+                event.snapshot.close()
+                finished = event
+        row = rng.integers(0, grid.rows - 8)
+        grid.write_region(row, 0, np.full((8, grid.cols, 3), rng.integers(0, 256, 3), dtype=np.uint8))
+    saver.close()
+    pygame.display.quit()
+    assert finished.error is None, finished.error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time and peak memory of streaming image export")
+    parser.add_argument('--size', type=int, default=1024, help="rows and columns of cells")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 4, 16, 32])
+    parser.add_argument('--old-limit', type=int, default=400, help="MB of pixels up to which the old way is timed")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp()
+    check_formats(directory, rng)
+    print("png, bmp and raw decode back to the cells scaled up, in whole and in single row bands")
+
+    grid = painted_grid(args.size, rng)
+    read_rows = lambda row0, row1: grid.read_region(row0, 0, row1, grid.cols)
+    print(f"{args.size} x {args.size} cells, bands of {EXPORT_BAND_BYTES / 1e6:.0f} MB")
+    print(f"{'export':<12}{'pixels':>14}{'MB out':>9}{'s':>8}{'peak MB':>9}{'old s':>8}{'old peak MB':>13}")
+    for scale in args.scales:
+        for fmt in EXPORT_FORMATS:
+            side = args.size * scale
+            if fmt == 'bmp' and 54 + side * side * 3 >= 1 << 32:
+                continue  # Past what a BMP can hold
+            path = os.path.join(directory, f'export.{fmt}')
+            seconds, peak = measure(lambda: export_image(path, read_rows, grid.rows, grid.cols, scale))
+            line = (f"{fmt} {scale}x".ljust(12) + f"{f'{side} x {side}':>14}{os.path.getsize(path) / 1e6:>9.1f}"
+                    f"{seconds:>8.2f}{peak / 1e6:>9.1f}")
+            os.remove(path)
+            if fmt == 'png' and side * side * 3 <= args.old_limit * 1e6:
+                def old():
+                    cells = grid.read_region(0, 0, grid.rows, grid.cols)
+                    write_png(path, cells.repeat(scale, axis=0).repeat(scale, axis=1))
+                seconds, peak = measure(old)
+                line += f"{seconds:>8.2f}{peak / 1e6:>13.1f}"
+                os.remove(path)
+            print(line)
+
+    path = os.path.join(directory, 'save.png')
+    expected = grid.read_region(0, 0, grid.rows, grid.cols)
+    seconds, peak = measure(lambda: app_save(grid, path, rng))
+    assert np.array_equal(decode(path, grid.cols, grid.rows), expected)
+    print(f"app save at 1x, painted over while saving: {seconds:.2f} s, peak {peak / 1e6:.1f} MB"
+          f" (a copy of the canvas is {expected.nbytes / 1e6:.1f} MB), the image is the canvas as saved")
+    os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
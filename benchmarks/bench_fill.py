@@ -0,0 +1,161 @@
+# benchmarks/bench_fill.py
+#
+# Worst case shapes for flood fill: the scanline engine on both grid
+# backends against the original 4-neighbour BFS, and 8-connected against
+# the same BFS with the diagonal neighbours too. Every result is checked
+# against the BFS of its connectivity. 8-connected fills have to beat the
+# BFS, except on a checkerboard: every cell there is a span of its own, so
+# the scanline engine does a BFS's work per cell and only has to stay
+# within CHECKERBOARD_SLACK of it.
+#
+#   python benchmarks/bench_fill.py [rows cols]
+
+import os
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils_updated.settings import *
+from utils_updated.grid import Grid
+from utils_updated.array_grid import ArrayGrid
+
+CHECKERBOARD_SLACK = 2  # Times the 8-connected BFS a checkerboard fill may take
+
+
+def bfs_flood_fill(grid, pos, new_color, connectivity=4):
+    # The original Grid.flood_fill, kept here as the reference, looking at
+    # the diagonal neighbours as well for 8-connectivity
+    x, y = pos
+    row = y // PIXEL_SIZE
+    col = x // PIXEL_SIZE
+    target_color = grid[row][col]
+    if target_color == new_color:
+        return
+
+    queue = deque()
+    queue.append((row, col))
+    grid[row][col] = new_color
+    rows, cols = len(grid), len(grid[0])
+
+    while queue:
+        current_row, current_col = queue.popleft()
+        neighbors = [
+            (current_row - 1, current_col),
+            (current_row + 1, current_col),
+            (current_row, current_col - 1),
+            (current_row, current_col + 1)
+        ]
+        if connectivity == 8:
+            neighbors += [
+                (current_row - 1, current_col - 1),
+                (current_row - 1, current_col + 1),
+                (current_row + 1, current_col - 1),
+                (current_row + 1, current_col + 1)
+            ]
+        for n_row, n_col in neighbors:
+            if 0 <= n_row < rows and 0 <= n_col < cols:
+                if grid[n_row][n_col] == target_color:
+                    grid[n_row][n_col] = new_color
+                    queue.append((n_row, n_col))
+
+
+def empty_canvas(rows, cols):
+    return [[WHITE] * cols for _ in range(rows)]
+
+
+def spiral_maze(rows, cols):
+    # Nested rectangular walls, each with one gap on alternating corners,
+    # so the fill has to wind its way through every ring
+    cells = empty_canvas(rows, cols)
+    depth = 1
+    while depth * 2 < min(rows, cols) - 1:
+        top, left, bottom, right = depth, depth, rows - 1 - depth, cols - 1 - depth
+        for col in range(left, right + 1):
+            cells[top][col] = BLACK
+            cells[bottom][col] = BLACK
+        for row in range(top, bottom + 1):
+            cells[row][left] = BLACK
+            cells[row][right] = BLACK
+        if (depth // 2) % 2 == 0:
+            cells[top][left + 1] = WHITE
+        else:
+            cells[bottom][right - 1] = WHITE
+        depth += 2
+    return cells
+
+
+def checkerboard(rows, cols):
+    return [[BLACK if (row + col) % 2 else WHITE for col in range(cols)] for row in range(rows)]
+
+
+def comb(rows, cols):
+    # One cell wide vertical corridors joined along the bottom row
+    cells = empty_canvas(rows, cols)
+    for col in range(1, cols, 2):
+        for row in range(rows - 1):
+            cells[row][col] = BLACK
+    return cells
+
+
+def load(grid_class, cells):
+    grid = grid_class(len(cells), len(cells[0]), WHITE)
+    for row, line in enumerate(cells):
+        for col, color in enumerate(line):
+            if color != WHITE:
+                grid.set_cell_color(row, col, color)
+    return grid
+
+
+def as_tuples(grid):
+    return [[grid.get_cell_color(row, col) for col in range(grid.cols)] for row in range(grid.rows)]
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main(rows, cols):
+    shapes = {
+        'empty': empty_canvas,
+        'spiral maze': spiral_maze,
+        'checkerboard': checkerboard,
+        'comb': comb,
+    }
+    print(f"{rows}x{cols} cells, times in ms")
+    print(f"{'shape':<16}{'bfs':>10}{'scan list':>12}{'scan array':>12}{'bfs 8-conn':>12}{'array 8-conn':>14}")
+    for name, build in shapes.items():
+        cells = build(rows, cols)
+
+        reference = [line.copy() for line in cells]
+        bfs_ms = timed(lambda: bfs_flood_fill(reference, (0, 0), RED))
+
+        results = []
+        for grid_class in (Grid, ArrayGrid):
+            grid = load(grid_class, cells)
+            results.append(timed(lambda: grid.flood_fill((0, 0), RED)))
+            if as_tuples(grid) != reference:
+                raise AssertionError(f"{grid_class.__name__} differs from BFS on {name}")
+
+        reference = [line.copy() for line in cells]
+        bfs_eight_ms = timed(lambda: bfs_flood_fill(reference, (0, 0), RED, connectivity=8))
+        grid = load(ArrayGrid, cells)
+        eight_ms = timed(lambda: grid.flood_fill((0, 0), RED, connectivity=8))
+        if as_tuples(grid) != reference:
+            raise AssertionError(f"8-connected fill differs from BFS on {name}")
+        print(f"{name:<16}{bfs_ms:>10.2f}{results[0]:>12.2f}{results[1]:>12.2f}{bfs_eight_ms:>12.2f}{eight_ms:>14.2f}")
+        if name == 'checkerboard':
+            assert eight_ms <= bfs_eight_ms * CHECKERBOARD_SLACK, f"8-connected fill falls behind BFS on {name}"
+        else:
+            assert eight_ms < bfs_eight_ms, f"8-connected fill is slower than BFS on {name}"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        main(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        main(ROWS, COLS)
+        main(ROWS * 4, COLS * 4)
@@ -0,0 +1,88 @@
+# benchmarks/bench_filters.py
+#
+# Times each image filter over a painted canvas at 1 thread and up to
+# one per core, and reports the speedup over one. Checks that the tiled
+# result equals the filter run on the whole canvas at once, whatever the
+# thread count, and that one undo puts the canvas back. On an indexed
+# layer the colour filters must give the same cells and blurs are refused.
+#
+#   python benchmarks/bench_filters.py
+#   python benchmarks/bench_filters.py --size 4096
+#   python benchmarks/bench_filters.py --threads 16   # beyond the core count
+
+import os
+import sys
+import time
+import argparse
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from utils_updated.settings import *
+from utils_updated.array_grid import ArrayGrid
+from utils_updated.indexed_grid import IndexedGrid
+from utils_updated.filters import FILTERS, apply_filter
+from utils_updated.history import History
+
+
+def painted_layer(size, rng):
+    # A layer with transparent gaps between blobs of colour and soft edges
+    rows = np.arange(size)[:, None]
+    cols = np.arange(size)[None, :]
+    cells = np.zeros((size, size, 4), dtype=np.uint8)
+    for _ in range(60):
+        row, col = rng.integers(0, size, 2)
+        radius = rng.integers(size // 40, size // 8)
+        inside = (rows - row) ** 2 + (cols - col) ** 2 <= radius * radius
+        cells[inside] = list(rng.integers(0, 256, 3)) + [int(rng.integers(128, 256))]
+    grid = ArrayGrid(size, size, TRANSPARENT)
+    grid.write_region(0, 0, cells)
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="image filter time per thread count")
+    parser.add_argument('--size', type=int, default=2048, help="canvas rows and columns")
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help="most threads to try")
+    args = parser.parse_args()
+    size = args.size
+
+    source = painted_layer(size, np.random.default_rng(0))
+    before = source.read_region(0, 0, size, size)
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, args.threads} & set(range(1, args.threads + 1)))
+    print(f"{size} x {size} canvas, {FILTER_TILE_SIZE} cell tiles, {cores} cores")
+    print(f"{'filter':<22}" + "".join(f"{f'{jobs} ms':>10}" for jobs in counts) + f"{'speedup':>9}")
+    for name in FILTERS:
+        whole = FILTERS[name][0](before)
+        times = []
+        for jobs in counts:
+            grid = ArrayGrid(size, size, TRANSPARENT)
+            grid.write_region(0, 0, before)
+            history = History(grid, budget=1 << 30)
+            start = time.perf_counter()
+            apply_filter(grid, name, workers=jobs)
+            times.append(time.perf_counter() - start)
+            assert np.array_equal(grid.read_region(0, 0, size, size), whole), f"{name} at {jobs} threads"
+            history.commit()
+            history.undo()
+            assert np.array_equal(grid.read_region(0, 0, size, size), before), f"{name} undo"
+        print(f"{name:<22}" + "".join(f"{t * 1000:>10.1f}" for t in times) + f"{times[0] / times[-1]:>8.2f}x")
+    print("tiled results equal the whole canvas filtered at once, one undo restores it")
+
+    for name in FILTERS:
+        grid = IndexedGrid(size, size, TRANSPARENT)
+        grid.write_region(0, 0, before)
+        try:
+            apply_filter(grid, name)
+        except ValueError:
+            assert FILTERS[name][1] is not None, f"{name} refused on an indexed layer"
+            continue
+        assert FILTERS[name][1] is None, f"{name} ran on an indexed layer"
+        assert np.array_equal(grid.read_region(0, 0, size, size), FILTERS[name][0](before)), f"{name} indexed"
+    print("colour filters give an indexed layer the same cells, blurs are refused on it")
+
+
+if __name__ == "__main__":
+    main()
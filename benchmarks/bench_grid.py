@@ -0,0 +1,81 @@
+# benchmarks/bench_grid.py
+#
+# Compares the list-of-tuples Grid with the numpy ArrayGrid.
+# The canvases are checked cell by cell first, so a timing is only
+# reported for a backend that paints exactly what the original does.
+#
+#   python benchmarks/bench_grid.py
+
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils_updated.settings import *
+from utils_updated.grid import Grid
+from utils_updated.array_grid import ArrayGrid
+
+COLORS = [BLACK, RED, GREEN, BLUE, ORANGE, PURPLE, YELLOW, CYAN, PINK, BROWN, WHITE]
+
+
+def as_tuples(grid):
+    return [[grid.get_cell_color(row, col) for col in range(grid.cols)] for row in range(grid.rows)]
+
+
+def run_script(grid, seed):
+    rng = random.Random(seed)
+    width, height = COLS * PIXEL_SIZE, ROWS * PIXEL_SIZE
+    for _ in range(300):
+        op = rng.random()
+        color = rng.choice(COLORS)
+        # Positions deliberately reach past the canvas edges
+        pos = (rng.randint(-40, width + 40), rng.randint(-40, height + 40))
+        if op < 0.45:
+            grid.set_cell_color_circle(pos, rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE), color)
+        elif op < 0.9:
+            end = (pos[0] + rng.randint(-60, 60), pos[1] + rng.randint(-60, 60))
+            grid.set_cell_color_line(pos, end, rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE), color)
+        elif op < 0.98:
+            grid.flood_fill(pos, color)
+        else:
+            grid.clear()
+
+
+def check_parity(seeds=range(5)):
+    for seed in seeds:
+        expected = Grid(ROWS, COLS, BG_COLOR)
+        actual = ArrayGrid(ROWS, COLS, BG_COLOR)
+        run_script(expected, seed)
+        run_script(actual, seed)
+        if as_tuples(expected) != as_tuples(actual):
+            raise AssertionError(f"ArrayGrid differs from Grid for seed {seed}")
+
+        # Snapshots must round-trip through restore()
+        state = actual.snapshot()
+        actual.clear()
+        actual.restore(state)
+        if as_tuples(expected) != as_tuples(actual):
+            raise AssertionError(f"ArrayGrid snapshot/restore lost data for seed {seed}")
+    print("parity: ArrayGrid matches Grid")
+
+
+def bench(grid_class, number=20):
+    grid = grid_class(ROWS, COLS, BG_COLOR)
+    timings = {
+        'stamp r=20': lambda: grid.set_cell_color_circle((400, 250), MAX_BRUSH_SIZE, RED),
+        'line 200px r=10': lambda: grid.set_cell_color_line((100, 100), (300, 200), 10, BLUE),
+        'clear': grid.clear,
+        'snapshot': grid.snapshot,
+    }
+    for name, func in timings.items():
+        seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print(f"  {name:<18}{seconds * 1e6:12.1f} us")
+
+
+if __name__ == "__main__":
+    check_parity()
+    for grid_class in (Grid, ArrayGrid):
+        print(grid_class.__name__)
+        bench(grid_class)
@@ -0,0 +1,77 @@
+# benchmarks/bench_history.py
+#
+# Records a few hundred strokes and fills through History, checks that
+# undoing and redoing all of them gives back the exact canvases, and
+# reports memory per step and undo cost next to full canvas snapshots.
+#
+#   python benchmarks/bench_history.py
+
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils_updated.settings import *
+from utils_updated.array_grid import ArrayGrid
+from utils_updated.history import History
+
+COLORS = [BLACK, RED, GREEN, BLUE, ORANGE, PURPLE, YELLOW, CYAN, PINK, BROWN]
+
+
+def main(steps=300):
+    rng = random.Random(1)
+    grid = ArrayGrid(ROWS, COLS, BG_COLOR)
+    history = History(grid, budget=64 * 1024 * 1024)
+    states = [grid.snapshot()]
+    width, height = COLS * PIXEL_SIZE, ROWS * PIXEL_SIZE
+
+    for _ in range(steps):
+        color = rng.choice(COLORS)
+        if rng.random() < 0.9:
+            pos = (rng.randrange(width), rng.randrange(height))
+            for _ in range(rng.randint(3, 15)):
+                end = (pos[0] + rng.randint(-40, 40), pos[1] + rng.randint(-40, 40))
+                grid.set_cell_color_line(pos, end, rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE), color)
+                pos = end
+        else:
+            grid.flood_fill((rng.randrange(width), rng.randrange(height)), color)
+        if history.commit():
+            states.append(grid.snapshot())
+
+    count = len(history.undo_stack)
+    snapshot_bytes = grid.snapshot().nbytes
+    print(f"{count} steps in {history.nbytes / 1024:.0f} KiB "
+          f"({history.nbytes / count:.0f} B per step, a full snapshot is {snapshot_bytes} B)")
+
+    start = time.perf_counter()
+    for expected in reversed(states[:-1]):
+        history.undo()
+        if not (grid.grid == expected).all():
+            raise AssertionError("undo did not restore the previous canvas")
+    undo_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for expected in states[1:]:
+        history.redo()
+        if not (grid.grid == expected).all():
+            raise AssertionError("redo did not restore the next canvas")
+    redo_ms = (time.perf_counter() - start) * 1000
+
+    print(f"undo all: {undo_ms:.1f} ms ({undo_ms / count * 1000:.0f} us per step)")
+    print(f"redo all: {redo_ms:.1f} ms ({redo_ms / count * 1000:.0f} us per step)")
+
+    # The same budget as the app, to show how deep the history gets
+    grid = ArrayGrid(ROWS, COLS, BG_COLOR)
+    history = History(grid)
+    for _ in range(steps):
+        pos = (rng.randrange(width), rng.randrange(height))
+        end = (pos[0] + rng.randint(-80, 80), pos[1] + rng.randint(-80, 80))
+        grid.set_cell_color_line(pos, end, rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE), rng.choice(COLORS))
+        history.commit()
+    print(f"HISTORY_BUDGET={HISTORY_BUDGET // 1024} KiB holds {len(history.undo_stack)} of {steps} strokes")
+
+
+if __name__ == "__main__":
+    main()
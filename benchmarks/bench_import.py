@@ -0,0 +1,131 @@
+# benchmarks/bench_import.py
+#
+# Times importing a large photo sized PNG into the canvas, split into
+# decoding, downsampling, palette snapping and the bulk write, against a
+# per cell loop of set_cell_color. Checks the vectorised downsampling
+# against per block averages and that a saved image imports back exactly,
+# snapped to the app's palette or not.
+#
+#   python benchmarks/bench_import.py
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from utils_updated.settings import *
+from utils_updated.array_grid import ArrayGrid
+from utils_updated.layers import LayerStack
+from utils_updated.png import write_png
+from utils_updated.importer import load_image, block_size, downsample, snap_to_palette, import_image
+
+PHOTO = (3000, 4000)  # Height, width, a 12 megapixel photo
+PALETTE = [BLACK, RED, GREEN, BLUE, ORANGE, PURPLE, YELLOW, CYAN, PINK, BROWN]
+
+
+def photo(height, width, rng):
+    # Smooth gradients with noise, compresses about like a photo
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.stack([x / width * 255, y / height * 255, (np.sin(x / 97) * np.cos(y / 53) + 1) * 127], axis=2)
+    image += rng.normal(0, 12, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def timed(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def per_cell_import(grid, pixels, block):
+    # Average each block in Python and set its cell, one at a time
+    height, width = pixels.shape[:2]
+    for row, y in enumerate(range(0, height, block)):
+        for col, x in enumerate(range(0, width, block)):
+            color = pixels[y:y + block, x:x + block].reshape(-1, 3).mean(axis=0)
+            grid.set_cell_color(row, col, tuple(int(c + 0.5) for c in color))
+
+
+def check_downsampling(rng):
+    # Odd sizes, so the right and bottom blocks are partial
+    pixels = rng.integers(0, 256, (203, 157, 3), dtype=np.uint8)
+    for block in (1, 3, 4, 7):
+        cells = downsample(pixels, block, 'average')
+        nearest = downsample(pixels, block, 'nearest')
+        for row in range(cells.shape[0]):
+            for col in range(cells.shape[1]):
+                part = pixels[row * block:(row + 1) * block, col * block:(col + 1) * block].reshape(-1, 3)
+                assert np.array_equal(cells[row, col], np.floor(part.mean(axis=0) + 0.5).astype(np.uint8))
+                y = min(row * block + block // 2, pixels.shape[0] - 1)
+                x = min(col * block + block // 2, pixels.shape[1] - 1)
+                assert np.array_equal(nearest[row, col], pixels[y, x])
+    snapped = snap_to_palette(pixels, PALETTE)
+    distances = ((pixels[:, :, None, :].astype(int) - np.array(PALETTE)) ** 2).sum(axis=3)
+    assert np.array_equal(snapped, np.array(PALETTE, dtype=np.uint8)[distances.argmin(axis=2)])
+    print("downsampling and palette snapping match per block references")
+
+
+def check_round_trip(directory):
+    # A saved canvas (PIXEL_SIZE pixels a cell) comes back cell for cell
+    grid = ArrayGrid(ROWS, COLS, BG_COLOR)
+    random_state = random.Random(0)
+    for _ in range(50):
+        points = [(random_state.randrange(COLS * PIXEL_SIZE), random_state.randrange(ROWS * PIXEL_SIZE))
+                  for _ in range(4)]
+        grid.set_cell_color_polyline(points, random_state.randint(1, 20), random_state.choice(PALETTE))
+    cells = grid.read_region(0, 0, ROWS, COLS)
+    path = os.path.join(directory, 'saved.png')
+    write_png(path, cells.repeat(PIXEL_SIZE, axis=0).repeat(PIXEL_SIZE, axis=1))
+    # The app snaps to the toolbar colours and the background on the
+    # indexed backend or with IMPORT_SNAP_TO_PALETTE
+    for backend, palette in (('array', None), ('array', [BG_COLOR] + PALETTE), ('indexed', [BG_COLOR] + PALETTE)):
+        for sampling in ('average', 'nearest'):
+            stack = LayerStack(ROWS, COLS, BG_COLOR, backend)
+            import_image(stack.active_grid(), path, palette, sampling)
+            assert np.array_equal(stack.composite.read_region(0, 0, ROWS, COLS), cells)
+    print("a saved image imports back cell for cell, snapped to the palette or not")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    directory = tempfile.mkdtemp()
+    check_downsampling(rng)
+    check_round_trip(directory)
+
+    path = os.path.join(directory, 'photo.png')
+    write_png(path, photo(*PHOTO, rng), level=1)
+    print(f"{PHOTO[1]} x {PHOTO[0]} photo into a {COLS} x {ROWS} canvas")
+
+    pixels, decode_ms = timed(lambda: load_image(path))
+    block = block_size(*pixels.shape[:2], ROWS, COLS)
+    cells, average_ms = timed(lambda: downsample(pixels, block, 'average'))
+    _, nearest_ms = timed(lambda: downsample(pixels, block, 'nearest'))
+    _, snap_ms = timed(lambda: snap_to_palette(cells, PALETTE))
+    grid = ArrayGrid(ROWS, COLS, BG_COLOR)
+    _, write_ms = timed(lambda: grid.write_region(0, 0, cells))
+    _, total_ms = timed(lambda: import_image(ArrayGrid(ROWS, COLS, BG_COLOR), path))
+    _, loop_ms = timed(lambda: per_cell_import(ArrayGrid(ROWS, COLS, BG_COLOR), pixels, block), repeat=1)
+    del pixels
+
+    print(f"{'step':<28}{'ms':>10}")
+    for name, ms in (('decode (pygame.image.load)', decode_ms), ('downsample, average', average_ms),
+                     ('downsample, nearest', nearest_ms), ('snap to palette', snap_ms),
+                     ('write_region', write_ms), ('import_image with decode', total_ms),
+                     ('per cell loop (no decode)', loop_ms)):
+        print(f"{name:<28}{ms:>10.2f}")
+    os.remove(path)
+    os.remove(os.path.join(directory, 'saved.png'))
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# benchmarks/bench_indexed.py
+#
+# Compares the indexed backend (a palette index per cell) with the array
+# backend on the same painting: memory, flood fill with and without a
+# tolerance, undo history size and recolouring one colour everywhere.
+# Checks both backends end up with the same cells, through undo and redo.
+#
+#   python benchmarks/bench_indexed.py
+#   python benchmarks/bench_indexed.py --size 2048
+
+import os
+import sys
+import time
+import random
+import argparse
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from utils_updated.settings import *
+from utils_updated.array_grid import ArrayGrid
+from utils_updated.indexed_grid import IndexedGrid
+from utils_updated.history import History
+
+PALETTE = [BLACK, RED, GREEN, BLUE, ORANGE, PURPLE, YELLOW, CYAN, PINK, BROWN]
+
+
+def paint(grids, histories, size, rng, strokes):
+    # The same strokes and fills on every grid, each one an undo step.
+    # Returns the raw bytes of the tiles each history stored
+    raw = [0] * len(grids)
+    for _ in range(strokes):
+        color = rng.choice(PALETTE)
+        if rng.random() < 0.1:
+            pos = (rng.randrange(size * PIXEL_SIZE), rng.randrange(size * PIXEL_SIZE))
+            for grid in grids:
+                grid.flood_fill(pos, color)
+        else:
+            points = [(rng.randrange(size * PIXEL_SIZE), rng.randrange(size * PIXEL_SIZE)) for _ in range(4)]
+            brush = rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE * 4)
+            for grid in grids:
+                grid.set_cell_color_polyline(points, brush, color)
+        for i, history in enumerate(histories):
+            raw[i] += sum(block.nbytes for block in history.pending.values())
+            history.commit()
+    return raw
+
+
+def same_cells(grid_a, grid_b):
+    return np.array_equal(grid_a.read_region(0, 0, grid_a.rows, grid_a.cols),
+                          grid_b.read_region(0, 0, grid_b.rows, grid_b.cols))
+
+
+def timed(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def fill_ms(grid, size, tolerance):
+    # Fills the middle with a colour and back, so every run fills the same area
+    pos = (size * PIXEL_SIZE // 2, size * PIXEL_SIZE // 2)
+    old = grid.get_cell_color(size // 2, size // 2)
+    new = WHITE if old != WHITE else BLACK
+
+    def run():
+        grid.flood_fill(pos, new, tolerance)
+        grid.flood_fill(pos, old, tolerance)
+    return timed(run) / 2
+
+
+def array_recolor(grid, old, new):
+    # What recolouring costs without a palette: every cell is compared
+    grid.grid[np.all(grid.grid == old, axis=2)] = new
+
+
+def main():
+    parser = argparse.ArgumentParser(description="indexed against array backend")
+    parser.add_argument('--size', type=int, default=1024, help="canvas rows and columns")
+    parser.add_argument('--strokes', type=int, default=200)
+    args = parser.parse_args()
+    size = args.size
+
+    array = ArrayGrid(size, size, BG_COLOR)
+    indexed = IndexedGrid(size, size, BG_COLOR)
+    histories = [History(array, budget=1 << 30), History(indexed, budget=1 << 30)]
+    raw = paint([array, indexed], histories, size, random.Random(0), args.strokes)
+    assert same_cells(array, indexed), "backends painted different cells"
+    for _ in range(args.strokes // 2):
+        for history in histories:
+            history.undo()
+    assert same_cells(array, indexed), "backends differ after undo"
+    for _ in range(args.strokes // 4):
+        for history in histories:
+            history.redo()
+    assert same_cells(array, indexed), "backends differ after redo"
+    print(f"{size} x {size} canvas, {args.strokes} strokes and fills: same cells, also after undo and redo")
+
+    print(f"{'':<26}{'array':>12}{'indexed':>12}{'ratio':>8}")
+    rows = [
+        ('canvas bytes', array.grid.nbytes, indexed.grid.nbytes + indexed.palette.nbytes),
+        ('undo tiles, raw bytes', raw[0], raw[1]),
+        ('undo steps, zlib bytes', histories[0].nbytes, histories[1].nbytes),
+    ]
+    for name, a, b in rows:
+        print(f"{name:<26}{a:>12}{b:>12}{a / b:>7.1f}x")
+
+    rows = [
+        ('fill ms', fill_ms(array, size, 0), fill_ms(indexed, size, 0)),
+        ('fill ms, tolerance 100', fill_ms(array, size, 100), fill_ms(indexed, size, 100)),
+    ]
+    old = indexed.get_cell_color(size // 2, size // 2)
+    rows.append(('recolour ms',
+                 timed(lambda: (array_recolor(array, old, (1, 2, 3)), array_recolor(array, (1, 2, 3), old))) / 2,
+                 timed(lambda: (indexed.replace_color(old, (1, 2, 3)), indexed.replace_color((1, 2, 3), old))) / 2))
+    for name, a, b in rows:
+        print(f"{name:<26}{a:>12.3f}{b:>12.3f}{a / b:>7.1f}x")
+    assert same_cells(array, indexed), "backends differ after recolouring"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/bench_journal.py
+#
+# Times the pause a journal checkpoint makes on the UI thread, on tiled
+# documents with more and more painted, after the JOURNAL_CHECKPOINT_EVERY
+# strokes since the last one. Before, a checkpoint read every painted
+# block there. Now only the tiles changed since the last checkpoint are
+# read, the writer thread has the rest. The checkpoint is timed with the
+# writer idle, and again while the writer packs every painted block as
+# it does after the first checkpoint or a layer added. Checks that the
+# journal replays to the document after every checkpoint, and that the
+# stroke a checkpoint commits doesn't start another one.
+#
+#   python benchmarks/bench_journal.py
+
+import os
+import sys
+import random
+import tempfile
+import time
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from utils_updated.settings import *
+from utils_updated.layers import LayerStack
+from utils_updated.journal import Journal, replay, CHECKPOINT
+
+COLORS = [BLACK, RED, GREEN, BLUE, ORANGE, PURPLE, YELLOW, CYAN, PINK, BROWN]
+SIZE = 16384
+
+
+def stroke(grid, journal, rng):
+    # A short stroke somewhere on the document
+    pos = (rng.randrange(SIZE * PIXEL_SIZE), rng.randrange(SIZE * PIXEL_SIZE))
+    points = [pos, (pos[0] + rng.randint(-200, 200), pos[1] + rng.randint(-200, 200))]
+    color = rng.choice(COLORS) + (255,)
+    size = rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE)
+    grid.set_cell_color_polyline(points, size, color)
+    journal.add_stroke(points, size, color)
+    journal.commit()
+
+
+def keep_writer_busy(journal, grid):
+    # Has the writer pack every painted block again, as a checkpoint that
+    # starts over does, without touching the changes the journal tracks.
+    # Returns once the writer is at it
+    blocks = list(grid.painted_blocks())
+    journal.queue.put((CHECKPOINT, ('', grid.layer_state(), blocks, True)))
+    time.sleep(journal.flush_interval + 0.05)
+
+
+def timed_checkpoint(journal):
+    start = time.perf_counter()
+    journal.checkpoint()
+    return (time.perf_counter() - start) * 1000
+
+
+def check_nested_checkpoint(path):
+    # The stroke committed by a checkpoint reaches checkpoint_every
+    grid = LayerStack(ROWS, COLS, BG_COLOR, 'array')
+    journal = Journal(grid, path, checkpoint_every=1)
+    journal.recover()
+    reads = []
+    read_checkpoint = journal.read_checkpoint
+    journal.read_checkpoint = lambda: reads.append(read_checkpoint())
+    journal.add_stroke([(10, 10), (200, 120)], 5, RED + (255,))
+    journal.checkpoint()
+    journal.close(discard=True)
+    assert len(reads) == 1, f"{len(reads)} checkpoints read for one"
+    print("a checkpoint committing a stroke reads the canvas once")
+
+
+def main():
+    rng = random.Random(1)
+    path = os.path.join(tempfile.mkdtemp(), 'canvas.journal')
+    check_nested_checkpoint(path)
+    grid = LayerStack(SIZE, SIZE, BG_COLOR, 'tiled')
+    # Checkpoints only where timed
+    journal = Journal(grid, path, checkpoint_every=10 ** 9)
+    journal.recover()
+    print(f"{SIZE}x{SIZE} tiled document, checkpoint after {JOURNAL_CHECKPOINT_EVERY} strokes")
+    print(f"{'painted tiles':>14}{'all blocks ms':>15}{'checkpoint ms':>15}{'writer busy ms':>16}")
+    for _ in range(4):
+        for _ in range(2000):
+            stroke(grid, journal, rng)
+        journal.checkpoint()
+        journal.wait()
+        for _ in range(JOURNAL_CHECKPOINT_EVERY):
+            stroke(grid, journal, rng)
+        start = time.perf_counter()
+        blocks = list(grid.painted_blocks())
+        before = (time.perf_counter() - start) * 1000
+        idle = timed_checkpoint(journal)
+        journal.wait()
+        for _ in range(JOURNAL_CHECKPOINT_EVERY):
+            stroke(grid, journal, rng)
+        keep_writer_busy(journal, grid)
+        busy = timed_checkpoint(journal)
+        print(f"{len(blocks):>14}{before:>15.1f}{idle:>15.1f}{busy:>16.1f}")
+
+        # What the writer made of it replays to the document
+        journal.wait()
+        blocks = list(grid.painted_blocks())
+        copy = LayerStack(SIZE, SIZE, BG_COLOR, 'tiled')
+        replay(path, copy)
+        for row0, col0, cells in blocks:
+            assert np.array_equal(copy.read_region(row0, col0, row0 + cells.shape[0], col0 + cells.shape[1]), cells)
+        assert not set(copy.painted_rects()) - {(row0, col0, row0 + cells.shape[0], col0 + cells.shape[1])
+                                                for row0, col0, cells in blocks}
+    journal.close(discard=True)
+    os.rmdir(os.path.dirname(path))
+    print("the journal replays to the document after every checkpoint")
+
+
+if __name__ == "__main__":
+    main()
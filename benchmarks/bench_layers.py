@@ -0,0 +1,110 @@
+# benchmarks/bench_layers.py
+#
+# Paints strokes into the middle layer of documents with 1 to 10 layers
+# and reports the cost of a stroke including bringing the composite up to
+# date, which should not grow with the number of layers, and the cost of
+# switching the active layer, which recomposites everything. Also checks
+# the incrementally kept composite against one built from scratch and
+# against straightforward float compositing of all layers.
+#
+#   python benchmarks/bench_layers.py
+
+import os
+import sys
+import random
+import time
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from utils_updated.settings import *
+from utils_updated.layers import LayerStack
+
+COLORS = [BLACK, RED, GREEN, BLUE, ORANGE, PURPLE, YELLOW, CYAN, PINK, BROWN, TRANSPARENT, (0, 128, 255, 96)]
+
+
+def stroke(grid, rng):
+    points = [(rng.randrange(grid.cols * PIXEL_SIZE), rng.randrange(grid.rows * PIXEL_SIZE)) for _ in range(4)]
+    grid.set_cell_color_polyline(points, rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE), rng.choice(COLORS))
+
+
+def build(layers, backend, rng):
+    stack = LayerStack(ROWS, COLS, BG_COLOR, backend)
+    for index in range(layers):
+        if index:
+            stack.add_layer()
+        stack.set_opacity(index, rng.choice((1.0, 1.0, 0.5)))
+        for _ in range(30):
+            stroke(stack, rng)
+    stack.set_active(layers // 2)
+    stack.composite.read_region(0, 0, ROWS, COLS)
+    return stack
+
+
+def reference(stack):
+    # Every visible layer blended in turn, in float64
+    values = np.empty((stack.rows, stack.cols, 3))
+    values[...] = stack.paper
+    for layer in stack.layers:
+        cells = layer.grid.read_region(0, 0, stack.rows, stack.cols).astype(np.float64)
+        alpha = cells[..., 3:] / 255 * layer.alpha()
+        values = values * (1 - alpha) + cells[..., :3] * alpha
+    return values
+
+
+def check_parity():
+    rng = random.Random(3)
+    for backend in ('array', 'tiled'):
+        stack = build(4, backend, rng)
+        for _ in range(300):
+            action = rng.random()
+            if action < 0.7:
+                stroke(stack, rng)
+            elif action < 0.8:
+                pos = (rng.randrange(COLS * PIXEL_SIZE), rng.randrange(ROWS * PIXEL_SIZE))
+                stack.flood_fill(pos, rng.choice(COLORS))
+            elif action < 0.9:
+                stack.set_active(rng.randrange(len(stack.layers)))
+            else:
+                stack.set_visible(rng.randrange(len(stack.layers)), rng.random() < 0.7)
+            if rng.random() < 0.3:
+                row, col = rng.randrange(ROWS), rng.randrange(COLS)
+                stack.composite.read_region(row, col, min(row + 40, ROWS), min(col + 40, COLS))
+        kept = stack.composite.read_region(0, 0, ROWS, COLS).copy()
+        stack.flat.clear()
+        stack.mark_all_dirty()
+        assert np.array_equal(kept, stack.composite.read_region(0, 0, ROWS, COLS))
+        # The caches are uint8, each rounds by up to half a level
+        assert np.abs(kept - reference(stack)).max() < 2
+    print("layer composite matches a full recomposite")
+
+
+def time_ms(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    check_parity()
+    print(f"{'backend':<9}{'layers':>7}{'stroke ms':>11}{'switch ms':>11}")
+    for backend in ('array', 'tiled'):
+        for layers in (1, 2, 5, 10):
+            rng = random.Random(1)
+            stack = build(layers, backend, rng)
+
+            def edit():
+                stroke(stack, rng)
+                stack.composite.read_region(0, 0, ROWS, COLS)
+
+            def switch():
+                stack.set_active((stack.active + 1) % layers)
+                stack.composite.read_region(0, 0, ROWS, COLS)
+
+            print(f"{backend:<9}{layers:>7}{time_ms(edit, 300):>11.3f}{time_ms(switch, 20):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
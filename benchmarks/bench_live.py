@@ -0,0 +1,138 @@
+# benchmarks/bench_live.py
+#
+# Draws the same strokes in the app with the live canvas export off, then
+# on with live_reader.py's follow() copying every frame out of it in
+# another process. Reports the painter's frame times and frame rate both
+# ways and what the reader got, and checks that the reader's copy ends up
+# equal to the canvas and that readers attaching from processes of their
+# own leave the block to the painter when they exit. On a machine with
+# one core the reader's polling shares it with the painter, the cost of
+# publishing alone is the 'live' profiler scope.
+#
+#   python benchmarks/bench_live.py
+#   python benchmarks/bench_live.py --backend tiled --strokes 40
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from multiprocessing import resource_tracker
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pygame
+from utils_updated.canvas import GRID_BACKENDS
+from utils_updated.live import LiveCanvasReader
+from main_app import PaintApp
+from live_reader import follow
+from harness import stroke, scribble
+
+NAME = 'paint_bench_live'
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# Attaches a LiveCanvasReader to the block named argv[1] and exits
+ATTACH = ("import sys; sys.path.insert(0, sys.argv[2]); from utils_updated.live import LiveCanvasReader; "
+          "LiveCanvasReader(sys.argv[1]).close()")
+
+
+def reader_process(name, ready, stop, results):
+    reader = LiveCanvasReader(name)
+    ready.set()
+    start = time.perf_counter()
+    copy, frames, cells, torn = follow(reader, stop.is_set)
+    results.put((copy, tuple(reader.origin()), frames, cells, torn, time.perf_counter() - start))
+    # A child shares the painter's resource tracker, put back the block
+    # LiveCanvasReader took out of it so the painter's unlink finds it
+    if reader.untracked is not None:
+        resource_tracker.register(reader.untracked, 'shared_memory')
+    reader.close()
+
+
+def check_attach(name):
+    # Readers run as live_reader.py is, in processes of their own with
+    # resource trackers of their own. The block must still be there for
+    # the next one once one exits, and none may warn about it
+    for _ in range(2):
+        done = subprocess.run([sys.executable, '-c', ATTACH, name, ROOT], capture_output=True, text=True)
+        assert done.returncode == 0 and not done.stderr, f"attaching a reader failed:\n{done.stderr}"
+
+
+def paint(app, frames):
+    times = []
+    for events in frames:
+        start = time.perf_counter()
+        app.handle_events(events)
+        app.draw()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def session(backend, frames, live):
+    journal_dir = tempfile.mkdtemp()
+    app = PaintApp(journal_path=os.path.join(journal_dir, 'canvas.journal'), backend=backend, scheduler='events',
+                   live_export=NAME if live else None)
+    app.base_brush_size = 4
+    paint(app, [[]])
+    reader = None
+    if live:
+        ready, stop, results = multiprocessing.Event(), multiprocessing.Event(), multiprocessing.Queue()
+        reader = multiprocessing.Process(target=reader_process, args=(NAME, ready, stop, results))
+        reader.start()
+        ready.wait()
+    start = time.perf_counter()
+    times = paint(app, frames)
+    elapsed = time.perf_counter() - start
+    got = None
+    if live:
+        stop.set()
+        copy, origin, read, cells, torn, seconds = results.get()
+        reader.join()
+        top, left = origin
+        expected = app.grid.composite.read_region(top, left, top + copy.shape[0], left + copy.shape[1])
+        assert np.array_equal(copy, expected), "the reader's copy differs from the canvas"
+        got = (read, cells, torn, seconds)
+        check_attach(NAME)
+        app.live.close()  # Unlinking fails if a reader took the block with it
+    app.journal.close(discard=True)
+    app.saver.close()
+    return times, elapsed, got
+
+
+def report(name, times, elapsed):
+    ms = np.array(times) * 1000
+    print(f"{name:<12}{np.median(ms):>10.2f}{np.percentile(ms, 95):>10.2f}{len(times) / elapsed:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="painter frame rate with the live canvas export")
+    parser.add_argument('--backend', choices=GRID_BACKENDS, default='array')
+    parser.add_argument('--strokes', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    frames = []
+    for _ in range(args.strokes):
+        frames += stroke(scribble(rng, 120, 6), 2)
+
+    print(f"{args.backend} backend, {len(frames)} frames, {os.cpu_count()} cores")
+    print(f"{'export':<12}{'median ms':>10}{'p95 ms':>10}{'frames/s':>10}")
+    times, elapsed, _ = session(args.backend, frames, False)
+    report('off', times, elapsed)
+    times, elapsed, (read, cells, torn, seconds) = session(args.backend, frames, True)
+    report('on', times, elapsed)
+    print(f"reader: {read} frames, {read / seconds:.0f} frames/s, {cells * 3 / seconds / 1e6:.2f} MB/s copied, "
+          f"{torn} torn reads retried")
+    print("the reader's copy equals the canvas")
+    print("readers in processes of their own leave the block to the painter")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# benchmarks/bench_pointer.py
+#
+# Runs PaintApp.run() headless while a thread posts straight strokes at a
+# steady speed, like a mouse reporting at MOTION_HZ. Reports how much the
+# brush size wobbles along them when the speed is timed at processing
+# (as it was), at arrival and from the time each sample was posted (a
+# device timestamp), and the input to display latency the app measures
+# (MEASURE_LATENCY) with and without predicted ink. With the dummy video
+# driver the display update returns at once, so this is the app's own
+# latency, a real display adds its refresh. Also checks that predicted
+# ink is taken away when the pointer stops with the button held.
+#
+#   python benchmarks/bench_pointer.py
+#   python benchmarks/bench_pointer.py --speed 800 --seconds 5
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+from io import StringIO
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pygame
+from utils_updated.settings import *
+from main_app import PaintApp
+from harness import press, release, motion, set_slider
+
+MOTION_HZ = 500
+
+
+def brush_size(speed, base, sensitivity):
+    # The app's speed to brush size mapping
+    speed = max(MIN_SPEED, min(speed, MAX_SPEED))
+    ratio = (speed - MIN_SPEED) / (MAX_SPEED - MIN_SPEED)
+    size = int(MAX_BRUSH_SIZE - (MAX_BRUSH_SIZE - MIN_BRUSH_SIZE) * ratio * sensitivity / 10)
+    return max(min(size, base), MIN_BRUSH_SIZE)
+
+
+def strokes(seconds, speed, stamped):
+    # Left to right strokes a second long, each sample where the pointer
+    # is when it is posted
+    end = time.perf_counter() + seconds
+    row = 0
+    while time.perf_counter() < end:
+        y = 40 + row * 40 % (HEIGHT - TOOLBAR_HEIGHT - 80)
+        row += 1
+        start = time.perf_counter()
+        event = press((40, y))
+        if stamped:
+            event.time = start
+        pygame.event.post(event)
+        last = (40, y)
+        while True:
+            time.sleep(1 / MOTION_HZ)
+            now = time.perf_counter()
+            pos = (40 + int(speed * (now - start)), y)
+            if pos[0] >= WIDTH - 40 or now >= end:
+                break
+            event = motion(pos, last)
+            if stamped:
+                event.time = now
+            pygame.event.post(event)
+            last = pos
+        event = release(last)
+        if stamped:
+            event.time = time.perf_counter()
+        pygame.event.post(event)
+
+
+def session(seconds, speed, stamped, lead):
+    journal_dir = tempfile.mkdtemp()
+    app = PaintApp(journal_path=os.path.join(journal_dir, 'canvas.journal'), scheduler='events', measure_latency=True)
+    app.pointer.lead = lead
+    set_slider(app.base_brush_slider, MAX_BRUSH_SIZE)
+    sizes = []
+    ticks = []  # (x, ticks at processing) of each sample, the old timing
+
+    queue_stroke_segment = app.queue_stroke_segment
+    move = app.pointer.move
+
+    def recorded_segment(start, end, size):
+        sizes.append(size)
+        queue_stroke_segment(start, end, size)
+
+    def recorded_move(pos, t):
+        ticks.append((pos[0], pygame.time.get_ticks()))
+        return move(pos, t)
+
+    app.queue_stroke_segment = recorded_segment
+    app.pointer.move = recorded_move
+
+    def feeder():
+        strokes(seconds, speed, stamped)
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    thread = threading.Thread(target=feeder, daemon=True)
+    # run() prints the latency report on exit, it is read from app.latency here
+    with contextlib.redirect_stdout(StringIO()):
+        thread.start()
+        app.run()
+    thread.join()
+    os.rmdir(journal_dir)
+
+    # The same samples sized as before, from the distance and the ticks
+    # between two samples handled
+    old = []
+    for (x0, t0), (x1, t1) in zip(ticks, ticks[1:]):
+        if x1 > x0:
+            old.append(brush_size((x1 - x0) / (t1 - t0) * 1000 if t1 > t0 else MAX_SPEED, MAX_BRUSH_SIZE, 10))
+    return sizes, old, app.latency
+
+
+def check_idle():
+    # A stroke that stops with the button held, the app sleeping in
+    # pygame.event.wait(): the predicted ink must be gone before it moves on
+    journal_dir = tempfile.mkdtemp()
+    app = PaintApp(journal_path=os.path.join(journal_dir, 'canvas.journal'), scheduler='events')
+    moving = []  # app.predict_rect as the stroke goes on
+    stopped = []
+
+    def feeder():
+        pygame.event.post(press((40, 200)))
+        last = (40, 200)
+        for x in range(42, 400, 2):
+            time.sleep(1 / MOTION_HZ)
+            pygame.event.post(motion((x, 200), last))
+            last = (x, 200)
+            moving.append(app.predict_rect)
+        time.sleep(PREDICT_INK_IDLE_MS / 1000 * 3)
+        stopped.append(app.predict_rect)
+        pygame.event.post(release(last))
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    thread = threading.Thread(target=feeder, daemon=True)
+    with contextlib.redirect_stdout(StringIO()):
+        thread.start()
+        app.run()
+    thread.join()
+    os.rmdir(journal_dir)
+    assert any(rect is not None for rect in moving), "no predicted ink drawn while moving"
+    assert stopped[0] is None, "predicted ink stayed on screen after the pointer stopped"
+    print(f"predicted ink taken away {PREDICT_INK_IDLE_MS} ms after the pointer stopped with the button held")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="brush size steadiness and input to display latency")
+    parser.add_argument('--speed', type=float, default=400, help="stroke speed in window pixels per second")
+    parser.add_argument('--seconds', type=float, default=3.0, help="length of each session")
+    args = parser.parse_args()
+    check_idle()
+
+    expected = brush_size(args.speed, MAX_BRUSH_SIZE, 10)
+    print(f"strokes at {args.speed:.0f} px/s sampled at {MOTION_HZ} Hz, steady brush size {expected}")
+    print(f"{'timing':<30}{'size sd':>8}{'off by 3+ %':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'end ms':>9}")
+
+    def row(name, sizes, latency=None):
+        # end is how far behind the pointer the stroke ends at p50,
+        # negative when the predicted ink is ahead of it
+        sizes = np.array(sizes)
+        line = f"{name:<30}{sizes.std():>8.2f}{np.mean(np.abs(sizes - expected) >= 3) * 100:>12.1f}"
+        if latency is not None:
+            p50, p95, p99 = latency.percentiles()
+            line += f"{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{p50 - latency.lead * 1000:>9.2f}"
+        print(line)
+
+    sizes, old, _ = session(args.seconds, args.speed, False, 0)
+    row("processing ticks (before)", old)
+    row("arrival stamps", sizes)
+    for lead in (0, PREDICT_INK_MS / 1000):
+        sizes, _, latency = session(args.seconds, args.speed, True, lead)
+        row(f"posting time, {lead * 1000:.0f} ms prediction", sizes, latency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_profiler.py
+#
+# Shows what the profiler's timing scopes cost with profiling off and on,
+# per scope and on the frame times of the harness scenarios, and checks
+# the Chrome trace export of a profiled run.
+#
+#   python benchmarks/bench_profiler.py
+
+import os
+import sys
+import json
+import timeit
+import tempfile
+import contextlib
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from utils_updated.profiler import Profiler
+from harness import SCENARIOS, play
+
+REPEAT = 3  # Runs of every scenario, the fastest is reported
+
+
+def scope_cost():
+    profiler = Profiler()
+
+    def scoped():
+        with profiler.scope('scope'):
+            pass
+
+    def bare():
+        pass
+
+    number = 200000
+    costs = {}
+    for name, enabled, func in (('none', False, bare), ('off', False, scoped), ('on', True, scoped)):
+        profiler.set_enabled(enabled)
+        costs[name] = min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+        profiler.end_frame()
+    return costs
+
+
+def profiled(scenario, apps):
+    # The scenario with the app's profiler on, the app kept for its trace
+    def run(app, rng):
+        app.profiler.set_enabled(True)
+        apps.append(app)
+        return scenario(app, rng)
+    return run
+
+
+def main():
+    costs = scope_cost()
+    print(f"a scope costs {costs['off'] - costs['none']:.0f} ns with profiling off, "
+          f"{costs['on'] - costs['none']:.0f} ns on")
+
+    print(f"{'scenario':<24}{'off p50 ms':>12}{'on p50 ms':>11}{'change':>9}")
+    apps = []
+    for name, scenario in SCENARIOS.items():
+        with contextlib.redirect_stderr(open(os.devnull, 'w')):
+            off = min(np.median(play(scenario, 0)[0]) for _ in range(REPEAT))
+            on = min(np.median(play(profiled(scenario, apps), 0)[0]) for _ in range(REPEAT))
+        print(f"{name:<24}{off * 1000:>12.3f}{on * 1000:>11.3f}{(on - off) / off * 100:>+8.1f}%")
+
+    # Every scope of the last profiled run is in the trace
+    profiler = apps[-1].profiler
+    path = os.path.join(tempfile.mkdtemp(), 'trace.json')
+    count = profiler.save_trace(path)
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    assert len(events) == count == sum(len(spans) for spans in profiler.frames)
+    assert {event['ph'] for event in events} == {'X'}
+    assert {event['name'] for event in events} >= {'frame', 'events', 'render', 'display'}
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+    print(f"trace export holds all {count} spans of {len(profiler.frames)} frames")
+    per_frame = count / len(profiler.frames) - 1  # The 'frame' span isn't a scope
+    print(f"{per_frame:.1f} scopes a frame, {per_frame * (costs['off'] - costs['none']) / 1000:.2f} us "
+          f"a frame with profiling off")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/bench_project.py
+#
+# Saves a 16k x 16k tiled document with strokes spread over it, then
+# times opening it again, drawing the first view (which loads only the
+# tiles in view), and an incremental save after a single stroke. Checks
+# that the reopened document matches the saved one tile for tile. Then
+# opens a layered document, adds a layer and saves it again, which
+# rewrites every tile while most of them are still on disk, and checks
+# that it reopens with the same layers.
+#
+#   python benchmarks/bench_project.py
+
+import os
+import sys
+import random
+import tempfile
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pygame
+from utils_updated.settings import *
+from utils_updated.tiled_grid import TiledGrid
+from utils_updated.layers import LayerStack
+from utils_updated.project import Project, TileRef
+from utils_updated.renderer import ViewportRenderer
+from utils_updated.viewport import Viewport
+
+COLORS = [BLACK, RED, GREEN, BLUE, ORANGE, PURPLE, YELLOW, CYAN, PINK, BROWN]
+SIZE = 16384
+LAYERED_SIZE = 4096
+
+
+def paint(grid, rng, strokes, size=SIZE):
+    extent = size * PIXEL_SIZE
+    for _ in range(strokes):
+        pos = (rng.randrange(extent), rng.randrange(extent))
+        points = [pos]
+        for _ in range(rng.randint(3, 15)):
+            pos = (pos[0] + rng.randint(-400, 400), pos[1] + rng.randint(-400, 400))
+            points.append(pos)
+        grid.set_cell_color_polyline(points, rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE), rng.choice(COLORS))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    pygame.init()
+    win = pygame.display.set_mode((WIDTH, HEIGHT))
+    path = os.path.join(tempfile.mkdtemp(), 'poster.paintproj')
+    grid = TiledGrid(SIZE, SIZE, BG_COLOR)
+    paint(grid, random.Random(1), 2000)
+    print(f"document: {SIZE}x{SIZE} cells, {len(grid.grid)} painted tiles")
+
+    project = Project(path, SIZE, SIZE, BG_COLOR)
+    written, ms = timed(lambda: project.save(grid))
+    print(f"full save:         {ms:9.1f} ms  {written} tiles, {os.path.getsize(path) / 2 ** 20:.1f} MB")
+    project.close()
+
+    opened, ms = timed(lambda: Project.open(path))
+    print(f"open:              {ms:9.1f} ms  index of {len(opened.index)} tiles")
+    reopened = TiledGrid(SIZE, SIZE, BG_COLOR)
+    _, ms = timed(lambda: opened.load_into(reopened))
+    print(f"load into grid:    {ms:9.1f} ms")
+
+    viewport = Viewport(SIZE, SIZE, WIDTH, HEIGHT - TOOLBAR_HEIGHT)
+    viewport.x = viewport.y = SIZE / 2
+    renderer = ViewportRenderer(reopened, viewport)
+    _, ms = timed(lambda: renderer.draw(win))
+    loaded = sum(not isinstance(tile, TileRef) for tile in reopened.grid.values())
+    print(f"first view:        {ms:9.1f} ms  {loaded} of {len(reopened.grid)} tiles loaded")
+
+    size = os.path.getsize(path)
+    reopened.set_cell_color_polyline([(SIZE * 2, SIZE * 2), (SIZE * 2 + 300, SIZE * 2 + 200)], 10, RED)
+    written, ms = timed(lambda: opened.save())
+    print(f"incremental save:  {ms:9.1f} ms  {written} tiles, {os.path.getsize(path) - size} bytes appended")
+
+    # The saved file against the document that was written
+    grid.set_cell_color_polyline([(SIZE * 2, SIZE * 2), (SIZE * 2 + 300, SIZE * 2 + 200)], 10, RED)
+    opened.close()
+    check = TiledGrid(SIZE, SIZE, BG_COLOR)
+    Project.open(path).load_into(check)
+    for key in set(grid.grid) | set(check.grid):
+        rect = grid.tile_rect(key)
+        assert np.array_equal(grid.read_region(*rect), check.read_region(*rect)), key
+    print("reopened document matches")
+    layer_count_change(os.path.join(os.path.dirname(path), 'layers.paintproj'))
+    pygame.quit()
+
+
+def layer_count_change(path):
+    # Open a layered project, add a layer and save: the channels of every
+    # tile change, including the ones never loaded from the file
+    size = LAYERED_SIZE
+    stack = LayerStack(size, size, BG_COLOR, 'tiled')
+    paint(stack, random.Random(2), 300, size)
+    Project(path, size, size, stack.color).save(stack)
+
+    opened = Project.open(path)
+    reopened = LayerStack(size, size, BG_COLOR, 'tiled')
+    opened.load_into(reopened)
+    reopened.add_layer()
+    paint(reopened, random.Random(3), 20, size)
+    on_disk = sum(isinstance(tile, TileRef) for grid in reopened.grids() for tile in grid.grid.values())
+    written, ms = timed(lambda: opened.save())
+    print(f"save, layer added: {ms:9.1f} ms  {written} tiles, {on_disk} of them still on disk")
+    opened.close()
+
+    check = LayerStack(size, size, BG_COLOR, 'tiled')
+    project = Project.open(path)
+    project.load_into(check)
+    assert check.layer_state() == reopened.layer_state()
+    for grid, check_grid in zip(reopened.grids(), check.grids()):
+        for key in set(grid.grid) | set(check_grid.grid):
+            rect = grid.tile_rect(key)
+            assert np.array_equal(grid.read_region(*rect), check_grid.read_region(*rect)), key
+    project.close()
+    print("reopened layered document matches")
+
+
+if __name__ == "__main__":
+    main()
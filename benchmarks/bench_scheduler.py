@@ -0,0 +1,117 @@
+# benchmarks/bench_scheduler.py
+#
+# Runs PaintApp.run() headless with each scheduler while a thread posts
+# input to it, like a window system would. Reports the CPU time the app's
+# thread uses while idle and while strokes are drawn, the frames drawn, and
+# the latency from posting a motion event to the end of the frame that
+# drew it.
+#
+#   python benchmarks/bench_scheduler.py
+#   python benchmarks/bench_scheduler.py --backend tiled --seconds 5
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pygame
+from utils_updated.settings import *
+from utils_updated.canvas import GRID_BACKENDS
+from main_app import PaintApp
+from harness import press, release, motion, scribble
+
+MOTION_HZ = 1000  # A gaming mouse, office mice report at 125 Hz
+
+
+def idle(seconds, rng):
+    # Nothing happens until the window is closed
+    time.sleep(seconds)
+
+
+def strokes(seconds, rng):
+    # Strokes of a second each, motion events posted at MOTION_HZ
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        points = scribble(rng, MOTION_HZ, 2)
+        pygame.event.post(press(points[0]))
+        last = points[0]
+        for pos in points[1:]:
+            time.sleep(1 / MOTION_HZ)
+            event = motion(pos, last)
+            event.sent = time.perf_counter()
+            pygame.event.post(event)
+            last = pos
+        pygame.event.post(release(last))
+
+
+def session(scheduler, feed, seconds, backend):
+    journal_dir = tempfile.mkdtemp()
+    app = PaintApp(journal_path=os.path.join(journal_dir, 'canvas.journal'), backend=backend, scheduler=scheduler)
+    latencies = []
+    pending = []
+    frames = 0
+
+    # Timestamps of the motion events a frame handles, resolved once it's drawn
+    handle_events = app.handle_events
+    draw = app.draw
+
+    def timed_handle_events(events=None):
+        events = pygame.event.get() if events is None else events
+        pending.extend(event.sent for event in events if hasattr(event, 'sent'))
+        handle_events(events)
+
+    def timed_draw():
+        nonlocal frames
+        draw()
+        frames += 1
+        now = time.perf_counter()
+        latencies.extend(now - sent for sent in pending)
+        pending.clear()
+
+    app.handle_events = timed_handle_events
+    app.draw = timed_draw
+
+    def feeder():
+        feed(seconds, random.Random(0))
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    # run() ends with pygame.quit(), the app's own clean-up runs too
+    thread = threading.Thread(target=feeder, daemon=True)
+    with contextlib.redirect_stdout(sys.stderr):
+        start_cpu, start = time.thread_time(), time.perf_counter()
+        thread.start()
+        app.run()
+        cpu, wall = time.thread_time() - start_cpu, time.perf_counter() - start
+    thread.join()
+    os.rmdir(journal_dir)
+    return cpu / wall * 100, frames / wall, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PaintApp idle CPU and input latency per scheduler")
+    parser.add_argument('--backend', default=GRID_BACKEND, choices=sorted(GRID_BACKENDS))
+    parser.add_argument('--seconds', type=float, default=3.0, help="length of each session")
+    args = parser.parse_args()
+
+    print(f"{'scheduler':<11}{'idle cpu %':>11}{'idle fps':>10}{'stroke cpu %':>14}{'stroke fps':>12}"
+          f"{'latency p50 ms':>16}{'p99 ms':>9}")
+    for scheduler in ('poll', 'events'):
+        idle_cpu, idle_fps, _ = session(scheduler, idle, args.seconds, args.backend)
+        stroke_cpu, stroke_fps, latencies = session(scheduler, strokes, args.seconds, args.backend)
+        ms = np.array(latencies) * 1000
+        print(f"{scheduler:<11}{idle_cpu:>11.1f}{idle_fps:>10.1f}{stroke_cpu:>14.1f}{stroke_fps:>12.1f}"
+              f"{np.percentile(ms, 50):>16.3f}{np.percentile(ms, 99):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/bench_selection.py
+#
+# Selects a large painted block in the app, drags it across the view and
+# reports the frame times against the FPS budget, then the time of the
+# commit and of undoing it. Checks that the layer doesn't change while
+# the block floats, that the commit puts it where it was dropped and one
+# undo takes it back, that the clipboard holds only the selected cells
+# and that pasting it doesn't copy them.
+#
+#   python benchmarks/bench_selection.py
+#   python benchmarks/bench_selection.py --backend array --size 100
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pygame
+from utils_updated.settings import *
+from utils_updated.canvas import GRID_BACKENDS
+from main_app import PaintApp
+
+
+def window_pos(app, row, col):
+    # Middle of a cell in the window
+    document = app.viewport.document_rect()
+    zoom = app.viewport.zoom
+    return document.x + col * zoom + zoom // 2, document.y + row * zoom + zoom // 2
+
+
+def mouse(app, kind, row, col):
+    pos = window_pos(app, row, col)
+    if kind == pygame.MOUSEMOTION:
+        return pygame.event.Event(kind, pos=pos, rel=(0, 0), buttons=(1, 0, 0))
+    return pygame.event.Event(kind, pos=pos, button=1)
+
+
+def frame(app, events):
+    start = time.perf_counter()
+    app.handle_events(events)
+    app.draw()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="frame time while moving a selection")
+    parser.add_argument('--backend', choices=GRID_BACKENDS, default='tiled')
+    parser.add_argument('--size', type=int, default=400, help="rows and columns of the selection")
+    parser.add_argument('--frames', type=int, default=120)
+    args = parser.parse_args()
+    size = args.size
+
+    journal_dir = tempfile.mkdtemp()
+    app = PaintApp(journal_path=os.path.join(journal_dir, 'canvas.journal'), backend=args.backend, scheduler='events')
+    if app.viewport.movable:
+        # Far enough out to see the whole block and where it goes
+        app.viewport.zoom = 1
+        app.viewport.clamp()
+    rows, cols = app.grid.rows, app.grid.cols
+    size = min(size, rows // 2, cols // 2)
+    rng = np.random.default_rng(0)
+    grid = app.grid.active_grid()
+    block = np.zeros((size, size, 4), dtype=np.uint8)
+    block[..., :3] = rng.integers(0, 256, (size, size, 1), dtype=np.uint8)[..., [0, 0, 0]] // 2  # Dark noise
+    block[..., 3] = 255
+    block[size // 4:size // 2] = (255, 0, 0, 255)  # A band of one colour
+    grid.write_region(0, 0, block)
+    app.history.commit()
+    before = np.array(grid.read_region(0, 0, 2 * size, 2 * size))
+
+    # Drag out the selection, then pick it up and carry it down and right
+    app.current_tool = 'select'
+    frame(app, [mouse(app, pygame.MOUSEBUTTONDOWN, 0, 0), mouse(app, pygame.MOUSEMOTION, size - 1, size - 1),
+                mouse(app, pygame.MOUSEBUTTONUP, size - 1, size - 1)])
+    assert app.selection.rect == (0, 0, size, size)
+    frame(app, [mouse(app, pygame.MOUSEBUTTONDOWN, 0, 0)])
+    times = []
+    for i in range(1, args.frames + 1):
+        step = size * i // args.frames
+        times.append(frame(app, [mouse(app, pygame.MOUSEMOTION, step, step)]))
+    frame(app, [mouse(app, pygame.MOUSEBUTTONUP, size, size)])
+    assert np.array_equal(grid.read_region(0, 0, 2 * size, 2 * size), before), "the layer changed while moving"
+
+    times.sort()
+    budget = 1000 / FPS
+    median, p95 = times[len(times) // 2] * 1000, times[len(times) * 95 // 100] * 1000
+    print(f"{args.backend} backend, {size} x {size} selection, zoom {app.viewport.zoom}")
+    print(f"frame while moving: median {median:.2f} ms, p95 {p95:.2f} ms, budget {budget:.1f} ms at {FPS} FPS")
+
+    start = time.perf_counter()
+    app.commit_selection()
+    committed = time.perf_counter() - start
+    expected = np.zeros_like(before)
+    expected[size:, size:] = block
+    assert np.array_equal(grid.read_region(0, 0, 2 * size, 2 * size), expected), "commit"
+    start = time.perf_counter()
+    app.undo()
+    undone = time.perf_counter() - start
+    assert np.array_equal(grid.read_region(0, 0, 2 * size, 2 * size), before), "undo"
+    print(f"commit (undo step included) {committed * 1000:.1f} ms, undo {undone * 1000:.1f} ms")
+
+    # Copying keeps the selected cells only, pasting shares them
+    app.selection.select((0, 0), (size - 1, size - 1))
+    app.copy_selection()
+    assert app.clipboard.nbytes <= size * size * 4, "clipboard bigger than the selection"
+    app.paste()
+    assert np.shares_memory(app.selection.floating, app.clipboard), "paste copied the clipboard"
+    app.selection.cancel()
+    assert np.array_equal(grid.read_region(0, 0, 2 * size, 2 * size), before), "cancelled paste"
+    print(f"clipboard {app.clipboard.nbytes} bytes for {size * size} cells, pasted without a copy")
+
+    app.journal.close(discard=True)
+    app.saver.close()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
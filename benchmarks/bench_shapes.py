@@ -0,0 +1,129 @@
+# benchmarks/bench_shapes.py
+#
+# Drags a line, a rectangle and an ellipse out to cover the whole view in
+# the app and reports the frame times against the FPS budget, next to a
+# preview that puts the canvas back from a snapshot and paints the shape
+# into it on every motion event. Checks that the layer doesn't change
+# during the drag, that an ellipse comes out as the cells whose centres
+# are in its ring, or inside it when filled, and that one undo takes a
+# shape back out.
+#
+#   python benchmarks/bench_shapes.py
+#   python benchmarks/bench_shapes.py --backend tiled --frames 200
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pygame
+from utils_updated.settings import *
+from utils_updated.canvas import GRID_BACKENDS
+from utils_updated.shapes import shape_spans
+from main_app import PaintApp
+
+
+def motion(pos):
+    return pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(1, 0, 0))
+
+
+def button(kind, pos):
+    return pygame.event.Event(kind, pos=pos, button=1)
+
+
+def frame(app, events):
+    start = time.perf_counter()
+    app.handle_events(events)
+    app.draw()
+    return time.perf_counter() - start
+
+
+def ellipse_cells(start, end, brush_size, filled, rows, cols):
+    # The cells an ellipse should cover, tested one centre at a time
+    y = (np.arange(rows) * PIXEL_SIZE + PIXEL_SIZE // 2)[:, None]
+    x = (np.arange(cols) * PIXEL_SIZE + PIXEL_SIZE // 2)[None, :]
+    cx, cy = (start[0] + end[0]) / 2, (start[1] + end[1]) / 2
+    a, b = abs(end[0] - start[0]) / 2, abs(end[1] - start[1]) / 2
+    cells = ((x - cx) / (a + brush_size)) ** 2 + ((y - cy) / (b + brush_size)) ** 2 <= 1
+    if not filled and a > brush_size and b > brush_size:
+        # The hole is as wide as the inner ellipse on each row
+        width = (a - brush_size) * np.sqrt(np.clip(1 - ((y - cy) / (b - brush_size)) ** 2, 0, None))
+        inside = np.abs(y - cy) <= b - brush_size
+        cells &= ~(inside & (np.abs(x - cx) <= width))
+    return cells
+
+
+def main():
+    parser = argparse.ArgumentParser(description="frame time while dragging a shape")
+    parser.add_argument('--backend', choices=GRID_BACKENDS, default='array')
+    parser.add_argument('--frames', type=int, default=120)
+    args = parser.parse_args()
+
+    journal_dir = tempfile.mkdtemp()
+    app = PaintApp(journal_path=os.path.join(journal_dir, 'canvas.journal'), backend=args.backend, scheduler='events')
+    app.base_brush_size = 3
+    app.drawing_color = RED
+    frame(app, [])
+    row0, col0, row1, col1 = app.viewport.visible_cells()
+    grid = app.grid.active_grid()
+    before = np.array(grid.read_region(row0, col0, row1, col1))
+    corner = (2, 2)
+    far = (app.viewport.width - 3, app.viewport.height - 3)
+    budget = 1000 / FPS
+    print(f"{args.backend} backend, shapes dragged over {row1 - row0} x {col1 - col0} cells, "
+          f"budget {budget:.1f} ms at {FPS} FPS")
+    print(f"{'shape':<16}{'median ms':>10}{'p95 ms':>10}{'snapshot ms':>13}")
+
+    for shape, filled in (('line', False), ('rect', False), ('rect', True), ('ellipse', False), ('ellipse', True)):
+        app.current_tool = shape
+        app.shape_filled = filled
+        frame(app, [button(pygame.MOUSEBUTTONDOWN, corner)])
+        times = []
+        for i in range(1, args.frames + 1):
+            pos = (corner[0] + (far[0] - corner[0]) * i // args.frames, corner[1] + (far[1] - corner[1]) * i // args.frames)
+            times.append(frame(app, [motion(pos)]))
+        assert np.array_equal(grid.read_region(row0, col0, row1, col1), before), f"{shape} changed the layer while dragged"
+        start, end = app.shape_start, app.shape_end
+        frame(app, [button(pygame.MOUSEBUTTONUP, far)])
+
+        # Painting into the canvas instead, put back from a snapshot each time
+        snapshot = grid.read_region(row0, col0, row1, col1)
+        naive = []
+        for i in range(1, args.frames + 1):
+            pos = (corner[0] + (far[0] - corner[0]) * i // args.frames, corner[1] + (far[1] - corner[1]) * i // args.frames)
+            began = time.perf_counter()
+            grid.write_region(row0, col0, snapshot)
+            spans = shape_spans(shape, start, app.viewport.to_canvas(pos), app.base_brush_size, filled,
+                                app.grid.rows, app.grid.cols)
+            app.grid.fill_spans(*spans, app.drawing_color)
+            app.draw()
+            naive.append(time.perf_counter() - began)
+        grid.write_region(row0, col0, snapshot)
+
+        if shape == 'ellipse':
+            cells = grid.read_region(0, 0, app.grid.rows, app.grid.cols) if args.backend != 'tiled' else None
+            if cells is not None:
+                expected = ellipse_cells(start, end, app.base_brush_size, filled, app.grid.rows, app.grid.cols)
+                assert np.array_equal(cells[..., 3] > 0, expected), f"{shape} cells"
+        app.undo()
+        assert np.array_equal(grid.read_region(row0, col0, row1, col1), before), f"{shape} undo"
+        times.sort()
+        naive.sort()
+        name = f"{shape}{' filled' if filled else ''}"
+        print(f"{name:<16}{times[len(times) // 2] * 1000:>10.2f}{times[len(times) * 95 // 100] * 1000:>10.2f}"
+              f"{naive[len(naive) // 2] * 1000:>13.2f}")
+    print("the layer only changes on release, ellipses match the cell centre test, undo restores")
+
+    app.journal.close(discard=True)
+    app.saver.close()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/bench_startup.py
+#
+# Starts the app in fresh processes and reports the time from launching
+# Python to the end of the first frame, split into the interpreter, the
+# imports, setting up the app and the first frame. 'now' is the working
+# tree, the first run of it looking the font up and the others reading it
+# from the font cache. 'before' is the app as it was before its start up
+# was trimmed, checked out of git into a temporary directory (the first
+# commit of the repository can't start, it imports a package that isn't
+# there). The two take turns, so the machine's load hits both alike.
+#
+#   python benchmarks/bench_startup.py
+#   python benchmarks/bench_startup.py --runs 20 --before <commit>
+
+import io
+import os
+import sys
+import json
+import time
+import tarfile
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BEFORE = 'a208cfe'  # Last commit before the start up work
+
+# Run in the child, argv: launch time. Prints its phase times
+CHILD = """
+import sys, time, json
+started = time.perf_counter()
+launched = float(sys.argv[1])
+import main_app
+imported = time.perf_counter()
+app = main_app.PaintApp(journal_path='canvas.journal')
+created = time.perf_counter()
+app.handle_events([])
+app.draw()
+drawn = time.perf_counter()
+app.journal.close(discard=True)
+app.saver.close()
+print(json.dumps([started - launched, imported - started, created - imported, drawn - created]))
+"""
+
+PHASES = ('python', 'imports', 'app', 'first frame')
+
+
+def checkout(commit):
+    # A temporary directory holding the tree of commit
+    directory = tempfile.mkdtemp()
+    tree = subprocess.run(['git', 'archive', commit], cwd=ROOT, capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(tree)) as tar:
+        tar.extractall(directory)
+    return directory
+
+
+def start(root, directory):
+    # Phase times of one start of the app in root, in seconds. perf_counter
+    # is a system wide monotonic clock, the child's times can be taken from
+    # the parent's
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1', PYTHONPATH=root,
+               PYTHONWARNINGS='ignore')
+    launched = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD, repr(launched)],
+                            cwd=directory, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def report(name, runs):
+    runs = sorted(runs, key=sum)
+    median = runs[len(runs) // 2]
+    total = sum(median) * 1000
+    phases = ''.join(f"{phase * 1000:>13.1f}" for phase in median)
+    print(f"{name:<18}{phases}{total:>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time from launch to the app's first frame")
+    parser.add_argument('--runs', type=int, default=9, help="starts of each kind, the median is shown")
+    parser.add_argument('--before', default=BEFORE, help="commit to compare with (default: %(default)s)")
+    args = parser.parse_args()
+
+    before = checkout(args.before)
+    print(f"{'start, ms':<18}" + ''.join(f"{phase:>13}" for phase in PHASES) + f"{'total':>13}")
+    directory = tempfile.mkdtemp()
+    first = start(ROOT, directory)
+    assert os.path.exists(os.path.join(directory, 'cache', 'fonts.json')), "the font path wasn't cached"
+    report('now, first run', [first])
+    before_directory = tempfile.mkdtemp()
+    start(before, before_directory)  # Same footing, its first run is not counted either
+    now, then = [], []
+    for _ in range(args.runs):
+        now.append(start(ROOT, directory))
+        then.append(start(before, before_directory))
+    report('now', now)
+    report(f'before ({args.before})', then)
+
+
+if __name__ == "__main__":
+    main()
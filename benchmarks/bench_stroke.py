@@ -0,0 +1,123 @@
+# benchmarks/bench_stroke.py
+#
+# Cells written per stroke by the old stamped line (a full disk at
+# 2 * distance + 1 points per segment) against the capsule rasterizer,
+# per motion event and with a frame's events merged into one polyline.
+#
+# The app merges a frame's events, and that path has to beat stamping on
+# every stroke. A capsule per motion event does not: on slow strokes with
+# a small brush, where the stamped disks hardly overlap, its fixed cost
+# per call makes it slower than stamping (slow, brush 5).
+#
+#   python benchmarks/bench_stroke.py
+
+import os
+import sys
+import math
+import time
+
+REPEATS = 3  # Timings are the best of this many
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils_updated.settings import *
+from utils_updated.array_grid import ArrayGrid, get_disk_mask
+from utils_updated.stroke import capsule_spans
+
+
+def stamp_centers(pos1, pos2):
+    # Where the previous Grid.set_cell_color_line stamped its disks
+    x1, y1 = pos1
+    x2, y2 = pos2
+    dx = x2 - x1
+    dy = y2 - y1
+    distance = max(abs(dx), abs(dy))
+    steps = int(distance * 2) + 1
+    for i in range(steps):
+        t = i / steps if steps != 0 else 0
+        yield int(x1 + dx * t), int(y1 + dy * t)
+
+
+def stamped_line(grid, pos1, pos2, brush_size, color):
+    for center in stamp_centers(pos1, pos2):
+        grid.set_cell_color_circle(center, brush_size, color)
+
+
+def count_stamp(grid, center_pos, radius):
+    center_x, center_y = center_pos
+    mask = get_disk_mask(radius, center_x % PIXEL_SIZE, center_y % PIXEL_SIZE)
+    pix_radius = mask.shape[0] // 2
+    top = center_y // PIXEL_SIZE - pix_radius
+    left = center_x // PIXEL_SIZE - pix_radius
+    rows = slice(max(-top, 0), max(min(grid.rows - top, mask.shape[0]), 0))
+    cols = slice(max(-left, 0), max(min(grid.cols - left, mask.shape[1]), 0))
+    return int(mask[rows, cols].sum())
+
+
+def count_polyline(grid, points, brush_size):
+    # Cells set by ArrayGrid.set_cell_color_polyline, each counted once
+    before = grid.snapshot()
+    grid.set_cell_color_polyline(points, brush_size, (1, 2, 3))
+    written = int((grid.grid != before).any(axis=2).sum())
+    grid.restore(before)
+    return written
+
+
+def count_capsules(grid, points, brush_size):
+    written = 0
+    for pos1, pos2 in zip(points, points[1:]):
+        row0, lefts, rights = capsule_spans(pos1, pos2, brush_size, grid.rows, grid.cols)
+        written += int((rights - lefts).clip(0).sum())
+    return written
+
+
+def spiral_stroke(events, step):
+    # Fast circular scribble, `step` pixels between motion events
+    points = []
+    angle = 0.0
+    for i in range(events):
+        radius = 60 + i * 0.4
+        angle += step / radius
+        points.append((int(400 + radius * math.cos(angle)), int(250 + radius * math.sin(angle))))
+    return points
+
+
+def timed(func):
+    best = math.inf
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    print(f"{'stroke':<24}{'stamped cells':>15}{'capsule cells':>15}{'polyline cells':>16}"
+          f"{'stamped ms':>12}{'capsule ms':>12}{'polyline ms':>13}")
+    for name, step, brush_size in (
+        ('slow, brush 5', 4, 5),
+        ('fast, brush 5', 25, 5),
+        ('fast, brush 20', 25, 20),
+        ('very fast, brush 20', 60, 20),
+    ):
+        points = spiral_stroke(200, step)
+        grid = ArrayGrid(ROWS, COLS, BG_COLOR)
+
+        stamped = sum(
+            count_stamp(grid, center, brush_size) for a, b in zip(points, points[1:]) for center in stamp_centers(a, b)
+        )
+        capsules = count_capsules(grid, points, brush_size)
+        polyline = count_polyline(grid, points, brush_size)
+
+        stamped_ms = timed(lambda: [stamped_line(grid, a, b, brush_size, RED) for a, b in zip(points, points[1:])])
+        capsule_ms = timed(lambda: [grid.set_cell_color_line(a, b, brush_size, RED) for a, b in zip(points, points[1:])])
+        # Eight motion events per frame merged into one polyline
+        polyline_ms = timed(lambda: [
+            grid.set_cell_color_polyline(points[i:i + 9], brush_size, RED) for i in range(0, len(points) - 1, 8)
+        ])
+        print(f"{name:<24}{stamped:>15}{capsules:>15}{polyline:>16}"
+              f"{stamped_ms:>12.1f}{capsule_ms:>12.1f}{polyline_ms:>13.1f}")
+        assert polyline_ms < stamped_ms, f"{name}: merged capsules are slower than stamping"
+
+
+if __name__ == "__main__":
+    main()
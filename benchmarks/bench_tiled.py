@@ -0,0 +1,93 @@
+# benchmarks/bench_tiled.py
+#
+# Paints the same strokes into tiled documents of growing size and reports
+# the tiles and bytes they hold, the cost of a frame through the viewport
+# renderer, and a fill spreading over the untouched rest of the document.
+# Also checks the tiled grid against ArrayGrid cell for cell.
+#
+#   python benchmarks/bench_tiled.py
+
+import os
+import sys
+import random
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pygame
+from utils_updated.settings import *
+from utils_updated.array_grid import ArrayGrid
+from utils_updated.tiled_grid import TiledGrid
+from utils_updated.renderer import ViewportRenderer
+from utils_updated.viewport import Viewport
+
+COLORS = [BLACK, RED, GREEN, BLUE, ORANGE, PURPLE, YELLOW, CYAN, PINK, BROWN]
+
+
+def paint(grid, rng, strokes, width, height):
+    for _ in range(strokes):
+        pos = (rng.randrange(width), rng.randrange(height))
+        points = [pos]
+        for _ in range(rng.randint(3, 15)):
+            pos = (pos[0] + rng.randint(-40, 40), pos[1] + rng.randint(-40, 40))
+            points.append(pos)
+        grid.set_cell_color_polyline(points, rng.randint(MIN_BRUSH_SIZE, MAX_BRUSH_SIZE), rng.choice(COLORS))
+
+
+def check_parity():
+    rng = random.Random(2)
+    dense = ArrayGrid(ROWS, COLS, BG_COLOR)
+    tiled = TiledGrid(ROWS, COLS, BG_COLOR, tile_size=16)
+    for _ in range(200):
+        if rng.random() < 0.8:
+            seed = rng.random()
+            for grid in (dense, tiled):
+                paint(grid, random.Random(seed), 1, COLS * PIXEL_SIZE, ROWS * PIXEL_SIZE)
+        else:
+            pos = (rng.randrange(COLS * PIXEL_SIZE), rng.randrange(ROWS * PIXEL_SIZE))
+            color, connectivity = rng.choice(COLORS), rng.choice((4, 8))
+            assert dense.flood_fill(pos, color, 0, connectivity) == tiled.flood_fill(pos, color, 0, connectivity)
+        assert np.array_equal(dense.grid, tiled.read_region(0, 0, ROWS, COLS))
+    print("tiled grid matches ArrayGrid")
+
+
+def tile_bytes(grid):
+    return sum(tile.nbytes for tile in grid.grid.values() if isinstance(tile, np.ndarray))
+
+
+def frame_ms(viewport, renderer, win, frames=100):
+    # A frame pans by a few pixels, so the view keeps moving across tiles
+    start = time.perf_counter()
+    for i in range(frames):
+        viewport.pan(-7, -3)
+        renderer.draw(win)
+    return (time.perf_counter() - start) * 1000 / frames
+
+
+def main():
+    check_parity()
+    pygame.init()
+    win = pygame.display.set_mode((WIDTH, HEIGHT))
+    print(f"{'document':<14}{'tiles':>8}{'tile MB':>10}{'dense MB':>11}{'frame ms':>10}{'fill ms':>10}")
+    for size in (1024, 4096, 16384):
+        grid = TiledGrid(size, size, BG_COLOR)
+        # The same strokes in the top-left corner whatever the document size
+        paint(grid, random.Random(1), 300, 2000, 2000)
+        viewport = Viewport(size, size, WIDTH, HEIGHT - TOOLBAR_HEIGHT)
+        renderer = ViewportRenderer(grid, viewport)
+        ms = frame_ms(viewport, renderer, win)
+        tiles, nbytes = len(grid.grid), tile_bytes(grid)
+
+        start = time.perf_counter()
+        grid.flood_fill(((size - 1) * PIXEL_SIZE, (size - 1) * PIXEL_SIZE), GREY)
+        fill_ms = (time.perf_counter() - start) * 1000
+        print(f"{f'{size}x{size}':<14}{tiles:>8}{nbytes / 2 ** 20:>10.2f}{size * size * 3 / 2 ** 20:>11.1f}"
+              f"{ms:>10.3f}{fill_ms:>10.1f}")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+# benchmarks/harness.py
+#
+# Runs PaintApp headless (SDL dummy video driver) and feeds it synthetic
+# input through the real handle_events() and draw() path, one frame at a
+# time. Reports frame latency percentiles, events per second and peak
+# memory per scenario as JSON.
+#
+#   python benchmarks/harness.py                      # print JSON
+#   python benchmarks/harness.py -o baseline.json     # record a baseline
+#   python benchmarks/harness.py -b baseline.json     # compare against it
+#   python benchmarks/harness.py -s fills -s strokes_fast
+#   python benchmarks/harness.py --backend tiled     # 16k x 16k document
+#   python benchmarks/harness.py --scheduler poll    # full redraw every frame
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import platform
+import contextlib
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pygame
+from utils_updated.settings import *
+from utils_updated.canvas import GRID_BACKENDS
+from main_app import PaintApp
+
+CANVAS_WIDTH = COLS * PIXEL_SIZE
+CANVAS_HEIGHT = ROWS * PIXEL_SIZE
+
+
+# Event helpers -------------------------------------------------------------
+
+def press(pos):
+    return pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=pos)
+
+
+def release(pos):
+    return pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=pos)
+
+
+def motion(pos, last):
+    rel = (pos[0] - last[0], pos[1] - last[1])
+    return pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=rel, buttons=(1, 0, 0))
+
+
+def click_button(app, text):
+    for button in app.buttons:
+        if button.text == text:
+            center = (button.x + button.width // 2, button.y + button.height // 2)
+            return [press(center), release(center)]
+    raise KeyError(text)
+
+
+def click_color(app, index):
+    colors = [button for button in app.buttons if button.text is None]
+    button = colors[index % len(colors)]
+    center = (button.x + button.width // 2, button.y + button.height // 2)
+    return [press(center), release(center)]
+
+
+def stroke(points, per_frame):
+    # A press, the motion split into frames of `per_frame` events, a release
+    frames = [[press(points[0])]]
+    last = points[0]
+    for i in range(1, len(points), per_frame):
+        frame = []
+        for pos in points[i:i + per_frame]:
+            frame.append(motion(pos, last))
+            last = pos
+        frames.append(frame)
+    frames.append([release(last)])
+    return frames
+
+
+def scribble(rng, count, step):
+    # Random walk across the canvas, `step` pixels between samples
+    x, y = rng.randrange(CANVAS_WIDTH), rng.randrange(CANVAS_HEIGHT)
+    angle = rng.uniform(0, 2 * math.pi)
+    points = []
+    for _ in range(count):
+        angle += rng.uniform(-0.6, 0.6)
+        x = min(max(x + step * math.cos(angle), 0), CANVAS_WIDTH - 1)
+        y = min(max(y + step * math.sin(angle), 0), CANVAS_HEIGHT - 1)
+        points.append((int(x), int(y)))
+    return points
+
+
+def set_slider(slider, value):
+    slider.knob_x = slider.rect.x + (value - slider.min_val) / (slider.max_val - slider.min_val) * slider.rect.width
+    slider.update_value()
+
+
+# Scenarios -----------------------------------------------------------------
+# Each takes the app and a random generator and returns a list of frames,
+# every frame being the list of events delivered before that frame
+
+def strokes_slow(app, rng):
+    frames = []
+    for _ in range(20):
+        frames += stroke(scribble(rng, 60, 3), per_frame=1)
+    return frames
+
+
+def strokes_fast(app, rng):
+    frames = []
+    for _ in range(20):
+        frames += stroke(scribble(rng, 60, 25), per_frame=6)
+    return frames
+
+
+def large_brush_scribble(app, rng):
+    # Low sensitivity keeps the dynamic brush near the slider's maximum
+    set_slider(app.base_brush_slider, app.base_brush_slider.max_val)
+    set_slider(app.sensitivity_slider, app.sensitivity_slider.min_val)
+    frames = []
+    for _ in range(10):
+        frames += stroke(scribble(rng, 120, 12), per_frame=4)
+    return frames
+
+
+def fills(app, rng):
+    frames = [click_button(app, 'DRAW')]
+    # A few walls so the fills have regions to find
+    for _ in range(6):
+        frames += stroke(scribble(rng, 80, 20), per_frame=8)
+    frames.append(click_button(app, 'FILL'))
+    for i in range(60):
+        frames.append(click_color(app, i))
+        pos = (rng.randrange(CANVAS_WIDTH), rng.randrange(CANVAS_HEIGHT))
+        frames.append([press(pos), release(pos)])
+    return frames
+
+
+def undo_redo_storm(app, rng):
+    frames = []
+    for _ in range(40):
+        frames += stroke(scribble(rng, 30, 15), per_frame=5)
+    for _ in range(3):
+        frames += [click_button(app, 'UNDO') for _ in range(40)]
+        frames += [click_button(app, 'REDO') for _ in range(40)]
+    return frames
+
+
+def clear_new_cycles(app, rng):
+    frames = []
+    for i in range(30):
+        frames += stroke(scribble(rng, 30, 15), per_frame=5)
+        frames.append(click_button(app, 'CLEAR' if i % 2 else 'NEW'))
+    return frames
+
+
+SCENARIOS = {
+    'strokes_slow': strokes_slow,
+    'strokes_fast': strokes_fast,
+    'large_brush_scribble': large_brush_scribble,
+    'fills': fills,
+    'undo_redo_storm': undo_redo_storm,
+    'clear_new_cycles': clear_new_cycles,
+}
+
+
+# Running -------------------------------------------------------------------
+
+def play(scenario, seed, backend=GRID_BACKEND, scheduler=SCHEDULER):
+    # Returns per-frame latencies in seconds and the number of events sent
+    # Journalling stays on, it's part of the per-frame cost being measured
+    journal_dir = tempfile.mkdtemp()
+    app = PaintApp(journal_path=os.path.join(journal_dir, 'canvas.journal'), backend=backend, scheduler=scheduler)
+    frames = scenario(app, random.Random(seed))
+    latencies = []
+    events = 0
+    # The app prints things like "Nothing to undo.", keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        for frame in frames:
+            for event in frame:
+                pygame.event.post(event)
+            events += len(frame)
+            start = time.perf_counter()
+            app.handle_events()
+            app.draw()
+            latencies.append(time.perf_counter() - start)
+    app.journal.close(discard=True)
+    os.rmdir(journal_dir)
+    return latencies, events
+
+
+def percentiles(latencies):
+    ms = np.array(latencies) * 1000
+    return {
+        'mean': round(float(ms.mean()), 3),
+        'p50': round(float(np.percentile(ms, 50)), 3),
+        'p90': round(float(np.percentile(ms, 90)), 3),
+        'p99': round(float(np.percentile(ms, 99)), 3),
+        'max': round(float(ms.max()), 3),
+    }
+
+
+def run_scenario(name, seed, measure_memory, backend=GRID_BACKEND, scheduler=SCHEDULER):
+    scenario = SCENARIOS[name]
+    latencies, events = play(scenario, seed, backend, scheduler)
+    result = {
+        'frames': len(latencies),
+        'events': events,
+        'events_per_sec': round(events / sum(latencies), 1),
+        'frame_ms': percentiles(latencies),
+    }
+    if measure_memory:
+        # Replayed separately, tracing allocations would skew the timings
+        tracemalloc.start()
+        play(scenario, seed, backend, scheduler)
+        result['peak_traced_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+
+def compare(report, baseline):
+    # Prints the change of every scenario's p50 and p99 against the baseline
+    print(f"{'scenario':<24}{'p50 ms':>10}{'base':>10}{'change':>9}{'p99 ms':>10}{'base':>10}{'change':>9}",
+          file=sys.stderr)
+    for name, result in report['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        row = f"{name:<24}"
+        for key in ('p50', 'p99'):
+            now, then = result['frame_ms'][key], base['frame_ms'][key]
+            change = (now - then) / then * 100 if then else 0.0
+            row += f"{now:>10.3f}{then:>10.3f}{change:>+8.1f}%"
+        print(row, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless PaintApp benchmark")
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="scenario to run, may be repeated (default: all)")
+    parser.add_argument('-o', '--output', help="write the JSON report to this file")
+    parser.add_argument('-b', '--baseline', help="JSON report to compare against")
+    parser.add_argument('--backend', default=GRID_BACKEND, choices=sorted(GRID_BACKENDS),
+                        help="grid backend (default: GRID_BACKEND)")
+    parser.add_argument('--scheduler', default=SCHEDULER, choices=['events', 'poll'],
+                        help="how frames are drawn (default: SCHEDULER)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass")
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'grid_backend': args.backend,
+            'scheduler': args.scheduler,
+            'canvas': [DOCUMENT_ROWS, DOCUMENT_COLS] if args.backend == 'tiled' else [ROWS, COLS],
+            'seed': args.seed,
+        },
+        'scenarios': {},
+    }
+    for name in args.scenario or SCENARIOS:
+        report['scenarios'][name] = run_scenario(name, args.seed, not args.no_memory, args.backend, args.scheduler)
+    if resource is not None:
+        # Linux reports kilobytes, macOS bytes
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report['max_rss_kb'] = max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
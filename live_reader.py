@@ -0,0 +1,74 @@
+# live_reader.py
+#
+# Reference reader for the live canvas export (see utils_updated/live.py).
+# Start the app with LIVE_EXPORT = 'paint_live' in utils_updated/settings.py,
+# then follow what is drawn from another process. Only the cells a frame
+# changed are copied out of the shared block.
+#
+#   python live_reader.py paint_live
+#   python live_reader.py paint_live --seconds 30 --snapshot live.png
+
+import os
+import sys
+import time
+import argparse
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+from utils_updated.live import LiveCanvasReader
+from utils_updated.png import write_png
+
+
+def follow(reader, done, interval=0.002):
+    # Keeps a private copy of the mirror up to date until done() is true,
+    # polling every interval seconds. Returns (copy, frames, cells copied,
+    # torn reads retried)
+    copy = np.zeros_like(reader.cells)
+    frames = cells = torn = 0
+    while True:
+        finished = done()  # Before the last poll, so a frame published meanwhile is read
+        frame = reader.poll()
+        if frame is None:
+            if finished:
+                break
+            time.sleep(interval)
+            continue
+        sequence, rects = frame
+        for row0, col0, row1, col1 in rects:
+            copy[row0:row1, col0:col1] = reader.cells[row0:row1, col0:col1]
+            cells += (row1 - row0) * (col1 - col0)
+        if not reader.stable(sequence):
+            # Written over while copying, take everything on the next frame
+            torn += 1
+            reader.sequence = 0
+            continue
+        frames += 1
+    return copy, frames, cells, torn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow a painting through the live canvas export")
+    parser.add_argument('name', help="shared memory block name, LIVE_EXPORT in the app's settings")
+    parser.add_argument('--seconds', type=float, default=10, help="how long to follow it (default: 10)")
+    parser.add_argument('--snapshot', help="PNG to write the mirror to at the end, a pixel per cell")
+    args = parser.parse_args()
+
+    try:
+        reader = LiveCanvasReader(args.name)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error opening live canvas: {e}")
+        sys.exit(1)
+    print(f"{args.name}: {reader.rows} x {reader.cols} cells of a {reader.document_rows} x {reader.document_cols} document")
+    end = time.perf_counter() + args.seconds
+    copy, frames, cells, torn = follow(reader, lambda: time.perf_counter() >= end)
+    print(f"{frames / args.seconds:.1f} frames/s, {cells * 3 / args.seconds / 1e6:.2f} MB/s copied, "
+          f"{torn} torn reads retried, origin {tuple(reader.origin())}")
+    if args.snapshot:
+        write_png(args.snapshot, copy)
+        print(f"Wrote {args.snapshot}")
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,114 @@
 # main.py
 
-import pygame
 import os
+import sys
+import pygame
 import time
-from utils import *
-from utils.button import Button
-from utils.grid import Grid
-from utils.slider import Slider
+from utils_updated.settings import *
+from utils_updated.button import Button
+from utils_updated.renderer import CanvasRenderer, ViewportRenderer
+from utils_updated.history import History
+from utils_updated.journal import Journal
+from utils_updated.layers import LayerStack
+from utils_updated.pointer import Pointer, LatencyMeter
+from utils_updated.project import Project
+from utils_updated.profiler import Profiler, ProfilerOverlay
+from utils_updated.saver import BackgroundSaver, CanvasSnapshot, SAVE_FINISHED, SAVE_READ
+from utils_updated.selection import Selection, SelectionOverlay
+from utils_updated.shapes import SHAPES, shape_spans, draw_spans
+from utils_updated.slider import Slider
+from utils_updated.toolbar import Toolbar
+from utils_updated.viewport import Viewport
 
 class PaintApp:
-    def __init__(self):
-        pygame.init()
+    def __init__(self, journal_path=JOURNAL_PATH, backend=GRID_BACKEND, project_path=None, scheduler=SCHEDULER,
+                 live_export=LIVE_EXPORT, measure_latency=MEASURE_LATENCY):
+        # Only what the app uses, pygame.init() also starts audio and joysticks
+        pygame.display.init()
         pygame.font.init()
         self.win = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption("Paint App")
         self.clock = pygame.time.Clock()
-        self.grid = Grid(ROWS, COLS, BG_COLOR)
+        self.scheduler = scheduler
+        # The next frame draws the whole window, later ones only what changed
+        self.redraw_all = True
+        self.cursor_rect = None  # Where the brush size indicator was drawn
+        # Timing scopes around the work of a frame, F3 shows them
+        self.profiler = Profiler()
+        self.overlay = ProfilerOverlay(self.profiler)
+        self.overlay_rect = None
+        # Tools paint the active layer, the renderer shows the layers composited
+        if backend == 'tiled':
+            # A large document seen through a viewport that pans and zooms
+            self.grid = LayerStack(DOCUMENT_ROWS, DOCUMENT_COLS, BG_COLOR, backend)
+            self.viewport = Viewport(DOCUMENT_ROWS, DOCUMENT_COLS, WIDTH, HEIGHT - TOOLBAR_HEIGHT)
+            self.renderer = ViewportRenderer(self.grid.composite, self.viewport)
+        else:
+            self.grid = LayerStack(ROWS, COLS, BG_COLOR, backend)
+            self.viewport = Viewport(ROWS, COLS, WIDTH, HEIGHT - TOOLBAR_HEIGHT, movable=False)
+            self.renderer = CanvasRenderer(self.grid.composite)
+        # Other processes can map the canvas as it is drawn, see utils_updated/live.py
+        self.live = None
+        if live_export is not None:
+            from utils_updated.live import LiveCanvas  # Brings in multiprocessing, only when asked for
+            self.live = LiveCanvas(self.grid.composite, live_export, self.viewport)
         self.drawing_color = BLACK
         self.buttons = self.create_buttons()
         
         # Create sliders with dynamic layout
         self.create_sliders()
+        self.toolbar = Toolbar(self.buttons, [self.base_brush_slider, self.sensitivity_slider])
         
         self.base_brush_size = int(self.base_brush_slider.value)
         self.run_app = True
-        self.prev_pos = None
-        self.prev_time = None
+        self.prev_pos = None  # Filtered window position of the last pointer sample
         self.dragging = False
+        # Timestamps and smooths pointer samples, predicts where the stroke goes
+        self.pointer = Pointer()
+        self.dynamic_brush_size = None  # Brush size of the last stroke segment
+        self.predict_rect = None  # Where the predicted ink was drawn
+        # Input to display latency of strokes, printed on exit
+        self.latency = LatencyMeter() if measure_latency else None
+        self.panning = False  # Middle mouse button held
+        # Motion events of the current frame, painted together as one polyline
+        self.stroke_points = []
+        self.stroke_sizes = []
+        # Anti-aliased brush, B toggles it. The stroke being painted with it
+        self.soft_brush = SOFT_BRUSH
+        self.soft_stroke = None
+        # Rectangular selection on the active layer, and the cells last copied
+        self.selection = Selection(self.grid)
+        self.selection_overlay = SelectionOverlay(self.selection, self.viewport)
+        self.selection_rect = None  # Where the selection was drawn
+        self.select_anchor = None  # Cell a new selection is dragged out from
+        self.grab = None  # Cell of a floating selection the mouse holds, relative to its corner
+        self.clipboard = None
+        # The shape being dragged, as canvas pixel positions. It is only
+        # drawn over the canvas until the mouse is released
+        self.shape_start = None
+        self.shape_end = None
+        self.shape_filled = SHAPE_FILLED
+        self.shape_rect = None  # Where it was drawn
         
-        # Track the current tool: 'draw' or 'fill'
+        # Track the current tool: 'draw', 'fill', 'select' or one of SHAPES
         self.current_tool = 'draw'  # Default tool
         
-        # Initialize Undo and Redo stacks
-        self.undo_stack = []
-        self.redo_stack = []
+        # Replay whatever a crashed session left in the journal, then keep logging
+        self.journal = Journal(self.grid, journal_path)
+        recovered = self.journal.recover()
+        if recovered:
+            print("Recovered unsaved work from the last session.")
+        # The project file the document was opened from or saved to
+        self.project = self.journal.project
+
+        self.saver = BackgroundSaver(EXPORT_SCALE)
+
+        # Undo and Redo keep the changed tiles of each action, within HISTORY_BUDGET bytes
+        self.history = History(self.grid)
+
+        if project_path is not None and not recovered:
+            self.open_project(project_path)
+        self.update_caption()
 
     def create_buttons(self):
         button_size = 30  # Adjusted button size to fit within toolbar
@@ -71,7 +146,7 @@ class PaintApp:
         )
         buttons.extend([erase_button, clear_button])
 
-        # Add DRAW and FILL buttons
+        # Add DRAW, FILL and SELECT buttons
         draw_button = Button(
             start_x + (len(color_options) + 2) * (button_size + padding),
             button_y,
@@ -88,11 +163,20 @@ class PaintApp:
             GREY,
             'FILL'
         )
-        buttons.extend([draw_button, fill_button])
+        # SELECT picks a rect to copy, cut or move
+        select_button = Button(
+            start_x + (len(color_options) + 4) * (button_size + padding),
+            button_y,
+            button_size,
+            button_size,
+            GREY,
+            'SELECT'
+        )
+        buttons.extend([draw_button, fill_button, select_button])
 
         # Add UNDO and REDO buttons
         undo_button = Button(
-            start_x + (len(color_options) + 4) * (button_size + padding),
+            start_x + (len(color_options) + 5) * (button_size + padding),
             button_y,
             button_size,
             button_size,
@@ -100,7 +184,7 @@ class PaintApp:
             'UNDO'
         )
         redo_button = Button(
-            start_x + (len(color_options) + 5) * (button_size + padding),
+            start_x + (len(color_options) + 6) * (button_size + padding),
             button_y,
             button_size,
             button_size,
@@ -111,7 +195,7 @@ class PaintApp:
 
         # Add NEW and SAVE buttons
         new_button = Button(
-            start_x + (len(color_options) + 6) * (button_size + padding),
+            start_x + (len(color_options) + 7) * (button_size + padding),
             button_y,
             button_size,
             button_size,
@@ -119,7 +203,7 @@ class PaintApp:
             'NEW'
         )
         save_button = Button(
-            start_x + (len(color_options) + 7) * (button_size + padding),
+            start_x + (len(color_options) + 8) * (button_size + padding),
             button_y,
             button_size,
             button_size,
@@ -128,6 +212,24 @@ class PaintApp:
         )
         buttons.extend([new_button, save_button])
 
+        # Add the OPEN button, it brings back the newest saved image
+        open_button = Button(
+            start_x + (len(color_options) + 9) * (button_size + padding),
+            button_y,
+            button_size,
+            button_size,
+            GREY,
+            'OPEN'
+        )
+        buttons.append(open_button)
+
+        # Shape tools and whether they fill, in the upper row right of the sliders
+        shape_y = HEIGHT - TOOLBAR_HEIGHT + (TOOLBAR_HEIGHT // 2 - button_size) // 2
+        shape_spacing = 55  # Room for the longer labels
+        for idx, text in enumerate(['LINE', 'RECT', 'ELLIPSE', 'FILLED']):
+            x = WIDTH - (4 - idx) * shape_spacing
+            buttons.append(Button(x, shape_y, button_size, button_size, GREY, text))
+
         return buttons
 
     def create_sliders(self):
@@ -171,15 +273,55 @@ class PaintApp:
 
     def run(self):
         while self.run_app:
+            # Input arriving during a frame is handled together in the next
             self.clock.tick(FPS)
-            self.handle_events()
+            if self.scheduler == 'events':
+                # Sleep until there is something to handle, nothing changes
+                # meanwhile. Predicted ink on screen is taken away when the
+                # pointer stops, so then the sleep ends in time for that
+                timeout = PREDICT_INK_IDLE_MS + 1 if self.predict_rect is not None else 0
+                event = pygame.event.wait(timeout)
+                events = ([event] if event.type != pygame.NOEVENT else []) + pygame.event.get()
+            else:
+                events = pygame.event.get()
+            self.handle_events(events)
             self.draw()
+        self.journal.close(discard=True)  # Clean exit, nothing to recover
+        self.saver.close()  # Let a save in progress finish
+        if self.project is not None:
+            self.project.close()
+        if self.live is not None:
+            self.live.close()
+        if self.latency is not None:
+            print(self.latency.report())
         pygame.quit()
-
-    def handle_events(self):
-        for event in pygame.event.get():
+        clear_text_cache()
+
+    def handle_events(self, events=None):
+        # A frame is timed from here to the end of draw()
+        self.profiler.start_frame()
+        with self.profiler.scope('events'):
+            events = pygame.event.get() if events is None else events
+            self.pointer.stamp(events, time.perf_counter())
+            self.dispatch_events(events)
+
+    def dispatch_events(self, events):
+        for event in events:
             if event.type == pygame.QUIT:
                 self.run_app = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                # The window system lost what was on screen
+                self.redraw_all = True
+            elif event.type == SAVE_READ:
+                self.saver.serve()
+                continue
+            elif event.type == SAVE_FINISHED:
+                self.handle_save_finished(event)
+                continue
+            elif event.type == pygame.DROPFILE:
+                # A file dropped onto the window
+                self.open_file(event.file)
+                continue
 
             # Handle slider events
             self.base_brush_slider.handle_event(event)
@@ -208,62 +350,83 @@ class PaintApp:
                                 self.handle_button_click(button)
                                 break
                         self.prev_pos = None
-                        self.prev_time = None
                     else:
-                        if self.current_tool == 'fill':
+                        if self.current_tool == 'fill' and pygame.key.get_mods() & pygame.KMOD_SHIFT \
+                                and hasattr(self.grid.active_grid(), 'replace_color'):
+                            self.recolor(self.viewport.to_canvas(pos))
+                        elif self.current_tool == 'fill':
                             # Perform fill operation on mouse click
-                            self.save_state_to_undo()  # Save state before fill
-                            self.grid.flood_fill(pos, self.drawing_color)
-                            self.redo_stack.clear()  # Clear redo stack after new action
+                            pos = self.viewport.to_canvas(pos)
+                            with self.profiler.scope('fill'):
+                                self.grid.flood_fill(pos, self.drawing_color, FILL_TOLERANCE, FILL_CONNECTIVITY)
+                            with self.profiler.scope('history'):
+                                self.history.commit()  # Record the fill as one undo step
+                            self.journal.add_fill(pos, self.drawing_color, FILL_TOLERANCE, FILL_CONNECTIVITY)
+                        elif self.current_tool == 'select':
+                            self.press_selection(self.cell_at(pos))
+                        elif self.current_tool in SHAPES:
+                            self.shape_start = self.shape_end = self.viewport.to_canvas(pos)
                         elif self.current_tool == 'draw':
                             # Start drawing
                             self.dragging = True
-                            self.prev_pos = pos
-                            self.prev_time = pygame.time.get_ticks()
-                            self.save_state_to_undo()  # Save state before drawing
-                            self.redo_stack.clear()  # Clear redo stack after new action
+                            self.prev_pos = self.pointer.press(pos, event.time)
+                            self.dynamic_brush_size = None
+                elif event.button == 2 and event.pos[1] < HEIGHT - TOOLBAR_HEIGHT:
+                    self.panning = True
 
             elif event.type == pygame.MOUSEBUTTONUP:
-                if event.button == 1:
+                if event.button == 2:
+                    self.panning = False
+                elif event.button == 1:
                     if self.dragging and self.current_tool == 'draw':
                         self.dragging = False
+                        if self.dynamic_brush_size is not None \
+                                and self.viewport.to_canvas(self.prev_pos) != self.viewport.to_canvas(event.pos):
+                            # The smoothed stroke still ends where the button was let go
+                            self.queue_stroke_segment(self.prev_pos, event.pos, self.dynamic_brush_size)
                         self.prev_pos = None
-                        self.prev_time = None
+                        self.flush_stroke()
+                        with self.profiler.scope('history'):
+                            self.history.commit()  # The whole stroke is one undo step
+                        self.journal.commit()
+                    elif self.current_tool == 'select':
+                        self.release_selection()
+                    elif self.shape_start is not None:
+                        self.commit_shape()
+
+            elif event.type == pygame.MOUSEWHEEL:
+                self.viewport.zoom_at(pygame.mouse.get_pos(), event.y)
 
             elif event.type == pygame.MOUSEMOTION:
-                if self.dragging and self.current_tool == 'draw':
-                    pos = event.pos
-                    current_time = pygame.time.get_ticks()
-
-                    if self.prev_pos is not None and self.prev_time is not None:
-                        dx = pos[0] - self.prev_pos[0]
-                        dy = pos[1] - self.prev_pos[1]
-                        distance = (dx ** 2 + dy ** 2) ** 0.5
-                        time_delta = (current_time - self.prev_time) / 1000.0  # seconds
-
-                        if time_delta > 0:
-                            speed = distance / time_delta  # pixels per second
-                        else:
-                            speed = MAX_SPEED
-
-                        speed = max(MIN_SPEED, min(speed, MAX_SPEED))
-
-                        # Compute speed ratio (0 = high speed, 1 = low speed)
-                        speed_ratio = (speed - MIN_SPEED) / (MAX_SPEED - MIN_SPEED)  # 0 to 1
-                        speed_ratio = min(max(speed_ratio, 0), 1)  # Clamp between 0 and 1
-
-                        # Inverse mapping: high speed -> low brush size, low speed -> high brush size
-                        dynamic_brush_size = int(
-                            MAX_BRUSH_SIZE - (MAX_BRUSH_SIZE - MIN_BRUSH_SIZE) * speed_ratio * sensitivity_factor
-                        )
-                        dynamic_brush_size = min(dynamic_brush_size, self.base_brush_size)
-                        dynamic_brush_size = max(dynamic_brush_size, MIN_BRUSH_SIZE)
+                if self.panning:
+                    self.viewport.pan(*event.rel)
+                elif self.current_tool == 'select' and event.buttons[0]:
+                    self.drag_selection(self.cell_at(event.pos))
+                elif self.shape_start is not None:
+                    self.shape_end = self.viewport.to_canvas(event.pos)
+                elif self.dragging and self.current_tool == 'draw':
+                    # Smoothed position and speed, timed when the sample arrived
+                    pos, speed = self.pointer.move(event.pos, event.time)
+                    speed = max(MIN_SPEED, min(speed, MAX_SPEED))
+
+                    # Compute speed ratio (0 = high speed, 1 = low speed)
+                    speed_ratio = (speed - MIN_SPEED) / (MAX_SPEED - MIN_SPEED)  # 0 to 1
+                    speed_ratio = min(max(speed_ratio, 0), 1)  # Clamp between 0 and 1
+
+                    # Inverse mapping: high speed -> low brush size, low speed -> high brush size
+                    dynamic_brush_size = int(
+                        MAX_BRUSH_SIZE - (MAX_BRUSH_SIZE - MIN_BRUSH_SIZE) * speed_ratio * sensitivity_factor
+                    )
+                    dynamic_brush_size = min(dynamic_brush_size, self.base_brush_size)
+                    dynamic_brush_size = max(dynamic_brush_size, MIN_BRUSH_SIZE)
 
-                        # Draw line with dynamic brush size
-                        self.grid.set_cell_color_line(self.prev_pos, pos, dynamic_brush_size, self.drawing_color)
+                    # Queue the segment, it is drawn with the rest of this frame's motion
+                    self.queue_stroke_segment(self.prev_pos, pos, dynamic_brush_size)
+                    if self.latency is not None:
+                        self.latency.add(event.time)
 
                     self.prev_pos = pos
-                    self.prev_time = current_time
+                    self.dynamic_brush_size = dynamic_brush_size
 
             elif event.type == pygame.KEYDOWN:
                 # Implement keyboard shortcuts
@@ -271,27 +434,210 @@ class PaintApp:
                     self.undo()
                 elif (event.key == pygame.K_y) and (pygame.key.get_mods() & pygame.KMOD_CTRL):
                     self.redo()
+                elif (event.key == pygame.K_s) and (pygame.key.get_mods() & pygame.KMOD_CTRL):
+                    self.save_project()
+                elif (event.key == pygame.K_o) and (pygame.key.get_mods() & pygame.KMOD_CTRL):
+                    self.open_project(self.project.path if self.project is not None else PROJECT_PATH)
+                elif (event.key == pygame.K_c) and (pygame.key.get_mods() & pygame.KMOD_CTRL):
+                    self.copy_selection()
+                elif (event.key == pygame.K_x) and (pygame.key.get_mods() & pygame.KMOD_CTRL):
+                    self.copy_selection()
+                    self.delete_selection()
+                elif (event.key == pygame.K_v) and (pygame.key.get_mods() & pygame.KMOD_CTRL):
+                    self.paste()
+                elif event.key == pygame.K_DELETE:
+                    self.delete_selection()
+                elif event.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+                    self.commit_selection()
+                elif event.key == pygame.K_ESCAPE:
+                    self.shape_start = None  # The shape being dragged is dropped
+                    self.selection.cancel()  # Moved cells go back, pasted ones are dropped
+                elif (event.key == pygame.K_l) and (pygame.key.get_mods() & pygame.KMOD_CTRL):
+                    if pygame.key.get_mods() & pygame.KMOD_SHIFT:
+                        self.remove_layer()
+                    else:
+                        self.add_layer()
+                elif (event.key == pygame.K_h) and (pygame.key.get_mods() & pygame.KMOD_CTRL):
+                    layer = self.grid.layers[self.grid.active]
+                    self.change_layer_state(self.grid.set_visible, self.grid.active, not layer.visible)
+                elif event.key in (pygame.K_LEFTBRACKET, pygame.K_RIGHTBRACKET):
+                    step = LAYER_OPACITY_STEP if event.key == pygame.K_RIGHTBRACKET else -LAYER_OPACITY_STEP
+                    opacity = round(self.grid.layers[self.grid.active].opacity + step, 2)
+                    self.change_layer_state(self.grid.set_opacity, self.grid.active, opacity)
+                elif event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+                    step = 1 if event.key == pygame.K_PAGEUP else -1
+                    self.change_layer_state(self.grid.set_active, self.grid.active + step)
+                elif event.key in PAN_KEYS:
+                    self.viewport.pan(*PAN_KEYS[event.key])
+                elif event.key in FILTER_KEYS:
+                    self.run_filter(FILTER_KEYS[event.key])
+                elif event.key == pygame.K_b:
+                    self.flush_stroke()
+                    self.soft_brush = not self.soft_brush
+                    self.update_caption()
+                elif event.key == pygame.K_F3:
+                    self.profiler.set_enabled(not self.profiler.enabled)
+                elif event.key == pygame.K_F4:
+                    self.save_trace()
+
+        self.flush_stroke(end=False)
+
+    def queue_stroke_segment(self, start, end, brush_size):
+        # start and end are window positions, the stroke is kept in canvas pixels
+        if not self.stroke_points:
+            self.stroke_points.append(self.viewport.to_canvas(start))
+        self.stroke_points.append(self.viewport.to_canvas(end))
+        self.stroke_sizes.append(brush_size)
+
+    def flush_stroke(self, end=True):
+        # Each cell covered by the queued segments is written once. Unless
+        # end is False the stroke is finished, later segments start another
+        if self.stroke_sizes:
+            # Blended colours would soon use up an indexed canvas's palette
+            soft = self.soft_brush and self.grid.backend != 'indexed'
+            with self.profiler.scope('stroke'):
+                if soft:
+                    if self.soft_stroke is None:
+                        self.soft_stroke = self.grid.soft_stroke(self.drawing_color)
+                    self.soft_stroke.add(self.stroke_points, self.stroke_sizes)
+                else:
+                    self.grid.set_cell_color_polyline(self.stroke_points, self.stroke_sizes, self.drawing_color)
+            self.journal.add_stroke(self.stroke_points, self.stroke_sizes, self.drawing_color, soft)
+            self.stroke_points = []
+            self.stroke_sizes = []
+        if end and self.soft_stroke is not None:
+            self.soft_stroke = None
+            self.journal.commit()  # So it is replayed as the stroke it was
+
+    def cell_at(self, pos):
+        # (row, col) of the cell under a window position, maybe off the canvas
+        x, y = self.viewport.to_canvas(pos)
+        return y // PIXEL_SIZE, x // PIXEL_SIZE
+
+    def press_selection(self, cell):
+        # Pressing inside the selection picks its cells up to move them,
+        # anywhere else starts a new selection
+        selection = self.selection
+        if selection.floating is not None and not selection.contains(*cell):
+            self.commit_selection()  # Put down where they were moved to
+        if selection.contains(*cell):
+            if selection.floating is None:
+                selection.lift()
+            self.grab = (cell[0] - selection.rect[0], cell[1] - selection.rect[1])
+        else:
+            selection.clear()
+            self.select_anchor = cell
+
+    def drag_selection(self, cell):
+        if self.grab is not None:
+            # Only the overlay moves, the layer is written on commit
+            self.selection.move_to(cell[0] - self.grab[0], cell[1] - self.grab[1])
+        elif self.select_anchor is not None:
+            self.selection.select(self.select_anchor, cell)
+
+    def release_selection(self):
+        selection = self.selection
+        if self.grab is not None and selection.rect == selection.source:
+            selection.cancel()  # Picked up and put back down in place
+        self.grab = None
+        self.select_anchor = None
+
+    def copy_selection(self):
+        # Only the selected cells are kept, a tiled layer may share them
+        cells = self.selection.copy()
+        if cells is not None:
+            self.clipboard = cells
+
+    def delete_selection(self):
+        # The selected cells become transparent, as one undo step. Pasted
+        # cells still floating are dropped
+        selection = self.selection
+        if selection.rect is None:
+            return
+        if selection.floating is None:
+            selection.lift()
+        self.commit_selection(place=False)
+
+    def paste(self):
+        # The clipboard floats at the selection's corner, or the view's,
+        # until it is committed
+        if self.clipboard is None:
+            return
+        self.finish_edits()
+        if self.selection.rect is not None:
+            row, col = self.selection.rect[:2]
+        else:
+            row, col = self.viewport.visible_cells()[:2]
+        self.selection.paste(self.clipboard, row, col)
+        self.current_tool = 'select'
+
+    def commit_selection(self, place=True):
+        # Floating cells are written in a block per rect, as one undo step
+        with self.profiler.scope('selection'):
+            rects = self.selection.commit(place)
+        if rects:
+            with self.profiler.scope('history'):
+                self.history.commit()
+            self.journal.add_patch(rects)
+
+    def commit_shape(self):
+        # The shape goes into the active layer in one write, as one undo step
+        start, end = self.shape_start, self.shape_end
+        self.shape_start = self.shape_end = None
+        spans = shape_spans(self.current_tool, start, end, self.base_brush_size, self.shape_filled,
+                            self.grid.rows, self.grid.cols)
+        if spans is None:
+            return
+        with self.profiler.scope('stroke'):
+            self.grid.fill_spans(*spans, self.drawing_color)
+        with self.profiler.scope('history'):
+            self.history.commit()
+        self.journal.add_shape(self.current_tool, start, end, self.base_brush_size, self.shape_filled,
+                               self.drawing_color)
+
+    def finish_edits(self):
+        # Ends the stroke being painted and puts down floating cells,
+        # before anything else changes the canvas or the history
+        self.flush_stroke()
+        self.commit_selection()
 
     def handle_button_click(self, button):
+        if button.text in ('CLEAR', 'NEW', 'DRAW', 'FILL', 'LINE', 'RECT', 'ELLIPSE'):
+            self.finish_edits()
         if button.text == 'CLEAR':
             self.grid.clear()
-            # After clearing, save the state
-            self.save_state_to_undo()
-            self.redo_stack.clear()
+            self.history.commit()
+            self.journal.add_clear()
         elif button.text == 'ERASE':
-            self.drawing_color = BG_COLOR  # Set to background color for erasing
+            self.drawing_color = TRANSPARENT  # Erased cells show the layers below
         elif button.text == 'FILL':
             self.current_tool = 'fill'
         elif button.text == 'DRAW':
             self.current_tool = 'draw'
+        elif button.text == 'SELECT':
+            self.current_tool = 'select'
+        elif button.text in ('LINE', 'RECT', 'ELLIPSE'):
+            self.current_tool = button.text.lower()
+        elif button.text == 'FILLED':
+            self.shape_filled = not self.shape_filled
         elif button.text == 'NEW':
             self.grid.clear()  # Clear the canvas for a new image
+            self.selection.clear()
             self.current_tool = 'draw'  # Reset to draw tool
-            # Save state after clearing
-            self.save_state_to_undo()
-            self.redo_stack.clear()
+            self.history.commit()
+            self.journal.add_clear()
+            # Back to a single layer
+            state = (0, [(True, 1.0)])
+            if len(self.grid.layers) > 1:
+                self.change_layers(self.grid.set_layer_state, state)
+            else:
+                self.grid.set_layer_state(state)
+            self.journal.add_layer_state()
+            self.update_caption()
         elif button.text == 'SAVE':
             self.save_image()  # Call the save function
+        elif button.text == 'OPEN':
+            self.open_saved_image()
         elif button.text == 'UNDO':
             self.undo()  # Perform undo
         elif button.text == 'REDO':
@@ -299,129 +645,358 @@ class PaintApp:
         elif button.text is None:
             self.drawing_color = button.color
 
-    def save_state_to_undo(self):
-        if len(self.undo_stack) >= 10:
-            self.undo_stack.pop(0)  # Remove the oldest state to maintain a maximum of 10
-        # Deep copy of the grid
-        grid_copy = [row.copy() for row in self.grid.grid]
-        self.undo_stack.append(grid_copy)
+    def recolor(self, pos):
+        # Indexed canvas: every cell on the active layer with the clicked
+        # cell's colour takes the drawing colour, by changing the palette.
+        # Like the layer settings this is not an undo step
+        row, col = pos[1] // PIXEL_SIZE, pos[0] // PIXEL_SIZE
+        if not (0 <= row < self.grid.rows and 0 <= col < self.grid.cols):
+            return
+        grid = self.grid.active_grid()
+        with self.profiler.scope('fill'):
+            grid.replace_color(grid.get_cell_color(row, col), self.grid.layer_color(self.drawing_color))
+        # Merging into a colour already in the palette does move cells
+        self.history.commit()
+        self.journal.add_patch(self.grid.painted_rects())
+
+    def run_filter(self, name):
+        # Filters everything on the active layer, as one undo step
+        self.finish_edits()
+        from utils_updated.filters import apply_filter  # Not needed to start, imported on first use
+        try:
+            with self.profiler.scope('filter'):
+                rects = apply_filter(self.grid.active_grid(), name)
+        except ValueError as e:
+            # Blurs on an indexed layer, or a full palette
+            print(f"Filter not run: {e}")
+            return
+        if rects:
+            with self.profiler.scope('history'):
+                self.history.commit()
+            self.journal.add_patch(rects)
 
     def undo(self):
-        if not self.undo_stack:
+        self.finish_edits()
+        # Only the tiles changed by the last action are swapped back
+        with self.profiler.scope('history'):
+            rects = self.history.undo()
+        if not rects:
             print("Nothing to undo.")
-            return
-        # Save the current state to redo stack
-        if len(self.redo_stack) >= 10:
-            self.redo_stack.pop(0)  # Remove the oldest state to maintain a maximum of 10
-        current_state = [row.copy() for row in self.grid.grid]
-        self.redo_stack.append(current_state)
-        
-        # Restore the last state from undo stack
-        last_state = self.undo_stack.pop()
-        self.grid.grid = [row.copy() for row in last_state]
+        else:
+            self.journal.add_patch(rects)
 
     def redo(self):
-        if not self.redo_stack:
+        self.finish_edits()
+        with self.profiler.scope('history'):
+            rects = self.history.redo()
+        if not rects:
             print("Nothing to redo.")
+        else:
+            self.journal.add_patch(rects)
+
+    def add_layer(self):
+        if len(self.grid.layers) >= MAX_LAYERS:
+            print(f"A document can have at most {MAX_LAYERS} layers.")
             return
-        # Save the current state to undo stack
-        if len(self.undo_stack) >= 10:
-            self.undo_stack.pop(0)  # Remove the oldest state to maintain a maximum of 10
-        current_state = [row.copy() for row in self.grid.grid]
-        self.undo_stack.append(current_state)
-        
-        # Restore the last state from redo stack
-        last_state = self.redo_stack.pop()
-        self.grid.grid = [row.copy() for row in last_state]
+        index = self.grid.active + 1
+        self.change_layers(self.grid.add_layer, index)
+        self.journal.add_layer(index)
+
+    def remove_layer(self):
+        index = self.grid.active
+        self.change_layers(self.grid.remove_layer, index)
+        self.journal.add_layer_removal(index)
+
+    def change_layers(self, change, *args):
+        # Adding or removing layers changes what an undo step holds (the
+        # cells of every layer), so it can't be undone and ends the history
+        self.finish_edits()
+        self.history.recording = False
+        try:
+            change(*args)
+        finally:
+            self.history.recording = True
+        self.history.reset()
+        self.update_caption()
+
+    def change_layer_state(self, change, *args):
+        # Active layer, visibility and opacity, the cells stay as they are
+        self.finish_edits()
+        change(*args)
+        self.journal.add_layer_state()
+        self.update_caption()
+
+    def update_caption(self):
+        layer = self.grid.layers[self.grid.active]
+        caption = f"Paint App - Layer {self.grid.active + 1}/{len(self.grid.layers)}"
+        if not layer.visible:
+            caption += " (hidden)"
+        elif layer.opacity < 1:
+            caption += f" ({layer.opacity:.0%})"
+        if self.soft_brush and self.grid.backend != 'indexed':
+            caption += " - Soft brush"
+        pygame.display.set_caption(caption)
 
     def save_image(self):
-        # Create a directory for saved images if it doesn't exist
-        if not os.path.exists('saved_images'):
-            os.makedirs('saved_images')
-
         # Get the current time to create a unique filename
         timestamp = time.strftime("%Y%m%d-%H%M%S")
-        filename = f"saved_images/image_{timestamp}.png"
+        filename = f"saved_images/image_{timestamp}.{EXPORT_FORMAT}"
 
-        # Create a surface to draw the grid
-        save_surface = pygame.Surface((COLS * PIXEL_SIZE, ROWS * PIXEL_SIZE))
-        self.grid.draw(save_surface)
+        # The layers as they are shown. A tiled document is saved as far as it is painted
+        composite = self.grid.composite
+        bounds = composite.painted_bounds()
+        if bounds is None:
+            print("Nothing to save, the canvas is blank.")
+            return
 
-        # Save the surface as an image
+        # Nothing is copied here: the saver thread asks for the cells a band
+        # at a time (SAVE_READ), rows painted over meanwhile are kept as they were
+        if not self.saver.save(CanvasSnapshot(composite, *bounds), filename):
+            print("Previous save request replaced by the newer one.")
+
+    def save_project(self):
+        # Only the tiles changed since the last save are written
+        self.finish_edits()
+        if self.project is None:
+            self.project = Project(PROJECT_PATH, self.grid.rows, self.grid.cols, self.grid.color)
         try:
-            pygame.image.save(save_surface, filename)
-            print(f"Image saved as {filename}")
-        except Exception as e:
-            print(f"Error saving image: {e}")
+            written = self.project.save(self.grid)
+        except OSError as e:
+            print(f"Error saving project: {e}")
+            return
+        # The journal can now start over from the saved file
+        self.journal.rebase(self.project)
+        print(f"Project saved as {self.project.path} ({written} tiles written)")
 
-    def draw(self):
-        # Fill the entire window with UI_BG_COLOR (dark grey)
-        self.win.fill(UI_BG_COLOR)
-
-        # Draw the canvas area with BG_COLOR via grid.draw()
-        self.grid.draw(self.win)
-
-        # Draw the canvas border
-        canvas_rect = pygame.Rect(0, 0, COLS * PIXEL_SIZE, ROWS * PIXEL_SIZE)
-        pygame.draw.rect(self.win, CANVAS_BORDER_COLOR, canvas_rect, CANVAS_BORDER_WIDTH)
-
-        # Draw buttons on the toolbar
-        for button in self.buttons:
-            # Highlight the active tool button
-            if (button.text == 'DRAW' and self.current_tool == 'draw') or (button.text == 'FILL' and self.current_tool == 'fill'):
-                # Draw a border or change color to indicate active tool
-                pygame.draw.rect(self.win, YELLOW, (button.x-2, button.y-2, button.width+4, button.height+4), 2)
-            
-            # Disable UNDO button if no actions to undo
-            if button.text == 'UNDO' and not self.undo_stack:
-                # Draw the button as disabled (e.g., lighter color)
-                disabled_color = (200, 200, 200)  # Light grey
-                pygame.draw.rect(self.win, disabled_color, (button.x, button.y, button.width, button.height))
-                pygame.draw.rect(self.win, BLACK, (button.x, button.y, button.width, button.height), 2)
-                if button.text:
-                    button_font = get_font(14)
-                    text_surface = button_font.render(button.text, True, BLACK)
-                    self.win.blit(
-                        text_surface,
-                        (
-                            button.x + button.width / 2 - text_surface.get_width() / 2,
-                            button.y + button.height / 2 - text_surface.get_height() / 2,
-                        ),
-                    )
-                continue  # Skip drawing the button normally
-
-            # Disable REDO button if no actions to redo
-            if button.text == 'REDO' and not self.redo_stack:
-                # Draw the button as disabled (e.g., lighter color)
-                disabled_color = (200, 200, 200)  # Light grey
-                pygame.draw.rect(self.win, disabled_color, (button.x, button.y, button.width, button.height))
-                pygame.draw.rect(self.win, BLACK, (button.x, button.y, button.width, button.height), 2)
-                if button.text:
-                    button_font = get_font(14)
-                    text_surface = button_font.render(button.text, True, BLACK)
-                    self.win.blit(
-                        text_surface,
-                        (
-                            button.x + button.width / 2 - text_surface.get_width() / 2,
-                            button.y + button.height / 2 - text_surface.get_height() / 2,
-                        ),
-                    )
-                continue  # Skip drawing the button normally
+    def open_project(self, path):
+        # Tiles are read from the file as they come into view
+        self.finish_edits()
+        try:
+            project = Project.open(path)
+        except (OSError, ValueError) as e:
+            print(f"Error opening project: {e}")
+            return
+        # Opening replaces the canvas, it isn't an undoable edit
+        self.history.recording = False
+        try:
+            project.load_into(self.grid)
+        except ValueError as e:
+            print(f"Error opening project: {e}")
+            project.close()
+            return
+        finally:
+            self.history.recording = True
+        self.history.reset()
+        self.selection.clear()
+        if self.project is not None:
+            self.project.close()
+        self.project = project
+        self.journal.rebase(project)
+        self.update_caption()
+        print(f"Opened {path}")
+
+    def open_file(self, path):
+        if is_project_file(path):
+            self.open_project(path)
+        else:
+            self.import_image(path)
+
+    def open_saved_image(self):
+        # The newest image SAVE wrote, raw ones can't be read back
+        try:
+            paths = [os.path.join('saved_images', name) for name in os.listdir('saved_images')
+                     if name.endswith(('.png', '.bmp'))]
+        except OSError:
+            paths = []
+        if not paths:
+            print("No saved images to open.")
+            return
+        self.import_image(max(paths, key=os.path.getmtime))
+
+    def import_image(self, path):
+        # Painted into the active layer from the top-left of the view, as
+        # one undo step. Each block of PIXEL_SIZE pixels becomes a cell
+        self.finish_edits()
+        palette = None
+        if IMPORT_SNAP_TO_PALETTE or self.grid.backend == 'indexed':
+            # An indexed canvas holds 256 colours at most. The background
+            # is kept too, or the paper of a saved image comes back tinted
+            palette = [BG_COLOR] + [button.color for button in self.buttons if button.text is None]
+        row0, col0 = self.viewport.visible_cells()[:2]
+        from utils_updated.importer import import_image  # Not needed to start, imported on first use
+        try:
+            rect = import_image(self.grid.active_grid(), path, palette, IMPORT_SAMPLING, row0, col0)
+        except (OSError, ValueError, pygame.error) as e:
+            print(f"Error opening image: {e}")
+            return
+        self.history.commit()
+        self.journal.add_patch([rect])
+        print(f"Opened {path}")
 
-            button.draw(self.win)
-        
-        # Draw sliders above the buttons
-        self.base_brush_slider.draw(self.win)
-        self.sensitivity_slider.draw(self.win)
+    def save_trace(self):
+        if not self.profiler.frames:
+            print("No frames profiled yet, F3 starts profiling.")
+            return
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(PROFILE_TRACE_DIR, f"trace_{timestamp}.json")
+        try:
+            count = self.profiler.save_trace(path)
+        except OSError as e:
+            print(f"Error saving trace: {e}")
+            return
+        print(f"Trace of {len(self.profiler.frames)} frames ({count} events) saved as {path}")
+
+    def handle_save_finished(self, event):
+        event.snapshot.close()
+        if event.error is None:
+            print(f"Image saved as {event.filename}")
+        else:
+            print(f"Error saving image: {event.error}")
+
+    def draw(self):
+        # The first frame, and every frame with the 'poll' scheduler, draws
+        # the whole window. Otherwise only the parts that changed are drawn
+        # and passed to the display
+        partial = self.scheduler == 'events' and not self.redraw_all
+        self.redraw_all = False
+
+        # The toolbar is only re-rendered when the active tool, undo/redo
+        # availability or a slider changes
+        disabled = []
+        if not self.history.can_undo():
+            disabled.append('UNDO')
+        if not self.history.can_redo():
+            disabled.append('REDO')
+        with self.profiler.scope('toolbar'):
+            highlighted = [self.current_tool.upper()] + (['FILLED'] if self.shape_filled else [])
+            toolbar_changed = self.toolbar.update(highlighted, disabled)
+
+        areas = None
+        if partial:
+            # Drawn over the old brush size indicator, and under a changed toolbar's labels
+            areas = []
+            if self.cursor_rect is not None:
+                areas.append(self.cursor_rect)
+            if self.overlay_rect is not None:
+                areas.append(self.overlay_rect)
+            if self.selection_rect is not None:
+                areas.append(self.selection_rect)
+            if self.shape_rect is not None:
+                areas.append(self.shape_rect)
+            if self.predict_rect is not None:
+                areas.append(self.predict_rect)
+            if toolbar_changed:
+                areas.append(self.toolbar.rect)
+
+        # Blit the cached canvas, only changed cells are re-rendered
+        with self.profiler.scope('render'):
+            rects = self.renderer.draw(self.win, areas=areas)
+
+        toolbar_area = None
+        if partial:
+            # The toolbar labels are blended over the canvas, blending twice
+            # would darken them, so the canvas under them is drawn once more
+            # and the toolbar once over the union
+            covered = [rect.clip(self.toolbar.rect) for rect in rects + areas]
+            covered = [rect for rect in covered if rect]
+            if covered:
+                toolbar_area = covered[0].unionall(covered[1:])
+                with self.profiler.scope('render'):
+                    rects += self.renderer.draw(self.win, areas=[toolbar_area])
+                areas.append(toolbar_area)
+
+        # Draw the canvas border, where the canvas was drawn. As four fills,
+        # draw.rect with a width fills a clip rect narrower than it whole
+        canvas_rect = self.viewport.document_rect()
+        border = CANVAS_BORDER_WIDTH
+        edges = [
+            (canvas_rect.x, canvas_rect.y, canvas_rect.width, border),
+            (canvas_rect.x, canvas_rect.bottom - border, canvas_rect.width, border),
+            (canvas_rect.x, canvas_rect.y, border, canvas_rect.height),
+            (canvas_rect.right - border, canvas_rect.y, border, canvas_rect.height),
+        ]
+        for rect in rects if partial else [self.win.get_rect()]:
+            for edge in edges:
+                edge = rect.clip(edge)
+                if edge:
+                    self.win.fill(CANVAS_BORDER_COLOR, edge)
+
+        with self.profiler.scope('toolbar'):
+            if not partial:
+                self.toolbar.draw(self.win)
+            elif toolbar_area is not None:
+                self.toolbar.draw(self.win, toolbar_area)
+
+        # The selection over the canvas, floating cells are only drawn here
+        self.selection_rect = None
+        if self.selection.rect is not None or self.selection.floating is not None:
+            with self.profiler.scope('selection'):
+                self.selection_overlay.draw(self.win)
+            self.selection_rect = self.selection_overlay.rect()
+
+        # The shape being dragged, drawn afresh every frame
+        self.shape_rect = None
+        if self.shape_start is not None:
+            with self.profiler.scope('shape'):
+                spans = shape_spans(self.current_tool, self.shape_start, self.shape_end, self.base_brush_size,
+                                    self.shape_filled, self.grid.rows, self.grid.cols)
+                self.shape_rect = draw_spans(self.win, self.viewport, spans, self.drawing_color)
+
+        # Ink predicted past the last pointer sample, only drawn over the
+        # canvas, so the next frame's real samples replace it
+        self.predict_rect = None
+        if self.dragging and self.current_tool == 'draw' and self.dynamic_brush_size is not None:
+            predicted = self.pointer.predict(time.perf_counter())
+            if predicted is not None:
+                with self.profiler.scope('stroke'):
+                    spans = shape_spans('line', self.viewport.to_canvas(self.prev_pos), self.viewport.to_canvas(predicted),
+                                        self.dynamic_brush_size, False, self.grid.rows, self.grid.cols)
+                    self.predict_rect = draw_spans(self.win, self.viewport, spans, self.drawing_color)
+
+        self.overlay_rect = None
+        if self.profiler.enabled:
+            with self.profiler.scope('overlay'):
+                self.overlay_rect = self.overlay.draw(self.win)
 
         # Draw brush size indicator
         mouse_pos = pygame.mouse.get_pos()
+        cursor_rect = None
         if mouse_pos[1] < ROWS * PIXEL_SIZE:
             # Here, we could use the dynamic_brush_size, but for simplicity, use base_brush_size
-            pygame.draw.circle(self.win, self.drawing_color, mouse_pos, int(self.base_brush_size), 1)
+            brush_radius = int(self.base_brush_size * self.viewport.zoom / PIXEL_SIZE)
+            pygame.draw.circle(self.win, self.drawing_color[:3], mouse_pos, brush_radius, 1)
+            # The rect draw.circle returns comes up short where the circle is cut by the window edge
+            cursor_rect = pygame.Rect(0, 0, 2 * brush_radius + 2, 2 * brush_radius + 2)
+            cursor_rect.center = mouse_pos
+            cursor_rect = cursor_rect.clip(self.win.get_rect())
+
+        with self.profiler.scope('display'):
+            if partial:
+                for rect in (cursor_rect, self.overlay_rect, self.selection_rect, self.shape_rect, self.predict_rect):
+                    if rect is not None:
+                        rects.append(rect)
+                # areas also hold the parts of the toolbar drawn outside the canvas
+                pygame.display.update(rects + areas)
+            else:
+                pygame.display.update()
+        if self.latency is not None:
+            self.latency.shown(time.perf_counter(), self.pointer.lead)
+        if self.live is not None:
+            with self.profiler.scope('live'):
+                self.live.publish()
+        self.cursor_rect = cursor_rect
+        self.profiler.end_frame()
+
+def is_project_file(path):
+    return os.path.splitext(path)[1] == os.path.splitext(PROJECT_PATH)[1]
 
-        pygame.display.update()
 
 if __name__ == "__main__":
-    app = PaintApp()
+    # python main_app.py [project file or image]
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    if path is not None and not is_project_file(path):
+        app = PaintApp()
+        app.import_image(path)
+    else:
+        app = PaintApp(project_path=path)
     app.run()
@@ -0,0 +1,155 @@
+# utils/array_grid.py
+
+import pygame
+import numpy as np
+from .settings import *
+from .grid import Grid
+from .fill import scanline_fill
+from .stroke import polyline_spans
+
+# Disk masks keyed by (radius, x offset, y offset) inside the centre cell
+_disk_mask_cache = {}
+
+
+def get_disk_mask(radius, offset_x, offset_y):
+    key = (radius, offset_x, offset_y)
+    mask = _disk_mask_cache.get(key)
+    if mask is None:
+        pix_radius = int(radius // PIXEL_SIZE) + 1
+        steps = np.arange(-pix_radius, pix_radius + 1)
+        # Same cell-centre distance test as Grid.set_cell_color_circle
+        dx = steps * PIXEL_SIZE + PIXEL_SIZE // 2 - offset_x
+        dy = steps * PIXEL_SIZE + PIXEL_SIZE // 2 - offset_y
+        distance = np.sqrt(dy[:, None] ** 2 + dx[None, :] ** 2)
+        mask = distance <= radius
+        mask.flags.writeable = False
+        _disk_mask_cache[key] = mask
+    return mask
+
+
+# Grid backed by one contiguous rows x cols x channels uint8 array
+class ArrayGrid(Grid):
+    def init_grid(self):
+        return np.full((self.rows, self.cols, len(self.color)), self.color, dtype=np.uint8)
+
+    def clear(self):
+        self.mark_all_dirty()
+        self.grid[...] = self.color
+
+    def set_cell_color(self, row, col, color):
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            self.mark_dirty(row, col, row + 1, col + 1)
+            self.grid[row, col] = color
+
+    def get_cell_color(self, row, col):
+        return tuple(int(v) for v in self.grid[row, col])
+
+    def snapshot(self):
+        return self.grid.copy()
+
+    def restore(self, state):
+        self.mark_all_dirty()
+        np.copyto(self.grid, state)
+
+    def read_region(self, row0, col0, row1, col1):
+        return self.grid[row0:row1, col0:col1].copy()
+
+    def write_region(self, row0, col0, block):
+        row1, col1 = row0 + block.shape[0], col0 + block.shape[1]
+        self.mark_dirty(row0, col0, row1, col1)
+        self.grid[row0:row1, col0:col1] = block
+
+    def set_cell_color_circle(self, center_pos, radius, color):
+        center_x, center_y = center_pos
+        center_row = center_y // PIXEL_SIZE
+        center_col = center_x // PIXEL_SIZE
+        mask = get_disk_mask(radius, center_x % PIXEL_SIZE, center_y % PIXEL_SIZE)
+        pix_radius = mask.shape[0] // 2
+
+        # Clip the stamp against the canvas edges
+        top = center_row - pix_radius
+        left = center_col - pix_radius
+        row0, col0 = max(top, 0), max(left, 0)
+        row1 = min(center_row + pix_radius + 1, self.rows)
+        col1 = min(center_col + pix_radius + 1, self.cols)
+        if row0 >= row1 or col0 >= col1:
+            return
+
+        self.paint_mask(row0, col0, mask[row0 - top:row1 - top, col0 - left:col1 - left], color)
+
+    def set_cell_color_polyline(self, points, brush_sizes, color):
+        spans = polyline_spans(points, brush_sizes, self.rows, self.cols)
+        if spans is None:
+            return
+        self.fill_spans(*spans, color)
+
+    def fill_spans(self, row0, lefts, rights, color):
+        # lefts and rights are shaped (parts, rows), see polyline_spans
+        col0, col1 = int(lefts.min()), int(rights.max())
+        if col0 >= col1:
+            return
+
+        # Union of all parts, so cells where they meet are written once
+        cols = np.arange(col0, col1)
+        mask = ((cols >= lefts[:, :, None]) & (cols < rights[:, :, None])).any(axis=0)
+        self.paint_mask(row0, col0, mask, color)
+
+    def paint_mask(self, row0, col0, mask, color):
+        # Sets the cells where mask is True, mask lies inside the canvas at (row0, col0)
+        row1, col1 = row0 + mask.shape[0], col0 + mask.shape[1]
+        self.mark_dirty(row0, col0, row1, col1)
+        self.grid[row0:row1, col0:col1][mask] = color
+
+    def flood_fill(self, pos, new_color, tolerance=0, connectivity=4):
+        x, y = pos
+        row = y // PIXEL_SIZE
+        col = x // PIXEL_SIZE
+
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None
+
+        target_color = self.get_cell_color(row, col)
+        if tolerance == 0:
+            if target_color == tuple(new_color):
+                return None
+
+            def match_row(n_row):
+                return np.all(self.grid[n_row] == target_color, axis=1)
+        else:
+            limit = tolerance * tolerance
+
+            def match_row(n_row):
+                diff = self.grid[n_row].astype(np.int32) - target_color
+                return np.einsum('ij,ij->i', diff, diff) <= limit
+        return self.fill_matches(match_row, row, col, connectivity, new_color)
+
+    def fill_matches(self, match_row, row, col, connectivity, value):
+        # Sets value on the matching cells connected to (row, col), returns
+        # their bounding box. match_row(row) says which cells of a row
+        # match, it is only asked for the rows the fill reaches
+        matched = {}
+
+        def open_row(n_row):
+            matches = matched[n_row] = match_row(n_row)
+            return bytearray(matches.view(np.uint8))
+
+        open_rows = [None] * self.rows
+        _, bbox = scanline_fill(open_rows, row, col, connectivity, open_row)
+
+        # Filled cells are the matching ones the fill zeroed out. The fill
+        # is connected, it reached every row of its bounding box
+        row0, col0, row1, col1 = bbox
+        remaining = np.frombuffer(b''.join(open_rows[row0:row1]), dtype=np.uint8)
+        remaining = remaining.reshape(row1 - row0, self.cols)[:, col0:col1]
+        matches = np.array([matched[n_row][col0:col1] for n_row in range(row0, row1)])
+        filled = matches & (remaining == 0)
+
+        self.mark_dirty(*bbox)
+        self.grid[row0:row1, col0:col1][filled] = value
+        return bbox
+
+    def draw(self, win):
+        # surfarray is indexed (x, y), the grid is (row, col)
+        surface = pygame.surfarray.make_surface(self.grid.swapaxes(0, 1))
+        win.blit(pygame.transform.scale(surface, (self.cols * PIXEL_SIZE, self.rows * PIXEL_SIZE)), (0, 0))
+        self.draw_grid_lines(win)
@@ -0,0 +1,187 @@
+# utils/batch.py
+#
+# Operation scripts, JSON lines applied to a grid without a window. The
+# optional first line sizes the document, the others paint it. Positions
+# are in canvas pixels (PIXEL_SIZE per cell) like the window's, colours
+# are [r, g, b]:
+#
+#   {"op": "canvas", "rows": 175, "cols": 200, "background": [255, 255, 255], "backend": "array"}
+#   {"op": "color", "color": [255, 0, 0]}
+#   {"op": "stroke", "points": [[10, 10], [200, 40], [300, 90]], "size": 5, "soft": true}
+#   {"op": "fill", "pos": [50, 50], "tolerance": 0, "connectivity": 4}
+#   {"op": "shape", "shape": "ellipse", "from": [40, 40], "to": [300, 200], "size": 3, "filled": false}
+#   {"op": "filter", "filter": "gaussian_blur", "sigma": 2.0}
+#   {"op": "clear"}
+#
+# stroke takes one size for every segment or a list of one per segment,
+# stroke, fill and shape take an optional "color" of their own. A "soft"
+# stroke is painted with the anti-aliased brush, strokes are hard edged
+# otherwise. shape is one of utils_updated/shapes.py's SHAPES dragged from
+# one position to the other, an outline as thick as a stroke of its size
+# unless it is "filled".
+# filter runs one of utils_updated/filters.py's FILTERS over the canvas,
+# any other keys are its settings.
+
+import os
+import json
+import time
+from .settings import *
+from .canvas import create_grid
+from .filters import apply_filter, filter_reach
+from .shapes import SHAPES, shape_spans
+from .export import export_image
+
+# Numbers are checked with type() rather than isinstance(): JSON's true
+# and false load as bools, which isinstance() counts as ints
+
+
+def parse_color(value):
+    if not isinstance(value, list) or len(value) != 3 or not all(type(c) is int and 0 <= c <= 255 for c in value):
+        raise ValueError(f"colour must be [r, g, b] of 0-255, not {value!r}")
+    return tuple(value)
+
+
+def parse_point(value):
+    if not isinstance(value, list) or len(value) != 2 or not all(type(c) in (int, float) for c in value):
+        raise ValueError(f"position must be [x, y], not {value!r}")
+    return (int(value[0]), int(value[1]))
+
+
+def parse_op(record):
+    # A script line -> (kind, args). Raises ValueError on anything off
+    if not isinstance(record, dict):
+        raise ValueError("each line must be a JSON object")
+    kind = record.get('op')
+    if kind == 'color':
+        return kind, (parse_color(record.get('color')),)
+    if kind == 'stroke':
+        points = record.get('points')
+        if not isinstance(points, list) or len(points) < 2:
+            raise ValueError("stroke needs two or more points")
+        points = [parse_point(point) for point in points]
+        size = record.get('size', MIN_BRUSH_SIZE)
+        sizes = size if isinstance(size, list) else [size] * (len(points) - 1)
+        if len(sizes) != len(points) - 1 or not all(type(s) is int and s >= 1 for s in sizes):
+            raise ValueError("size must be a positive integer or a list of one per segment")
+        color = parse_color(record['color']) if 'color' in record else None
+        soft = record.get('soft', False)
+        if not isinstance(soft, bool):
+            raise ValueError("soft must be true or false")
+        return kind, (points, sizes, color, soft)
+    if kind == 'fill':
+        tolerance = record.get('tolerance', FILL_TOLERANCE)
+        connectivity = record.get('connectivity', FILL_CONNECTIVITY)
+        if type(tolerance) is not int or tolerance < 0:
+            raise ValueError("tolerance must be a non-negative integer")
+        if type(connectivity) is not int or connectivity not in (4, 8):
+            raise ValueError("connectivity must be 4 or 8")
+        color = parse_color(record['color']) if 'color' in record else None
+        return kind, (parse_point(record.get('pos')), color, tolerance, connectivity)
+    if kind == 'shape':
+        shape = record.get('shape')
+        if shape not in SHAPES:
+            raise ValueError(f"shape must be one of {', '.join(SHAPES)}")
+        size = record.get('size', MIN_BRUSH_SIZE)
+        if type(size) is not int or size < 1:
+            raise ValueError("size must be a positive integer")
+        filled = record.get('filled', False)
+        if not isinstance(filled, bool):
+            raise ValueError("filled must be true or false")
+        color = parse_color(record['color']) if 'color' in record else None
+        return kind, (shape, parse_point(record.get('from')), parse_point(record.get('to')), size, filled, color)
+    if kind == 'filter':
+        settings = {key: value for key, value in record.items() if key not in ('op', 'filter')}
+        if any(type(value) is bool for value in settings.values()):
+            raise ValueError("filter settings are numbers, not true or false")
+        filter_reach(record.get('filter'), settings)
+        return kind, (record['filter'], settings)
+    if kind == 'clear':
+        return kind, ()
+    raise ValueError(f"unknown op {kind!r}")
+
+
+def read_script(path):
+    # Returns (canvas, ops), canvas holds the document size, background
+    # and backend. Errors name the line they are on
+    canvas = {'rows': ROWS, 'cols': COLS, 'background': BG_COLOR, 'backend': GRID_BACKEND}
+    ops = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if isinstance(record, dict) and record.get('op') == 'canvas':
+                    if ops:
+                        raise ValueError("canvas must come before the other ops")
+                    for key in ('rows', 'cols'):
+                        value = record.get(key, canvas[key])
+                        if type(value) is not int or value < 1:
+                            raise ValueError(f"{key} must be a positive integer")
+                        canvas[key] = value
+                    if 'background' in record:
+                        canvas['background'] = parse_color(record['background'])
+                    canvas['backend'] = record.get('backend', canvas['backend'])
+                else:
+                    ops.append(parse_op(record))
+            except ValueError as e:  # json.JSONDecodeError is one too
+                raise ValueError(f"{path}:{number}: {e}") from None
+    return canvas, ops
+
+
+def run_script(grid, ops, timings=None):
+    # Applies parsed ops to grid. timings, if given, collects
+    # {kind: [count, seconds]}
+    color = BLACK
+    for kind, args in ops:
+        start = time.perf_counter()
+        if kind == 'color':
+            color = args[0]
+        elif kind == 'stroke':
+            points, sizes, stroke_color, soft = args
+            if soft:
+                grid.soft_stroke(stroke_color or color).add(points, sizes)
+            else:
+                grid.set_cell_color_polyline(points, sizes, stroke_color or color)
+        elif kind == 'fill':
+            pos, fill_color, tolerance, connectivity = args
+            grid.flood_fill(pos, fill_color or color, tolerance, connectivity)
+        elif kind == 'shape':
+            shape, pos1, pos2, size, filled, shape_color = args
+            spans = shape_spans(shape, pos1, pos2, size, filled, grid.rows, grid.cols)
+            if spans is not None:
+                grid.fill_spans(*spans, shape_color or color)
+        elif kind == 'filter':
+            name, settings = args
+            apply_filter(grid, name, **settings)
+        elif kind == 'clear':
+            grid.clear()
+        if timings is not None:
+            timing = timings.setdefault(kind, [0, 0.0])
+            timing[0] += 1
+            timing[1] += time.perf_counter() - start
+
+
+def render_script(script_path, output_path, scale=PIXEL_SIZE, backend=None):
+    # Paints one script's document and writes it as an image in the format
+    # of output_path's extension (see export.py), scale pixels per cell.
+    # backend overrides the script's. Returns a summary dict, a failed
+    # document has its error in it instead of raising, whatever it was, so
+    # a batch carries on past it
+    result = {'script': script_path, 'output': output_path, 'ops': 0, 'timings': {}, 'error': None}
+    start = time.perf_counter()
+    try:
+        canvas, ops = read_script(script_path)
+        grid = create_grid(canvas['rows'], canvas['cols'], canvas['background'], backend or canvas['backend'])
+        run_script(grid, ops, result['timings'])
+        result['ops'] = len(ops)
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Read from the grid a band at a time, the document is never copied whole
+        export_image(output_path, lambda row0, row1: grid.read_region(row0, 0, row1, grid.cols),
+                     grid.rows, grid.cols, scale)
+    except Exception as e:
+        result['error'] = str(e) or type(e).__name__
+    result['seconds'] = time.perf_counter() - start
+    return result
@@ -0,0 +1,208 @@
+# utils/brush.py
+
+import math
+import numpy as np
+from functools import lru_cache
+from .settings import PIXEL_SIZE, BRUSH_FEATHER, BRUSH_SPACING, BRUSH_KERNEL_CACHE, STROKE_TILE_SIZE
+from .stroke import polyline_segments
+
+# Soft brush. A stamp is an alpha kernel over the cells around a point,
+# full inside the brush radius and fading out linearly over BRUSH_FEATHER
+# cells across its edge, so a cell on the edge is half covered where the
+# hard brush's in or out test would cut. A kernel depends on the radius,
+# kept to RADIUS_STEP, and on where in its cell the point lies. All of a
+# radius are made at once, as far out as they are stamped, and kept in an
+# LRU cache.
+#
+# A stroke is stamped along its segments as far apart as the edge allows
+# without rippling by more than BRUSH_SPACING. Its stamps' kernels are all
+# made as large as the largest one's, padded with 0, and scattered into an
+# alpha mask over the stroke's bounding box in one np.maximum.at, each
+# cell keeping the most any stamp covers it with, so a stroke crossing
+# itself doesn't build up. The colour is then blended in with that mask
+# in one step.
+
+RADIUS_STEP = 0.25  # Pixels, soft brush radii are rounded to this
+
+
+def kernel_reach(radius):
+    # Cells a kernel spans either side of its middle one. A cell k cells
+    # away has its centre at least k * PIXEL_SIZE - PIXEL_SIZE // 2 from
+    # the point, alpha is 0 from radius + half the feather out
+    edge = radius + BRUSH_FEATHER * PIXEL_SIZE / 2
+    return max(math.ceil((edge + PIXEL_SIZE // 2) / PIXEL_SIZE) - 1, 0)
+
+
+@lru_cache(maxsize=BRUSH_KERNEL_CACHE)
+def stamp_kernels(radius, reach):
+    # (PIXEL_SIZE, PIXEL_SIZE, size, size) float32 kernels, one for a point
+    # at each (y, x) pixel offset inside the middle cell, reaching reach
+    # cells out (at least kernel_reach(radius), the rest is 0)
+    feather = BRUSH_FEATHER * PIXEL_SIZE
+    # Cell-centre distances, as Grid.set_cell_color_circle measures them
+    steps = np.arange(-reach, reach + 1) * PIXEL_SIZE + PIXEL_SIZE // 2
+    offsets = steps[None, :] - np.arange(PIXEL_SIZE)[:, None]
+    distance = np.sqrt(offsets[:, None, :, None] ** 2 + offsets[None, :, None, :] ** 2)
+    kernels = np.clip((radius - distance) / feather + 0.5, 0, 1).astype(np.float32)
+    kernels.flags.writeable = False
+    return kernels
+
+
+@lru_cache(maxsize=64)
+def stamp_span(reach, width):
+    # Flat offsets of a kernel's cells from its middle one in a mask width
+    # cells wide
+    steps = np.arange(-reach, reach + 1)
+    span = (steps[:, None] * width + steps).ravel()
+    span.flags.writeable = False
+    return span
+
+
+def stamp_points(points, brush_sizes):
+    # Stamp positions (x, y) in whole pixels, the segment each belongs to
+    # and the radius of every segment
+    start, end, radius = polyline_segments(points, brush_sizes)
+    radius = np.round(radius[:, 0] * (1 / RADIUS_STEP)) * RADIUS_STEP
+    delta = end - start
+    # Between two stamps s apart the edge dips by about s * s / (8 * r),
+    # r being how far the kernel reaches out to its half covered cells
+    feather = BRUSH_FEATHER * PIXEL_SIZE
+    spacing = np.sqrt((radius + feather / 2) * (8 * BRUSH_SPACING * feather))
+    steps = np.ceil(np.hypot(delta[:, 0], delta[:, 1]) / spacing).astype(np.int64)
+    np.maximum(steps, 1, out=steps)
+    # Every segment is stamped from its start to its end, both included
+    if len(steps) == 1:
+        segment = np.zeros(steps[0] + 1, dtype=np.int64)
+        along = np.arange(steps[0] + 1) / steps[0]
+    else:
+        counts = steps + 1
+        segment = np.repeat(np.arange(len(steps)), counts)
+        along = (np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)) / steps[segment]
+    centres = np.rint(start[segment] + delta[segment] * along[:, None]).astype(np.int64)
+    return centres, segment, radius
+
+
+def stroke_alpha(points, brush_sizes, rows, cols):
+    # (row0, col0, alpha) where alpha is a float32 array from 0 to 1 of how
+    # much of the colour each cell gets, None if the stroke misses the canvas
+    centres, segment, radius = stamp_points(points, brush_sizes)
+    # Every stamp's kernel reaches as far as the largest one's, so all of
+    # them go into the mask in one scatter
+    radii = sorted(set(radius.tolist()))
+    reach = kernel_reach(radii[-1])
+    cells, offsets = np.divmod(centres, PIXEL_SIZE)  # Both (x, y)
+    left, top = (cells.min(axis=0) - reach).tolist()
+    right, bottom = (cells.max(axis=0) + reach + 1).tolist()
+    if top < 0 or left < 0 or bottom > rows or right > cols:
+        # Stamps off the canvas are dropped, the rest set the mask's extent
+        keep = ((cells - reach < (cols, rows)) & (cells + reach >= 0)).all(axis=1)
+        if not keep.any():
+            return None
+        segment, cells, offsets = segment[keep], cells[keep], offsets[keep]
+        left, top = (cells.min(axis=0) - reach).tolist()
+        right, bottom = (cells.max(axis=0) + reach + 1).tolist()
+
+    # The mask is filled flat, a stamp's cells are at its middle cell's
+    # index plus the offsets of its size
+    if len(radii) == 1:
+        stamps = stamp_kernels(radii[0], reach)[offsets[:, 1], offsets[:, 0]]
+    else:
+        kernels = np.array([stamp_kernels(value, reach) for value in radii])
+        stamps = kernels[np.searchsorted(radii, radius)[segment], offsets[:, 1], offsets[:, 0]]
+    width = right - left
+    alpha = np.zeros((bottom - top) * width, dtype=np.float32)
+    middles = (cells[:, 1] - top) * width + (cells[:, 0] - left)
+    np.maximum.at(alpha, (middles[:, None] + stamp_span(reach, width)).ravel(), stamps.ravel())
+    alpha = alpha.reshape(bottom - top, width)
+
+    row0, col0 = max(top, 0), max(left, 0)
+    row1, col1 = min(bottom, rows), min(right, cols)
+    return row0, col0, alpha[row0 - top:row1 - top, col0 - left:col1 - left]
+
+
+def blend_color(cells, color, alpha):
+    # uint8 cells (channels last) with color laid over them at alpha, one
+    # value per cell above 0 up to 1. RGBA cells are composited, a colour
+    # with alpha 0 erases
+    values = cells.astype(np.float32)
+    a = alpha[..., None]
+    if cells.shape[-1] == 3:
+        values += (np.array(color, dtype=np.float32) - values) * a
+    elif color[3] == 0:
+        values[..., 3:] *= 1 - a
+    else:
+        source = a * np.float32(color[3] / 255)
+        below = values[..., 3:] * np.float32(1 / 255) * (1 - source)
+        coverage = source + below
+        # The colour's share of what shows, (c * source + rgb * below) / coverage.
+        # source, and so coverage, is above 0 with alpha and the colour's alpha
+        share = source / coverage
+        values[..., :3] += (np.array(color[:3], dtype=np.float32) - values[..., :3]) * share
+        values[..., 3:] = coverage * 255
+    cells = np.minimum(values + 0.5, 255).astype(np.uint8)
+    if cells.shape[-1] == 4:
+        cells[cells[..., 3] == 0] = 0  # Fully erased cells are plain transparent ones
+    return cells
+
+
+class SoftStroke:
+    # One stroke of the soft brush on a grid, painted a polyline at a time
+    # as it comes in. It keeps the cells it has covered as they were before
+    # the stroke and how much of the colour each got, and blends every
+    # polyline from those, so the parts of a stroke overlap without
+    # building up and the result is the same however it was split. They are
+    # kept in tiles, read the first time a polyline reaches one, so a
+    # polyline costs the same however long the stroke has got
+    def __init__(self, grid, color, tile_size=STROKE_TILE_SIZE):
+        self.grid = grid
+        self.color = tuple(color)
+        self.tile_size = getattr(grid, 'tile_size', tile_size)
+        self.tiles = {}  # (tile_row, tile_col) -> original, cells, alpha
+
+    def add(self, points, brush_sizes):
+        # Returns the (row0, col0, row1, col1) it changed, or None
+        stamped = stroke_alpha(points, brush_sizes, self.grid.rows, self.grid.cols)
+        if stamped is None:
+            return None
+        row0, col0, alpha = stamped
+        row1, col1 = row0 + alpha.shape[0], col0 + alpha.shape[1]
+        # The region's cells from the tiles it spans, blended in one go
+        parts = []
+        size = self.tile_size
+        for tile_row in range(row0 // size, (row1 - 1) // size + 1):
+            for tile_col in range(col0 // size, (col1 - 1) // size + 1):
+                top, left = tile_row * size, tile_col * size
+                top0, left0 = max(row0, top), max(col0, left)
+                bottom, right = min(row1, top + size), min(col1, left + size)
+                parts.append((self.tile(tile_row, tile_col),
+                              (slice(top0 - top, bottom - top), slice(left0 - left, right - left)),
+                              (slice(top0 - row0, bottom - row0), slice(left0 - col0, right - col0))))
+        first = parts[0][0][0]
+        original = np.empty(alpha.shape + first.shape[2:], dtype=first.dtype)
+        cells = np.empty_like(original)
+        covered = np.empty_like(alpha)
+        for arrays, in_tile, in_region in parts:
+            original[in_region] = arrays[0][in_tile]
+            cells[in_region] = arrays[1][in_tile]
+            covered[in_region] = arrays[2][in_tile]
+        # Only cells the stroke now covers more of are blended, from how
+        # they were before it, the rest keep what they show
+        more = np.nonzero(alpha > covered)
+        covered[more] = alpha[more]
+        cells[more] = blend_color(original[more], self.color, covered[more])
+        for arrays, in_tile, in_region in parts:
+            arrays[1][in_tile] = cells[in_region]
+            arrays[2][in_tile] = covered[in_region]
+        self.grid.write_region(row0, col0, cells)
+        return row0, col0, row1, col1
+
+    def tile(self, tile_row, tile_col):
+        # The tile's arrays, read from the grid the first time
+        key = (tile_row, tile_col)
+        if key not in self.tiles:
+            size = self.tile_size
+            top, left = tile_row * size, tile_col * size
+            original = np.array(self.grid.read_region(
+                top, left, min(top + size, self.grid.rows), min(left + size, self.grid.cols)))
+            self.tiles[key] = (original, original.copy(), np.zeros(original.shape[:2], dtype=np.float32))
+        return self.tiles[key]
@@ -1,7 +1,7 @@
 # utils/button.py
 
 import pygame
-from .settings import get_font, BLACK
+from .settings import render_text, BLACK, DISABLED_COLOR
 
 class Button:
     def __init__(self, x, y, width, height, color, text=None, text_color=BLACK):
@@ -13,15 +13,16 @@ class Button:
         self.text = text
         self.text_color = text_color
 
-    def draw(self, win):
-        # Draw button rectangle
-        pygame.draw.rect(win, self.color, (self.x, self.y, self.width, self.height))
+    def draw(self, win, enabled=True):
+        # Draw button rectangle, greyed out when disabled
+        color = self.color if enabled else DISABLED_COLOR
+        text_color = self.text_color if enabled else BLACK
+        pygame.draw.rect(win, color, (self.x, self.y, self.width, self.height))
         # Draw button border
         pygame.draw.rect(win, BLACK, (self.x, self.y, self.width, self.height), 2)
         # Draw text if available
         if self.text:
-            button_font = get_font(14)  # Adjusted font size for better readability
-            text_surface = button_font.render(self.text, True, self.text_color)
+            text_surface = render_text(self.text, 14, text_color)  # Adjusted font size for better readability
             win.blit(
                 text_surface,
                 (
@@ -0,0 +1,21 @@
+# utils/canvas.py
+
+from .settings import GRID_BACKEND
+from .grid import Grid
+from .array_grid import ArrayGrid
+from .tiled_grid import TiledGrid
+from .indexed_grid import IndexedGrid
+
+GRID_BACKENDS = {
+    'list': Grid,        # Original list of RGB tuples
+    'array': ArrayGrid,  # Contiguous numpy array
+    'tiled': TiledGrid,  # Lazily allocated tiles, for large documents
+    'indexed': IndexedGrid,  # Palette index per cell
+}
+
+
+def create_grid(rows, cols, color, backend=None):
+    backend = backend or GRID_BACKEND
+    if backend not in GRID_BACKENDS:
+        raise ValueError(f"Unknown grid backend: {backend}")
+    return GRID_BACKENDS[backend](rows, cols, color)
@@ -0,0 +1,112 @@
+# utils/export.py
+
+import os
+import struct
+import numpy as np
+from .settings import EXPORT_SCALE, EXPORT_BAND_BYTES
+from .png import PngWriter
+
+# Cells written out as an image at any whole number of pixels per cell,
+# streamed in bands of rows: a band of cells is read, scaled and encoded
+# before the next one is read, so memory stays around a few bands
+# (EXPORT_BAND_BYTES each) whatever the size of the image. When even one
+# row of cells scaled up is more than a band, its pixel rows are written
+# a few at a time from one scaled row.
+#
+# The format follows the file's extension:
+#   .png  8 bit RGB, compressed as it streams (see png.py)
+#   .bmp  24 bit, stored top down so rows are written in order, up to 4 GB
+#   .raw  RGB bytes row after row, no header: the size isn't stored
+
+
+class RawWriter:
+    # Same interface as PngWriter: write() rows, then close() or abort()
+    def __init__(self, path, width, height):
+        self.path = path
+        self.temp_path = path + '.tmp'
+        self.width = width
+        self.height = height
+        self.rows = 0
+        self.file = open(self.temp_path, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        if kind is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, pixels):
+        self.rows += pixels.shape[0]
+        self.file.write(np.ascontiguousarray(pixels))
+
+    def close(self):
+        if self.rows != self.height:
+            self.abort()
+            raise ValueError(f"{self.rows} rows written to an image {self.height} rows high")
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.temp_path)
+
+
+class BmpWriter(RawWriter):
+    HEADER = struct.Struct('<2sIHHIIiiHHIIiiII')  # File header, then BITMAPINFOHEADER
+
+    def __init__(self, path, width, height):
+        self.stride = -(-width * 3 // 4) * 4  # Rows are padded to 4 bytes
+        size = self.HEADER.size + self.stride * height
+        if size >= 1 << 32:
+            raise ValueError(f"a {width} x {height} image is too large for a BMP")
+        super().__init__(path, width, height)
+        # A negative height stores the rows top down
+        self.file.write(self.HEADER.pack(b'BM', size, 0, 0, self.HEADER.size, 40, width, -height, 1, 24, 0,
+                                         self.stride * height, 2835, 2835, 0, 0))
+
+    def write(self, pixels):
+        rows = pixels.shape[0]
+        lines = np.zeros((rows, self.stride), dtype=np.uint8)
+        lines[:, :self.width * 3] = pixels[..., ::-1].reshape(rows, self.width * 3)  # BGR
+        super().write(lines)
+
+
+EXPORT_WRITERS = {'.png': PngWriter, '.bmp': BmpWriter, '.raw': RawWriter}
+EXPORT_FORMATS = tuple(extension[1:] for extension in EXPORT_WRITERS)
+
+
+def scaled_rows(wide, scale, pixel_rows):
+    # Pixel rows of cells already scaled across, each row repeated scale
+    # times, in pieces of at most pixel_rows rows
+    if pixel_rows >= scale:
+        step = pixel_rows // scale
+        for i in range(0, len(wide), step):
+            yield wide[i:i + step].repeat(scale, axis=0)
+        return
+    for row in wide:
+        for i in range(0, scale, pixel_rows):
+            yield np.broadcast_to(row, (min(pixel_rows, scale - i),) + row.shape)
+
+
+def export_image(path, read_rows, rows, cols, scale=EXPORT_SCALE, band_bytes=EXPORT_BAND_BYTES):
+    # Writes rows x cols cells to path, scale pixels per cell. read_rows(row0,
+    # row1) returns those rows of cells as (row1 - row0, cols, 3) uint8 RGB.
+    # Returns the image's (width, height)
+    writer = EXPORT_WRITERS.get(os.path.splitext(path)[1].lower())
+    if writer is None:
+        raise ValueError(f"can't export {path}, the formats are {', '.join(EXPORT_FORMATS)}")
+    if scale < 1:
+        raise ValueError(f"scale must be at least 1, not {scale}")
+    width, height = cols * scale, rows * scale
+    pixel_rows = max(band_bytes // (width * 3), 1)  # Rows of the image a band holds
+    with writer(path, width, height) as image:
+        for row0 in range(0, rows, pixel_rows):
+            wide = read_rows(row0, min(row0 + pixel_rows, rows))
+            if scale > 1:
+                wide = wide.repeat(scale, axis=1)
+            for pixels in scaled_rows(wide, scale, pixel_rows):
+                image.write(pixels)
+    return width, height
@@ -0,0 +1,153 @@
+# utils/fill.py
+
+# Span based flood fill shared by the grid backends.
+#
+# The canvas is handed over as one bytearray per row holding 1 where a
+# cell may be filled. Whole spans are found and claimed with the C level
+# bytearray find/rfind and slice assignment, so the interpreter does work
+# per span rather than per cell. Claimed cells are zeroed in place.
+#
+# A row can be left as None and is then made by open_row(row) the first
+# time the fill reaches it, so a fill costs the rows it touches rather
+# than the whole canvas.
+#
+# A span one cell wide may be a corridor running up or down, where every
+# row would be a span of its own. It is followed a cell at a time instead,
+# for as long as the cells either side stay closed.
+#
+# With 8-connectivity a cell can be joined to the rows either side only
+# diagonally, as on a checkerboard, where every span is one lone cell.
+# Those are claimed a cell at a time from a plain list of cells, without
+# the bookkeeping of a span, and only the three cells above and below are
+# looked at. That is still interpreter work per cell, as in a BFS, so a
+# checkerboard fills about as fast as a BFS does rather than faster.
+
+from operator import itemgetter
+
+
+def color_distance_sq(color_a, color_b):
+    return sum((a - b) * (a - b) for a, b in zip(color_a, color_b))
+
+
+def scanline_fill(open_rows, row, col, connectivity=4, open_row=None):
+    height = len(open_rows)
+    # 8-connectivity also looks one cell diagonally past each span end
+    reach = 1 if connectivity == 8 else 0
+
+    line = open_rows[row]
+    if line is None:
+        line = open_rows[row] = open_row(row)
+    if not line[col]:
+        return [], None
+    width = len(line)
+    last = width - 1
+    zeros = memoryview(bytes(width))
+
+    left = line.rfind(0, 0, col) + 1
+    right = line.find(0, col)
+    if right == -1:
+        right = width
+    line[left:right] = zeros[:right - left]
+
+    # The span list doubles as the work queue. Each entry also remembers
+    # the span it was found from, so the row it came from is only scanned
+    # again when the new span sticks out past the old one.
+    spans = [(row, left, right, row, left, right)]
+    add_span = spans.append
+    columns = []  # (row0, col, row1) of the corridors followed
+    cells = []  # (row, col) of the lone cells claimed
+    add_cell = cells.append
+    index = 0
+
+    while index < len(spans):
+        span_row, span_left, span_right, from_row, from_left, from_right = spans[index]
+        index += 1
+
+        top = bottom = span_row
+        if span_right - span_left == 1:
+            # Follow the corridor both ways while the cells either side
+            # are closed, the rows past its ends are scanned as usual
+            for step in (-1, 1):
+                n_row = span_row + step
+                while 0 <= n_row < height:
+                    line = open_rows[n_row]
+                    if line is None:
+                        line = open_rows[n_row] = open_row(n_row)
+                    if not line[span_left] or (span_left and line[span_left - 1]) or (
+                            span_right < width and line[span_right]):
+                        break
+                    line[span_left] = 0
+                    n_row += step
+                if step < 0:
+                    top = n_row + 1
+                else:
+                    bottom = n_row - 1
+            if top < span_row:
+                columns.append((top, span_left, span_row))
+            if span_row < bottom:
+                columns.append((span_row + 1, span_left, bottom + 1))
+            if top == bottom and reach:
+                # A lone cell. The lone cells found diagonally from it are
+                # claimed and queued in cells, anything wider (or straight
+                # above or below, which may be a corridor) as a span
+                cell_row, col = span_row, span_left
+                index_cells = len(cells)
+                while True:
+                    if 0 < col < last:
+                        steps = (col - 1, col, col + 1)
+                    else:
+                        steps = range(max(col - 1, 0), min(col + 2, width))
+                    for n_row in (cell_row - 1, cell_row + 1):
+                        if n_row < 0 or n_row >= height:
+                            continue
+                        line = open_rows[n_row]
+                        if line is None:
+                            line = open_rows[n_row] = open_row(n_row)
+                        for x in steps:
+                            if not line[x]:
+                                continue
+                            if x != col and (x == 0 or not line[x - 1]) and (x == last or not line[x + 1]):
+                                line[x] = 0
+                                add_cell((n_row, x))
+                                continue
+                            left = line.rfind(0, 0, x) + 1
+                            right = line.find(0, x)
+                            if right == -1:
+                                right = width
+                            line[left:right] = zeros[:right - left]
+                            add_span((n_row, left, right, cell_row, col, col + 1))
+                    if index_cells == len(cells):
+                        break
+                    cell_row, col = cells[index_cells]
+                    index_cells += 1
+                continue
+
+        low = span_left - reach if span_left > reach else 0
+        high = span_right + reach if span_right + reach < width else width
+        covered = from_left <= low and high <= from_right
+
+        for n_row, next_to in ((top - 1, top), (bottom + 1, bottom)):
+            if n_row < 0 or n_row >= height or (n_row == from_row and covered):
+                continue
+            line = open_rows[n_row]
+            if line is None:
+                line = open_rows[n_row] = open_row(n_row)
+            x = line.find(1, low, high)
+            while x != -1:
+                # Grow the span both ways from the first open cell found
+                left = line.rfind(0, 0, x) + 1
+                right = line.find(0, x)
+                if right == -1:
+                    right = width
+                line[left:right] = zeros[:right - left]
+                add_span((n_row, left, right, next_to, span_left, span_right))
+                x = line.find(1, right, high) if right < high else -1
+
+    # Claimed cells as (row0, col0, row1, col1) rects, a row each for the
+    # spans, a column each for the corridors and one each for lone cells
+    rects = [(span_row, left, span_row + 1, right) for span_row, left, right, _, _, _ in spans]
+    rects += [(row0, column, row1, column + 1) for row0, column, row1 in columns]
+    rects += [(cell_row, col, cell_row + 1, col + 1) for cell_row, col in cells]
+    # min and max with a C level key, a lone cell fill has a rect per cell
+    bbox = tuple(pick(rects, key=itemgetter(side))[side] for side, pick in enumerate((min, min, max, max)))
+    return rects, bbox
@@ -0,0 +1,235 @@
+# utils/filters.py
+
+import os
+import math
+import numpy as np
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from .settings import (FILTER_TILE_SIZE, FILTER_WORKERS, FILTER_BLUR_RADIUS, FILTER_BLUR_SIGMA,
+                       FILTER_POSTERIZE_LEVELS, FILTER_BRIGHTNESS, FILTER_CONTRAST)
+from .grid import uniform_block, uniform_color
+
+# Image filters over a whole grid. The canvas is cut into FILTER_TILE_SIZE
+# tiles around what is painted. Every tile, with the cells around it a
+# blur reaches into, is read first, the tiles are then filtered on a pool
+# of threads (numpy lets go of the GIL in its loops) and written back one
+# by one, so listeners, and through them undo, see ordinary writes. The
+# filters work on the colour channels, alpha stays as it is and blurs
+# weigh colours by it, so transparent cells don't bleed black. A tile of
+# one colour is filtered as a single cell.
+
+
+# The alpha bits, and one bit of each colour channel, of an RGBA cell seen
+# as one uint32, whatever the byte order
+ALPHA_BITS = np.array([0, 0, 0, 255], dtype=np.uint8).view(np.uint32)[0]
+GRAY_BITS = np.array([1, 1, 1, 0], dtype=np.uint8).view(np.uint32)[0]
+
+
+def clear_transparent(cells):
+    # Cells of alpha 0 go back to plain transparent, as the eraser leaves them
+    if cells.shape[-1] == 4:
+        words = cells.view(np.uint32)[..., 0]
+        words *= (words & ALPHA_BITS) != 0
+    return cells
+
+
+@lru_cache(maxsize=16)
+def pair_tables(lut):
+    # 65536 entry tables looking up two channels at once, (R, G) and
+    # (B, A) of RGBA cells seen as uint16s, the second keeping alpha
+    pairs = np.arange(65536, dtype=np.uint16).view(np.uint8).reshape(-1, 2)
+    lut = np.frombuffer(lut, dtype=np.uint8)
+    color = lut[pairs]
+    blue = color.copy()
+    blue[:, 1] = pairs[:, 1]
+    return color.view(np.uint16)[:, 0], blue.view(np.uint16)[:, 0]
+
+
+def color_lut(cells, lut):
+    # RGB channels looked up in a 256 entry table, alpha kept
+    if cells.shape[-1] == 3:
+        return lut.take(cells)
+    color, blue = pair_tables(lut.tobytes())
+    pairs = np.ascontiguousarray(cells).view(np.uint16)
+    out = np.empty_like(pairs)
+    out[..., 0] = color.take(pairs[..., 0])
+    out[..., 1] = blue.take(pairs[..., 1])
+    return clear_transparent(out.view(np.uint8))
+
+
+def invert(cells):
+    return color_lut(cells, np.arange(255, -1, -1, dtype=np.uint8))
+
+
+def grayscale(cells):
+    # Rec. 601 luma in 8 bit fixed point, the weights add up to 256
+    rgb = cells[..., :3].astype(np.uint16)
+    luma = ((rgb[..., 0] * 77 + rgb[..., 1] * 150 + rgb[..., 2] * 29 + 128) >> 8).astype(np.uint8)
+    if cells.shape[-1] == 3:
+        return np.repeat(luma[..., None], 3, axis=2)
+    words = np.ascontiguousarray(cells).view(np.uint32)[..., 0]
+    out = luma.astype(np.uint32) * GRAY_BITS | words & ALPHA_BITS
+    return clear_transparent(out.view(np.uint8).reshape(cells.shape))
+
+
+def posterize(cells, levels=FILTER_POSTERIZE_LEVELS):
+    # Each channel keeps `levels` evenly spaced values
+    if type(levels) is not int or not 2 <= levels <= 256:
+        raise ValueError("levels must be an integer from 2 to 256")
+    steps = np.round(np.arange(256) * ((levels - 1) / 255))
+    return color_lut(cells, np.round(steps * (255 / (levels - 1))).astype(np.uint8))
+
+
+def brightness_contrast(cells, brightness=FILTER_BRIGHTNESS, contrast=FILTER_CONTRAST):
+    # Contrast scales the distance from mid grey, brightness is then added
+    if not -255 <= brightness <= 255 or not contrast >= 0:
+        raise ValueError("brightness must be from -255 to 255 and contrast at least 0")
+    values = (np.arange(256) - 128) * contrast + 128 + brightness
+    return color_lut(cells, np.clip(np.round(values), 0, 255).astype(np.uint8))
+
+
+def blur_weights(radius):
+    if type(radius) is not int or radius < 1:
+        raise ValueError("radius must be a positive integer")
+    return np.full(2 * radius + 1, 1 / (2 * radius + 1), dtype=np.float32)
+
+
+def gaussian_weights(sigma):
+    if not sigma > 0:
+        raise ValueError("sigma must be above 0")
+    steps = np.arange(-math.ceil(3 * sigma), math.ceil(3 * sigma) + 1)
+    weights = np.exp(-steps ** 2 / (2 * sigma * sigma))
+    return (weights / weights.sum()).astype(np.float32)
+
+
+def convolve(planes, weights):
+    # Separable blur of float32 (channels, rows, cols) planes with
+    # symmetric weights, down the columns then along the rows. Cells past
+    # the edges repeat the edge ones
+    reach = len(weights) // 2
+    weights = weights.tolist()
+    rows, cols = planes.shape[1:]
+    padded = np.pad(planes, ((0, 0), (reach, reach), (0, 0)), mode='edge')
+    planes = padded[:, reach:reach + rows] * weights[reach]
+    scratch = np.empty_like(planes)
+    for k in range(1, reach + 1):
+        # Cells k either side have the same weight, they're added first
+        np.add(padded[:, reach - k:reach - k + rows], padded[:, reach + k:reach + k + rows], out=scratch)
+        scratch *= weights[reach + k]
+        planes += scratch
+    padded = np.pad(planes, ((0, 0), (0, 0), (reach, reach)), mode='edge')
+    planes = padded[:, :, reach:reach + cols] * weights[reach]
+    for k in range(1, reach + 1):
+        np.add(padded[:, :, reach - k:reach - k + cols], padded[:, :, reach + k:reach + k + cols], out=scratch)
+        scratch *= weights[reach + k]
+        planes += scratch
+    return planes
+
+
+def blur_cells(cells, weights):
+    # Blurred in planes, one channel each, which numpy runs through faster
+    planes = cells.transpose(2, 0, 1).astype(np.float32)
+    if cells.shape[-1] == 4:
+        # Colours are weighed by their alpha, as the layer composite does
+        planes[:3] *= planes[3] * np.float32(1 / 255)
+        planes = convolve(planes, weights)
+        alpha = planes[3]
+        planes[:3] *= np.divide(255, alpha, out=np.zeros_like(alpha), where=alpha > 0)
+    else:
+        planes = convolve(planes, weights)
+    planes += 0.5
+    np.minimum(planes, 255, out=planes)
+    out = np.ascontiguousarray(planes.astype(np.uint8).transpose(1, 2, 0))
+    return clear_transparent(out)
+
+
+def box_blur(cells, radius=FILTER_BLUR_RADIUS):
+    return blur_cells(cells, blur_weights(radius))
+
+
+def gaussian_blur(cells, sigma=FILTER_BLUR_SIGMA):
+    return blur_cells(cells, gaussian_weights(sigma))
+
+
+FILTERS = {
+    # Name -> (function of the cells and keyword settings, and for blurs
+    # how many cells out a result depends on for those settings)
+    'invert': (invert, None),
+    'grayscale': (grayscale, None),
+    'posterize': (posterize, None),
+    'brightness_contrast': (brightness_contrast, None),
+    'blur': (box_blur, lambda radius=FILTER_BLUR_RADIUS: radius),
+    'gaussian_blur': (gaussian_blur, lambda sigma=FILTER_BLUR_SIGMA: math.ceil(3 * sigma)),
+}
+
+
+def filter_reach(name, settings):
+    # Checks the filter and its settings on one cell, returns how far it
+    # reaches. Raises ValueError on anything off
+    if not isinstance(name, str) or name not in FILTERS:
+        raise ValueError(f"unknown filter {name!r}")
+    function, reach = FILTERS[name]
+    try:
+        function(np.zeros((1, 1, 4), dtype=np.uint8), **settings)
+    except TypeError as e:
+        raise ValueError(f"bad settings for {name}: {e}") from None
+    return reach(**settings) if reach is not None else 0
+
+
+@lru_cache(maxsize=None)
+def filter_pool(workers):
+    # Threads are kept for the next filter
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='filter')
+
+
+def filter_tiles(grid, reach, tile_size):
+    # (row0, col0, row1, col1) tiles holding everything painted and the
+    # cells a blur spreads it to
+    keys = set()
+    for row0, col0, row1, col1 in grid.painted_rects():
+        row0, col0 = max(row0 - reach, 0) // tile_size, max(col0 - reach, 0) // tile_size
+        row1 = (min(row1 + reach, grid.rows) - 1) // tile_size
+        col1 = (min(col1 + reach, grid.cols) - 1) // tile_size
+        keys.update((row, col) for row in range(row0, row1 + 1) for col in range(col0, col1 + 1))
+    return [(row * tile_size, col * tile_size,
+             min((row + 1) * tile_size, grid.rows), min((col + 1) * tile_size, grid.cols))
+            for row, col in sorted(keys)]
+
+
+def apply_filter(grid, name, workers=FILTER_WORKERS, tile_size=FILTER_TILE_SIZE, **settings):
+    # Filters everything painted on grid. Returns the rects it rewrote
+    reach = filter_reach(name, settings)
+    function = FILTERS[name][0]
+    # An indexed grid has PALETTE_ENTRIES colours. A colour filter turns
+    # each one into one colour, the new ones taking free entries, so it
+    # runs when they fit. A blur makes in-between colours everywhere
+    palette = getattr(grid, 'palette', None)
+    if palette is not None:
+        if reach:
+            raise ValueError(f"{name} makes more colours than an indexed layer can hold")
+        if not grid.has_room_for(function(palette[None, :grid.palette_size], **settings)):
+            raise ValueError(f"{name} needs more colours than are left in the layer's palette")
+    tiles = filter_tiles(grid, reach, tile_size)
+    # All reads come before any write, a blur sees the cells as they were
+    sources = []
+    for row0, col0, row1, col1 in tiles:
+        top, left = max(row0 - reach, 0), max(col0 - reach, 0)
+        bottom, right = min(row1 + reach, grid.rows), min(col1 + reach, grid.cols)
+        sources.append((grid.read_region(top, left, bottom, right), row0 - top, col0 - left, row1 - row0, col1 - col0))
+
+    def run(source):
+        cells, row, col, height, width = source
+        color = uniform_color(cells)
+        if color is not None:
+            color = function(cells[:1, :1], **settings)[0, 0].tolist()
+            return uniform_block(tuple(color), (height, width, cells.shape[2]))
+        return function(cells, **settings)[row:row + height, col:col + width]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tiles) == 1:
+        results = map(run, sources)
+    else:
+        results = filter_pool(workers).map(run, sources)
+    for (row0, col0, _, _), cells in zip(tiles, results):
+        grid.write_region(row0, col0, cells)
+    return tiles
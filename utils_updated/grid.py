@@ -1,31 +1,123 @@
 # utils/grid.py
 
 import pygame
+import numpy as np
+from functools import lru_cache
 from .settings import *
-from collections import deque
+from .fill import scanline_fill, color_distance_sq
+from .stroke import polyline_spans
+from .brush import SoftStroke
+
+
+@lru_cache(maxsize=256)
+def uniform_block(color, shape):
+    # Read-only (rows, cols, channels) view of a single colour, costs no memory per cell
+    return np.broadcast_to(np.array(color, dtype=np.uint8), shape)
+
+
+def uniform_color(block):
+    # Colour of a block made by uniform_block, as TiledGrid.read_region
+    # returns for untouched or filled tiles, else None
+    if block.strides[:2] == (0, 0):
+        return tuple(block[0, 0].tolist())
+    return None
+
 
 class Grid:
     def __init__(self, rows, cols, color):
         self.rows = rows
         self.cols = cols
         self.color = color
+        # Callbacks taking (row0, col0, row1, col1), called just before
+        # the cells in that region change
+        self.listeners = []
         self.grid = self.init_grid()
 
     def init_grid(self):
         return [[self.color for _ in range(self.cols)] for _ in range(self.rows)]
 
     def clear(self):
+        self.mark_all_dirty()
         self.grid = self.init_grid()
 
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def mark_dirty(self, row0, col0, row1, col1):
+        # Rectangles are half-open and clipped to the canvas
+        row0, col0 = max(row0, 0), max(col0, 0)
+        row1, col1 = min(row1, self.rows), min(col1, self.cols)
+        if row0 < row1 and col0 < col1:
+            for callback in self.listeners:
+                callback(row0, col0, row1, col1)
+
+    def mark_all_dirty(self):
+        self.mark_dirty(0, 0, self.rows, self.cols)
+
     def set_cell_color(self, row, col, color):
         if 0 <= row < self.rows and 0 <= col < self.cols:
+            self.mark_dirty(row, col, row + 1, col + 1)
             self.grid[row][col] = color
 
+    def get_cell_color(self, row, col):
+        return tuple(self.grid[row][col])
+
+    def snapshot(self):
+        # Copy of the canvas that can later be handed back to restore()
+        return [row.copy() for row in self.grid]
+
+    def restore(self, state):
+        self.mark_all_dirty()
+        self.grid = [row.copy() for row in state]
+
+    def read_region(self, row0, col0, row1, col1):
+        # Copy of a block of cells as a (rows, cols, channels) uint8 array,
+        # channels being 3 for RGB and 4 for RGBA cells
+        cells = [row[col0:col1] for row in self.grid[row0:row1]]
+        return np.array(cells, dtype=np.uint8).reshape(row1 - row0, col1 - col0, len(self.color))
+
+    def write_region(self, row0, col0, block):
+        # Counterpart of read_region, the block must lie inside the canvas
+        row1, col1 = row0 + block.shape[0], col0 + block.shape[1]
+        self.mark_dirty(row0, col0, row1, col1)
+        for row, cells in zip(range(row0, row1), block.tolist()):
+            self.grid[row][col0:col1] = [tuple(cell) for cell in cells]
+
+    def read_cells(self, row0, col0, row1, col1):
+        # Block of cells in the form the grid keeps them, for undo. Colours
+        # as read_region returns them, unless the backend stores less
+        return self.read_region(row0, col0, row1, col1)
+
+    def write_cells(self, row0, col0, block):
+        # Counterpart of read_cells
+        self.write_region(row0, col0, block)
+
+    def painted_bounds(self):
+        # (row0, col0, row1, col1) holding everything painted, None if blank
+        return 0, 0, self.rows, self.cols
+
+    def painted_rects(self):
+        # Regions that together hold everything painted
+        return [(0, 0, self.rows, self.cols)]
+
+    def painted_blocks(self):
+        # (row0, col0, cells) blocks that together rebuild the canvas on top
+        # of a cleared one
+        for row0, col0, row1, col1 in self.painted_rects():
+            yield row0, col0, self.read_region(row0, col0, row1, col1)
+
     def set_cell_color_circle(self, center_pos, radius, color):
         center_x, center_y = center_pos
         center_row = center_y // PIXEL_SIZE
         center_col = center_x // PIXEL_SIZE
         pix_radius = int(radius // PIXEL_SIZE) + 1
+        self.mark_dirty(
+            center_row - pix_radius, center_col - pix_radius,
+            center_row + pix_radius + 1, center_col + pix_radius + 1,
+        )
 
         for row in range(center_row - pix_radius, center_row + pix_radius + 1):
             for col in range(center_col - pix_radius, center_col + pix_radius + 1):
@@ -36,54 +128,61 @@ class Grid:
                     dy = y - center_y
                     distance = (dx * dx + dy * dy) ** 0.5
                     if distance <= radius:
-                        self.set_cell_color(row, col, color)
+                        self.grid[row][col] = color
 
     def set_cell_color_line(self, pos1, pos2, brush_size, color):
-        x1, y1 = pos1
-        x2, y2 = pos2
-        dx = x2 - x1
-        dy = y2 - y1
-        distance = max(abs(dx), abs(dy))
-        steps = int(distance * 2) + 1  # Increase steps for smoother lines
-
-        for i in range(steps):
-            t = i / steps if steps != 0 else 0
-            x = int(x1 + dx * t)
-            y = int(y1 + dy * t)
-            self.set_cell_color_circle((x, y), brush_size, color)
-
-    def flood_fill(self, pos, new_color):
+        self.set_cell_color_polyline([pos1, pos2], brush_size, color)
+
+    def set_cell_color_polyline(self, points, brush_sizes, color):
+        # brush_sizes is one size for the whole line or one per segment
+        spans = polyline_spans(points, brush_sizes, self.rows, self.cols)
+        if spans is None:
+            return
+        self.fill_spans(*spans, color)
+
+    def fill_spans(self, row0, lefts, rights, color):
+        # Part k covers [lefts[k, i], rights[k, i]) on row row0 + i, as
+        # polyline_spans returns them for segments
+        self.mark_dirty(row0, int(lefts.min()), row0 + lefts.shape[1], int(rights.max()))
+        for segment_lefts, segment_rights in zip(lefts.tolist(), rights.tolist()):
+            for row, left, right in zip(range(row0, row0 + len(segment_lefts)), segment_lefts, segment_rights):
+                if left < right:
+                    self.grid[row][left:right] = [color] * (right - left)
+
+    def soft_stroke(self, color):
+        # A stroke of the soft brush, painted a polyline at a time with add()
+        return SoftStroke(self, color)
+
+    def flood_fill(self, pos, new_color, tolerance=0, connectivity=4):
+        # Returns the bounding box of the filled cells, or None
         x, y = pos
         row = y // PIXEL_SIZE
         col = x // PIXEL_SIZE
 
         if not (0 <= row < self.rows and 0 <= col < self.cols):
-            return
+            return None
 
         target_color = self.grid[row][col]
-        if target_color == new_color:
-            return
-
-        queue = deque()
-        queue.append((row, col))
-        self.grid[row][col] = new_color
-
-        while queue:
-            current_row, current_col = queue.popleft()
-
-            # Check all four directions
-            neighbors = [
-                (current_row - 1, current_col),  # Up
-                (current_row + 1, current_col),  # Down
-                (current_row, current_col - 1),  # Left
-                (current_row, current_col + 1)   # Right
-            ]
-
-            for n_row, n_col in neighbors:
-                if 0 <= n_row < self.rows and 0 <= n_col < self.cols:
-                    if self.grid[n_row][n_col] == target_color:
-                        self.grid[n_row][n_col] = new_color
-                        queue.append((n_row, n_col))
+        if tolerance == 0:
+            if target_color == new_color:
+                return None
+
+            def open_row(n_row):
+                return bytearray(color == target_color for color in self.grid[n_row])
+        else:
+            limit = tolerance * tolerance
+
+            def open_row(n_row):
+                return bytearray(color_distance_sq(color, target_color) <= limit for color in self.grid[n_row])
+
+        # Rows are compared to the target as the fill reaches them
+        rects, bbox = scanline_fill([None] * self.rows, row, col, connectivity, open_row)
+        self.mark_dirty(*bbox)
+        for row0, col0, row1, col1 in rects:
+            cells = [new_color] * (col1 - col0)
+            for line in self.grid[row0:row1]:
+                line[col0:col1] = cells
+        return bbox
 
     def draw(self, win):
         for i, row in enumerate(self.grid):
@@ -93,6 +192,9 @@ class Grid:
                     color,
                     (j * PIXEL_SIZE, i * PIXEL_SIZE, PIXEL_SIZE, PIXEL_SIZE),
                 )
+        self.draw_grid_lines(win)
+
+    def draw_grid_lines(self, win):
         # Draw grid lines if enabled
         if DRAW_GRID_LINES:
             for i in range(self.rows + 1):
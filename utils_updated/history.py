@@ -0,0 +1,152 @@
+# utils/history.py
+
+import zlib
+import numpy as np
+from collections import deque
+from .settings import HISTORY_BUDGET, HISTORY_TILE_SIZE
+from .grid import uniform_block, uniform_color
+
+
+def same_cells(block_a, block_b):
+    color_a, color_b = uniform_color(block_a), uniform_color(block_b)
+    if color_a is not None and color_b is not None:
+        return color_a == color_b
+    return np.array_equal(block_a, block_b)
+
+
+class HistoryStep:
+    def __init__(self, rects, shapes, data, colors):
+        self.rects = rects    # (row0, col0, row1, col1) of every stored tile
+        self.shapes = shapes  # Array shape of every stored tile
+        self.data = data      # zlib compressed cells of all tiles, in order
+        self.colors = colors  # Single colour of a tile (kept out of data) or None
+        self.nbytes = len(data) + 64 * len(rects)
+
+
+class History:
+    def __init__(self, grid, budget=HISTORY_BUDGET, tile_size=HISTORY_TILE_SIZE):
+        self.grid = grid
+        self.budget = budget  # Bytes kept across undo and redo steps
+        # A tiled grid is recorded tile for tile
+        self.tile_size = getattr(grid, 'tile_size', tile_size)
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.nbytes = 0
+        # Tiles touched since the last commit, with their cells from before the change
+        self.pending = {}
+        self.recording = True
+        grid.add_listener(self.on_change)
+
+    def tile_rect(self, tile_row, tile_col):
+        size = self.tile_size
+        return (
+            tile_row * size,
+            tile_col * size,
+            min((tile_row + 1) * size, self.grid.rows),
+            min((tile_col + 1) * size, self.grid.cols),
+        )
+
+    def on_change(self, row0, col0, row1, col1):
+        # Grid listeners run before the cells change, so this is the old
+        # content. Kept as the grid stores it (see Grid.read_cells)
+        if not self.recording:
+            return
+        size = self.tile_size
+        for tile_row in range(row0 // size, (row1 - 1) // size + 1):
+            for tile_col in range(col0 // size, (col1 - 1) // size + 1):
+                key = (tile_row, tile_col)
+                if key not in self.pending:
+                    self.pending[key] = self.grid.read_cells(*self.tile_rect(tile_row, tile_col))
+
+    def pack(self, rects, blocks):
+        colors = [uniform_color(block) for block in blocks]
+        data = zlib.compress(b''.join(
+            block.tobytes() for block, color in zip(blocks, colors) if color is None
+        ), 1)
+        return HistoryStep(rects, [block.shape for block in blocks], data, colors)
+
+    def unpack(self, step):
+        buffer = np.frombuffer(zlib.decompress(step.data), dtype=np.uint8)
+        offset = 0
+        for shape, color in zip(step.shapes, step.colors):
+            if color is not None:
+                yield uniform_block(color, shape)
+                continue
+            size = int(np.prod(shape))
+            yield buffer[offset:offset + size].reshape(shape)
+            offset += size
+
+    def commit(self):
+        # Close the current operation, returns True if it changed anything
+        if not self.pending:
+            return False
+        rects, blocks = [], []
+        for key, before in self.pending.items():
+            rect = self.tile_rect(*key)
+            if not same_cells(before, self.grid.read_cells(*rect)):
+                rects.append(rect)
+                blocks.append(before)
+        self.pending = {}
+        if not rects:
+            return False
+
+        # A new action makes the redo steps unreachable
+        for step in self.redo_stack:
+            self.nbytes -= step.nbytes
+        self.redo_stack.clear()
+        self.push(self.undo_stack, self.pack(rects, blocks))
+        self.trim()
+        return True
+
+    def push(self, stack, step):
+        stack.append(step)
+        self.nbytes += step.nbytes
+
+    def trim(self):
+        # Drop the oldest steps once over budget, always keeping the newest one
+        while self.nbytes > self.budget and len(self.undo_stack) > 1:
+            self.nbytes -= self.undo_stack.popleft().nbytes
+
+    def apply(self, step):
+        # Writes a step back into the grid, returns the step that reverses it
+        self.recording = False
+        try:
+            current = []
+            for rect, block in zip(step.rects, self.unpack(step)):
+                current.append(self.grid.read_cells(*rect))
+                self.grid.write_cells(rect[0], rect[1], block)
+        finally:
+            self.recording = True
+        return self.pack(step.rects, current)
+
+    def undo(self):
+        # Returns the rects it rewrote, or None if there was nothing to undo
+        self.commit()
+        if not self.undo_stack:
+            return None
+        step = self.undo_stack.pop()
+        self.nbytes -= step.nbytes
+        self.push(self.redo_stack, self.apply(step))
+        return step.rects
+
+    def redo(self):
+        self.commit()
+        if not self.redo_stack:
+            return None
+        step = self.redo_stack.pop()
+        self.nbytes -= step.nbytes
+        self.push(self.undo_stack, self.apply(step))
+        self.trim()
+        return step.rects
+
+    def can_undo(self):
+        return bool(self.undo_stack or self.pending)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def reset(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.pending = {}
+        self.nbytes = 0
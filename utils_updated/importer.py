@@ -0,0 +1,82 @@
+# utils/importer.py
+
+import math
+import numpy as np
+import pygame
+from .settings import *
+
+SNAP_CHUNK = 65536  # Cells compared against the palette at a time, bounds the distance table
+
+
+def load_image(path):
+    # (height, width, 3) uint8 view of an image file pygame can read. The
+    # view keeps the decoded surface alive, nothing is copied
+    surface = pygame.image.load(path)
+    if surface.get_bitsize() not in (24, 32):
+        # Palette images have no 3d pixel view
+        converted = pygame.Surface(surface.get_size(), 0, 32)
+        converted.blit(surface, (0, 0))
+        surface = converted
+    return pygame.surfarray.pixels3d(surface).swapaxes(0, 1)  # surfarray is (x, y)
+
+
+def block_size(height, width, rows, cols, scale=PIXEL_SIZE):
+    # Pixels per cell side. scale, which brings a saved image back at the
+    # size it was painted, or more for an image too big to fit otherwise
+    return max(scale, math.ceil(height / rows), math.ceil(width / cols))
+
+
+def downsample(pixels, block, sampling=IMPORT_SAMPLING):
+    # One cell per block x block pixels, the blocks on the right and bottom
+    # edges can be partial. 'average' blends a block, 'nearest' takes its
+    # middle pixel
+    height, width = pixels.shape[:2]
+    if sampling == 'nearest':
+        ys = np.minimum(np.arange(0, height, block) + block // 2, height - 1)
+        xs = np.minimum(np.arange(0, width, block) + block // 2, width - 1)
+        return pixels[ys[:, None], xs]
+    if sampling != 'average':
+        raise ValueError(f"Unknown sampling: {sampling}")
+    ys = np.arange(0, height, block)
+    xs = np.arange(0, width, block)
+    # Summed one pixel row of every block at a time, then one column,
+    # block strided slices each. Far faster than np.add.reduceat
+    rows = np.zeros((len(ys), width, 3), dtype=np.uint16 if block * 255 < 2 ** 16 else np.uint32)
+    for i in range(min(block, height)):
+        part = pixels[i::block]
+        rows[:len(part)] += part
+    sums = np.zeros((len(ys), len(xs), 3), dtype=np.uint32)
+    for i in range(min(block, width)):
+        part = rows[:, i::block]
+        sums[:, :part.shape[1]] += part
+    counts = (np.minimum(height - ys, block)[:, None] * np.minimum(width - xs, block))[..., None]
+    return ((sums + counts // 2) // counts).astype(np.uint8)
+
+
+def snap_to_palette(cells, palette):
+    # Every cell -> the nearest palette colour by RGB distance
+    palette = np.array(palette, dtype=np.int32)
+    flat = cells.reshape(-1, 3)
+    snapped = np.empty_like(flat)
+    for start in range(0, len(flat), SNAP_CHUNK):
+        chunk = flat[start:start + SNAP_CHUNK].astype(np.int32)
+        distances = ((chunk[:, None, :] - palette[None]) ** 2).sum(axis=2)
+        snapped[start:start + SNAP_CHUNK] = palette[distances.argmin(axis=1)]
+    return snapped.reshape(cells.shape)
+
+
+def import_image(grid, path, palette=None, sampling=IMPORT_SAMPLING, row0=0, col0=0, scale=PIXEL_SIZE):
+    # Paints an image file into grid with its top-left corner at (row0,
+    # col0), in one write_region. palette snaps the colours to its own.
+    # Returns the (row0, col0, row1, col1) written
+    pixels = load_image(path)
+    rows, cols = grid.rows - row0, grid.cols - col0
+    cells = downsample(pixels, block_size(*pixels.shape[:2], rows, cols, scale), sampling)
+    del pixels  # Unlocks the surface
+    if palette:
+        cells = snap_to_palette(cells, palette)
+    if len(grid.color) == 4:
+        # Layer cells, imported opaque
+        cells = np.concatenate([cells, np.full(cells.shape[:2] + (1,), 255, dtype=np.uint8)], axis=2)
+    grid.write_region(row0, col0, cells)
+    return (row0, col0, row0 + cells.shape[0], col0 + cells.shape[1])
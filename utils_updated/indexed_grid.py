@@ -0,0 +1,174 @@
+# utils/indexed_grid.py
+
+import pygame
+import numpy as np
+from .settings import *
+from .grid import uniform_color
+from .array_grid import ArrayGrid
+
+# Grid keeping one uint8 palette index per cell and the colours in a
+# lookup table, a third of the memory of RGB cells (a quarter of RGBA).
+# The app paints with a handful of toolbar colours, so a palette fits.
+#
+# Colours go in and come out as they do for the other backends: a colour
+# new to the grid takes the next free entry, read_region looks the cells
+# up in the palette. Fill compares indices, undo stores them (read_cells)
+# and recolouring an entry changes every cell holding it without touching
+# the cells. No two entries hold the same colour. Entries are never
+# freed, as undo steps may still point at them, once all are taken a new
+# colour gets the nearest one.
+
+PALETTE_ENTRIES = 256  # What a uint8 index can address
+
+
+def color_keys(cells):
+    # (rows, cols, channels) colours -> one uint32 per cell
+    keys = np.zeros(cells.shape[:2], dtype=np.uint32)
+    for channel in range(cells.shape[2]):
+        keys |= cells[:, :, channel].astype(np.uint32) << (8 * channel)
+    return keys
+
+
+class IndexedGrid(ArrayGrid):
+    def init_grid(self):
+        self.palette = np.zeros((PALETTE_ENTRIES, len(self.color)), dtype=np.uint8)
+        self.palette_size = 0
+        self.lookup = {}  # Colour -> palette index
+        return np.full((self.rows, self.cols), self.index_of(self.color), dtype=np.uint8)
+
+    def index_of(self, color):
+        # Palette index for a colour, adding it when there is room
+        color = tuple(int(channel) for channel in color)
+        index = self.lookup.get(color)
+        if index is not None:
+            return index
+        if self.palette_size == PALETTE_ENTRIES:
+            distances = ((self.palette.astype(np.int32) - color) ** 2).sum(axis=1)
+            return int(distances.argmin())
+        index = self.palette_size
+        self.palette[index] = color
+        self.palette_size += 1
+        self.lookup[color] = index
+        return index
+
+    def indices_of(self, cells):
+        # (rows, cols, channels) colours -> (rows, cols) palette indices
+        color = uniform_color(cells)
+        if color is not None:
+            return np.full(cells.shape[:2], self.index_of(color), dtype=np.uint8)
+        # Each distinct colour is looked up once
+        _, first, inverse = np.unique(color_keys(cells), return_index=True, return_inverse=True)
+        colors = cells.reshape(-1, cells.shape[2])[first].tolist()
+        table = np.array([self.index_of(color) for color in colors], dtype=np.uint8)
+        return table[inverse].reshape(cells.shape[:2])
+
+    def has_room_for(self, cells):
+        # Whether every colour in cells has an entry, or a free one to take
+        known = color_keys(self.palette[None, :self.palette_size])[0]
+        new = np.setdiff1d(color_keys(cells), known)
+        return len(new) <= PALETTE_ENTRIES - self.palette_size
+
+    def clear(self):
+        self.mark_all_dirty()
+        self.grid[...] = self.index_of(self.color)
+
+    def set_cell_color(self, row, col, color):
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            self.mark_dirty(row, col, row + 1, col + 1)
+            self.grid[row, col] = self.index_of(color)
+
+    def get_cell_color(self, row, col):
+        return tuple(int(v) for v in self.palette[self.grid[row, col]])
+
+    def snapshot(self):
+        return self.grid.copy(), self.palette.copy(), self.palette_size
+
+    def restore(self, state):
+        self.mark_all_dirty()
+        grid, palette, palette_size = state
+        np.copyto(self.grid, grid)
+        np.copyto(self.palette, palette)
+        self.palette_size = palette_size
+        self.lookup = {tuple(color): index for index, color in enumerate(palette[:palette_size].tolist())}
+
+    def read_region(self, row0, col0, row1, col1):
+        return self.palette[self.grid[row0:row1, col0:col1]]
+
+    def write_region(self, row0, col0, block):
+        row1, col1 = row0 + block.shape[0], col0 + block.shape[1]
+        self.mark_dirty(row0, col0, row1, col1)
+        self.grid[row0:row1, col0:col1] = self.indices_of(block)
+
+    def read_cells(self, row0, col0, row1, col1):
+        # The indices, as a single channel
+        return self.grid[row0:row1, col0:col1, None].copy()
+
+    def write_cells(self, row0, col0, block):
+        row1, col1 = row0 + block.shape[0], col0 + block.shape[1]
+        self.mark_dirty(row0, col0, row1, col1)
+        self.grid[row0:row1, col0:col1] = block[:, :, 0]
+
+    def paint_mask(self, row0, col0, mask, color):
+        super().paint_mask(row0, col0, mask, self.index_of(color))
+
+    def flood_fill(self, pos, new_color, tolerance=0, connectivity=4):
+        x, y = pos
+        row = y // PIXEL_SIZE
+        col = x // PIXEL_SIZE
+
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None
+
+        target = self.grid[row, col]
+        new_index = self.index_of(new_color)
+        if tolerance == 0:
+            if target == new_index:
+                return None
+
+            def match_row(n_row):
+                return self.grid[n_row] == target
+        else:
+            # The distance test runs once per palette entry, not per cell
+            diff = self.palette[:self.palette_size].astype(np.int32) - self.palette[target]
+            near = np.einsum('ij,ij->i', diff, diff) <= tolerance * tolerance
+
+            def match_row(n_row):
+                return near[self.grid[n_row]]
+        return self.fill_matches(match_row, row, col, connectivity, new_index)
+
+    def set_palette_color(self, index, color):
+        # Every cell holding the entry takes the colour
+        color = tuple(int(channel) for channel in color)
+        other = self.lookup.get(color)
+        if other == index:
+            return
+        if other is not None:
+            # Another entry has the colour already, its cells move over to it
+            matches = self.grid == index
+            rows = np.flatnonzero(matches.any(axis=1))
+            if len(rows):
+                cols = np.flatnonzero(matches.any(axis=0))
+                self.mark_dirty(int(rows[0]), int(cols[0]), int(rows[-1]) + 1, int(cols[-1]) + 1)
+                self.grid[matches] = other
+            return
+        # Only the palette changes, which changes what every cell may show
+        self.mark_all_dirty()
+        del self.lookup[tuple(self.palette[index].tolist())]
+        self.palette[index] = color
+        self.lookup[color] = index
+
+    def replace_color(self, old_color, new_color):
+        # Recolours every cell of old_color, returns False if the palette
+        # doesn't have it
+        index = self.lookup.get(tuple(int(channel) for channel in old_color))
+        if index is None:
+            return False
+        self.set_palette_color(index, new_color)
+        return True
+
+    def draw(self, win):
+        # An 8 bit surface, SDL looks the colours up in its palette
+        surface = pygame.surfarray.make_surface(self.grid.swapaxes(0, 1))
+        surface.set_palette([tuple(color[:3]) for color in self.palette.tolist()])
+        win.blit(pygame.transform.scale(surface, (self.cols * PIXEL_SIZE, self.rows * PIXEL_SIZE)), (0, 0))
+        self.draw_grid_lines(win)
@@ -0,0 +1,482 @@
+# utils/journal.py
+
+import os
+import zlib
+import queue
+import time
+import struct
+import threading
+import numpy as np
+from .settings import JOURNAL_CHECKPOINT_EVERY, JOURNAL_FLUSH_INTERVAL, JOURNAL_TILE_SIZE
+from .grid import uniform_block, uniform_color
+from .layers import pack_layer_state, unpack_layer_state
+from .project import Project
+from .shapes import SHAPES, shape_spans
+
+# Append-only log of committed canvas operations, used to rebuild the
+# canvas after a crash. The UI thread only queues plain Python objects;
+# packing, compression, writes and fsync all happen on a writer thread.
+#
+# File layout: a header, then records of
+#   kind (uint8) | payload length (uint32) | payload | crc32 (uint32)
+# A record that fails its length or CRC check ends the replay, which is
+# what a write cut short by a crash looks like. A checkpoint may name a
+# project file as its base and then only holds the tiles changed since
+# that file was saved. Checkpoints and layer records carry the layer
+# state (see LayerStack.layer_state), the canvas is a plain grid when
+# there are no layers in it. The UI thread only reads the tiles changed
+# since the last checkpoint, the writer keeps every block of the last one
+# packed and writes them all with the new ones. Soft brush strokes are stored as hard ones
+# are, each one whole, and replayed as one SoftStroke. Shapes are stored
+# as the drag that made them.
+
+MAGIC = b'PAINTJNL'
+VERSION = 7
+HEADER = struct.Struct('<8sHII')  # magic, version, rows, cols
+RECORD = struct.Struct('<BI')
+CRC = struct.Struct('<I')
+BLOCK = struct.Struct('<IIIIBB')  # row0, col0, height, width, channels, uniform (then its colour)
+SHAPE_DRAG = struct.Struct('<B?iiiif')  # index in SHAPES, filled, start, end, brush size (then the colour)
+
+STROKE, FILL, CLEAR, PATCH, CHECKPOINT, LAYER_ADD, LAYER_REMOVE, LAYER_STATE, SOFT_STROKE, SHAPE = range(1, 11)
+
+
+def pack_color(color):
+    # RGB or RGBA, prefixed with the number of channels
+    return bytes([len(color)]) + bytes(int(channel) for channel in color)
+
+
+def unpack_color(payload, offset):
+    # Returns the colour and the offset after it
+    end = offset + 1 + payload[offset]
+    return tuple(payload[offset + 1:end]), end
+
+
+def pack_block(row0, col0, cells):
+    # Its shape, then the colour of a single colour block or the cells as
+    # a zlib stream of their own
+    color = uniform_color(cells)
+    head = BLOCK.pack(row0, col0, cells.shape[0], cells.shape[1], cells.shape[2], color is not None)
+    if color is not None:
+        return head + bytes(color)
+    data = zlib.compress(np.ascontiguousarray(cells).tobytes(), 1)
+    return head + struct.pack('<I', len(data)) + data
+
+
+def pack_blocks(blocks):
+    # (row0, col0, cells) blocks as a count and the blocks
+    return join_blocks([pack_block(*block) for block in blocks])
+
+
+def join_blocks(packed):
+    # Blocks packed by pack_block as pack_blocks stores them
+    return struct.pack('<I', len(packed)) + b''.join(packed)
+
+
+def unpack_blocks(payload, offset=0):
+    count, = struct.unpack_from('<I', payload, offset)
+    offset += 4
+    blocks = []
+    for _ in range(count):
+        row0, col0, height, width, channels, uniform = BLOCK.unpack_from(payload, offset)
+        offset += BLOCK.size
+        shape = (height, width, channels)
+        if uniform:
+            blocks.append((row0, col0, uniform_block(tuple(payload[offset:offset + channels]), shape)))
+            offset += channels
+            continue
+        length, = struct.unpack_from('<I', payload, offset)
+        offset += 4
+        data = zlib.decompress(payload[offset:offset + length])
+        blocks.append((row0, col0, np.frombuffer(data, dtype=np.uint8).reshape(shape)))
+        offset += length
+    return blocks
+
+
+def encode(kind, data):
+    if kind in (STROKE, SOFT_STROKE):
+        points, sizes, color = data
+        payload = (
+            pack_color(color)
+            + struct.pack('<I', len(points))
+            + np.asarray(points, dtype='<i4').tobytes()
+            + np.asarray(sizes, dtype='<f4').tobytes()
+        )
+    elif kind == FILL:
+        pos, color, tolerance, connectivity = data
+        payload = struct.pack('<ii', *pos) + pack_color(color) + struct.pack('<HB', tolerance, connectivity)
+    elif kind == SHAPE:
+        shape, start, end, brush_size, filled, color = data
+        payload = SHAPE_DRAG.pack(SHAPES.index(shape), filled, *start, *end, brush_size) + pack_color(color)
+    elif kind == CLEAR:
+        payload = b''
+    elif kind in (LAYER_ADD, LAYER_REMOVE):
+        payload = struct.pack('<H', data)
+    elif kind == LAYER_STATE:
+        payload = pack_layer_state(data)
+    elif kind == CHECKPOINT:
+        base, state, packed = data  # Blocks packed already, see Journal.merge
+        base = base.encode()
+        payload = struct.pack('<H', len(base)) + base + pack_layer_state(state) + join_blocks(packed)
+    else:
+        payload = pack_blocks(data)
+    head = RECORD.pack(kind, len(payload))
+    return head + payload + CRC.pack(zlib.crc32(head + payload))
+
+
+def read_journal(path):
+    # Returns (rows, cols, records) with records as (kind, payload, end
+    # offset) for every intact record, or None for a foreign file
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return None
+    magic, version, rows, cols = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        return None
+
+    records = []
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        kind, length = RECORD.unpack_from(data, offset)
+        end = offset + RECORD.size + length
+        if end + CRC.size > len(data):
+            break
+        if zlib.crc32(data[offset:end]) != CRC.unpack_from(data, end)[0]:
+            break
+        records.append((kind, data[offset + RECORD.size:end], end + CRC.size))
+        offset = end + CRC.size
+    return rows, cols, records
+
+
+def replay(path, grid):
+    # Applies the journal to grid. Returns the offset just past the last
+    # intact record and the project the canvas was based on, or None if
+    # there is no journal for a grid of this size
+    if not os.path.exists(path):
+        return None
+    journal = read_journal(path)
+    if journal is None or journal[:2] != (grid.rows, grid.cols):
+        return None
+    valid_end = HEADER.size
+    project = None
+    for kind, payload, valid_end in journal[2]:
+        base = apply_record(grid, kind, payload)
+        if base is not None:
+            if project is not None and project is not base:
+                project.close()
+            project = base
+    return valid_end, project
+
+
+def apply_record(grid, kind, payload):
+    # Returns the project a checkpoint was based on, if it was
+    if kind in (STROKE, SOFT_STROKE):
+        color, offset = unpack_color(payload, 0)
+        count, = struct.unpack_from('<I', payload, offset)
+        points = np.frombuffer(payload, dtype='<i4', count=count * 2, offset=offset + 4).reshape(count, 2)
+        sizes = np.frombuffer(payload, dtype='<f4', offset=offset + 4 + count * 8)
+        points = [tuple(point) for point in points.tolist()]
+        if kind == SOFT_STROKE:
+            grid.soft_stroke(color).add(points, sizes.tolist())
+        else:
+            grid.set_cell_color_polyline(points, sizes.tolist(), color)
+    elif kind == FILL:
+        x, y = struct.unpack_from('<ii', payload)
+        color, offset = unpack_color(payload, 8)
+        tolerance, connectivity = struct.unpack_from('<HB', payload, offset)
+        grid.flood_fill((x, y), color, tolerance, connectivity)
+    elif kind == SHAPE:
+        shape, filled, x0, y0, x1, y1, brush_size = SHAPE_DRAG.unpack_from(payload)
+        color = unpack_color(payload, SHAPE_DRAG.size)[0]
+        spans = shape_spans(SHAPES[shape], (x0, y0), (x1, y1), brush_size, filled, grid.rows, grid.cols)
+        if spans is not None:
+            grid.fill_spans(*spans, color)
+    elif kind == CLEAR:
+        grid.clear()
+    elif kind == LAYER_ADD:
+        grid.add_layer(struct.unpack('<H', payload)[0])
+    elif kind == LAYER_REMOVE:
+        grid.remove_layer(struct.unpack('<H', payload)[0])
+    elif kind == LAYER_STATE:
+        grid.set_layer_state(unpack_layer_state(payload, 0)[0])
+    elif kind == PATCH:
+        for row0, col0, cells in unpack_blocks(payload):
+            grid.write_region(row0, col0, cells)
+    elif kind == CHECKPOINT:
+        length, = struct.unpack_from('<H', payload)
+        base = payload[2:2 + length].decode()
+        state, offset = unpack_layer_state(payload, 2 + length)
+        project = None
+        grid.clear()  # Blocks cover what is painted, the rest is background
+        if base:
+            try:
+                project = Project.open(base)
+                project.load_into(grid)
+            except (OSError, ValueError) as e:
+                print(f"Error opening project {base}: {e}")
+                project = None
+        if state is not None:
+            # Layers added or removed since the base was saved start over
+            # here, the blocks then hold everything painted in them
+            grid.set_layer_state(state)
+        for row0, col0, cells in unpack_blocks(payload, offset):
+            grid.write_region(row0, col0, cells)
+        return project
+    return None
+
+
+class Journal:
+    def __init__(self, grid, path, checkpoint_every=JOURNAL_CHECKPOINT_EVERY,
+                 flush_interval=JOURNAL_FLUSH_INTERVAL, tile_size=JOURNAL_TILE_SIZE):
+        self.grid = grid
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.flush_interval = flush_interval
+        self.since_checkpoint = 0
+        # A tiled grid is read tile for tile
+        self.tile_size = getattr(grid, 'tile_size', tile_size)
+        # Tiles changed since the last checkpoint. full: the next one reads
+        # everything over, after the whole canvas changed
+        self.changed = set()
+        self.full = True
+        self.channels = len(grid.color)
+        # Writer thread: (row0, col0, rows, cols) -> block of the last checkpoint, packed
+        self.blocks = {}
+        # Segments of the stroke in progress, written as one record on commit
+        self.stroke_points = []
+        self.stroke_sizes = []
+        self.stroke_color = None
+        self.stroke_soft = False
+        self.queue = queue.Queue()
+        # Cleared while the UI thread reads a checkpoint. The writer waits
+        # for it between blocks, so on a busy or single core machine the
+        # UI isn't held up by packing a large checkpoint from before, and
+        # a checkpoint started from within one is skipped
+        self.idle = threading.Event()
+        self.idle.set()
+        self.error = None
+        self.file = None
+        self.thread = None
+        # Project file the canvas was last opened from or saved to, checkpoints build on it
+        self.project = None
+
+    def recover(self):
+        # Rebuilds the canvas from a journal left by a crashed session.
+        # Returns True if anything was replayed, then starts journalling
+        if self.path is None:
+            return False  # Journalling disabled
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        replayed = replay(self.path, self.grid)
+        valid_end = None
+        if replayed is not None:
+            valid_end, self.project = replayed
+        if valid_end is None:
+            self.file = open(self.path, 'wb')
+            self.file.write(HEADER.pack(MAGIC, VERSION, self.grid.rows, self.grid.cols))
+        else:
+            # Drop a torn record at the end before appending after it
+            self.file = open(self.path, 'r+b')
+            self.file.truncate(valid_end)
+            self.file.seek(valid_end)
+        self.full = True
+        self.grid.add_listener(self.on_change)
+        self.thread = threading.Thread(target=self.writer, name='journal-writer', daemon=True)
+        self.thread.start()
+        return valid_end is not None and valid_end > HEADER.size
+
+    # Called from the UI thread -------------------------------------------
+
+    def on_change(self, row0, col0, row1, col1):
+        if (row1 - row0, col1 - col0) == (self.grid.rows, self.grid.cols):
+            self.full = True  # Cleared or opened, reading it all costs less
+        elif not self.full:
+            size = self.tile_size
+            for tile_row in range(row0 // size, (row1 - 1) // size + 1):
+                for tile_col in range(col0 // size, (col1 - 1) // size + 1):
+                    self.changed.add((tile_row, tile_col))
+
+    def tile_rect(self, key):
+        size = self.tile_size
+        top, left = key[0] * size, key[1] * size
+        return top, left, min(top + size, self.grid.rows), min(left + size, self.grid.cols)
+
+    def add_stroke(self, points, sizes, color, soft=False):
+        # Polylines of one stroke arrive frame by frame and share end points
+        if self.stroke_points and self.stroke_color == color and self.stroke_soft == soft \
+                and self.stroke_points[-1] == points[0]:
+            self.stroke_points.extend(points[1:])
+        else:
+            self.commit()
+            self.stroke_points = list(points)
+            self.stroke_color = color
+            self.stroke_soft = soft
+        if isinstance(sizes, (int, float)):
+            sizes = [sizes] * max(len(points) - 1, 1)
+        self.stroke_sizes.extend(sizes)
+
+    def commit(self):
+        if self.stroke_points:
+            stroke = (self.stroke_points, self.stroke_sizes, self.stroke_color)
+            self.stroke_points = []
+            self.stroke_sizes = []
+            self.put(SOFT_STROKE if self.stroke_soft else STROKE, stroke)
+
+    def add_fill(self, pos, color, tolerance, connectivity):
+        self.put(FILL, (pos, color, tolerance, connectivity))
+
+    def add_shape(self, shape, start, end, brush_size, filled, color):
+        self.put(SHAPE, (shape, start, end, brush_size, filled, color))
+
+    def add_clear(self):
+        self.put(CLEAR, None)
+
+    def add_layer(self, index):
+        # Strokes so far went to the layers as they were
+        self.commit()
+        self.put(LAYER_ADD, index)
+
+    def add_layer_removal(self, index):
+        self.commit()
+        self.put(LAYER_REMOVE, index)
+
+    def add_layer_state(self):
+        # Active layer, visibility and opacity as they are now
+        self.commit()
+        self.put(LAYER_STATE, self.grid.layer_state())
+
+    def add_patch(self, rects):
+        # Regions whose new content can't be replayed as a drawing operation
+        self.put(PATCH, [(row0, col0, self.grid.read_region(row0, col0, row1, col1))
+                         for row0, col0, row1, col1 in rects])
+
+    def put(self, kind, data):
+        if self.thread is None:
+            return
+        self.queue.put((kind, data))
+        self.since_checkpoint += 1
+        if self.since_checkpoint >= self.checkpoint_every and self.idle.is_set():
+            self.checkpoint()
+
+    def rebase(self, project):
+        # The canvas was just saved to or opened from project, checkpoints
+        # now hold what differs from it
+        self.project = project
+        self.full = True
+        self.checkpoint()
+
+    def checkpoint(self):
+        # Reads the tiles changed since the last checkpoint, the writer has
+        # the others. Layers added or removed change every block's channels
+        if not self.idle.is_set():
+            return  # The stroke committed below reached checkpoint_every
+        self.idle.clear()
+        try:
+            self.commit()
+            self.since_checkpoint = 0
+            if self.thread is not None:
+                self.read_checkpoint()
+        finally:
+            self.idle.set()
+
+    def read_checkpoint(self):
+        state = self.grid.layer_state() if hasattr(self.grid, 'layer_state') else None
+        base = '' if self.project is None else self.project.path
+        reset = self.full or len(self.grid.color) != self.channels
+        if not reset:
+            blocks = [(row0, col0, self.grid.read_region(row0, col0, row1, col1))
+                      for row0, col0, row1, col1 in map(self.tile_rect, self.changed)]
+        elif self.project is None:
+            blocks = list(self.grid.painted_blocks())
+        else:
+            # The project file holds everything else
+            blocks = list(self.project.changed_blocks())
+        self.changed = set()
+        self.full = False
+        self.channels = len(self.grid.color)
+        self.queue.put((CHECKPOINT, (base, state, blocks, reset)))
+
+    def wait(self):
+        # Returns once everything queued so far is written
+        self.queue.join()
+
+    def close(self, discard=False):
+        # discard removes the journal, for a clean exit
+        if self.thread is None:
+            return
+        self.commit()
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.grid.remove_listener(self.on_change)
+        self.file.close()
+        if discard:
+            os.remove(self.path)
+
+    # Writer thread -------------------------------------------------------
+
+    def writer(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            # Wake up at most once per interval, so the thread rarely
+            # competes with the UI for the GIL, and everything queued
+            # meanwhile goes out with the same fsync
+            if batch[0] is not None:
+                time.sleep(self.flush_interval)
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            # close() queues None last, it ends the thread even if a
+            # record before it fails
+            running = None not in batch
+            try:
+                for item in batch:
+                    if item is None:
+                        continue
+                    elif item[0] == CHECKPOINT:
+                        checkpoint = self.merge(*item[1])
+                        self.idle.wait()
+                        self.start_file(encode(CHECKPOINT, checkpoint))
+                    else:
+                        self.file.write(encode(*item))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except Exception as e:
+                # Journalling is best effort, never take the app down with
+                # it. A record that can't be encoded is reported the same
+                # way as a failed write, and the thread keeps emptying the queue
+                if self.error is None:
+                    self.error = e
+                    print(f"Error writing journal: {e!r}")
+            for _ in batch:
+                self.queue.task_done()
+
+    def merge(self, base, state, blocks, reset):
+        # Brings the blocks of the last checkpoint up to date. Later blocks
+        # are written over earlier ones on replay, a block packed again
+        # moves to the end
+        if reset:
+            self.blocks = {}
+        for row0, col0, cells in blocks:
+            key = (row0, col0) + cells.shape[:2]
+            self.blocks.pop(key, None)
+            self.idle.wait()
+            self.blocks[key] = pack_block(row0, col0, cells)
+        return base, state, list(self.blocks.values())
+
+    def start_file(self, checkpoint):
+        # A checkpoint holds the whole canvas, so everything before it can go
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.grid.rows, self.grid.cols))
+            f.write(checkpoint)
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, 'ab')
@@ -0,0 +1,474 @@
+# utils/layers.py
+
+import struct
+import numpy as np
+from .settings import *
+from .grid import uniform_block, uniform_color
+from .canvas import create_grid
+
+# A document made of layers, each an RGBA grid of the chosen backend that
+# starts out transparent. Drawing goes to the active layer, the image
+# shown and saved is the layers composited over the paper colour.
+#
+# The composite is cached in square chunks. A change only marks the
+# chunks it touches, they are blended again when they are next read, so
+# the cost follows what is on screen. Two more caches hold the layers
+# below the active one flattened onto the paper, and the layers above it
+# flattened into one premultiplied RGBA image: a chunk of the active
+# layer is redrawn with two blends however many layers there are.
+#
+# read_region and write_region see all layers at once, their RGBA
+# channels side by side (4 per layer, bottom layer first). The journal
+# and projects store that and so cover every layer as it is. History
+# does the same through read_cells, one palette index per layer for the
+# indexed backend.
+
+LAYER_PROPS = struct.Struct('<?f')  # visible, opacity
+
+
+def pack_layer_state(state):
+    # LayerStack.layer_state() as bytes, None (a grid without layers) as no layers
+    if state is None:
+        return struct.pack('<HH', 0, 0)
+    active, layers = state
+    return struct.pack('<HH', active, len(layers)) + b''.join(LAYER_PROPS.pack(*layer) for layer in layers)
+
+
+def unpack_layer_state(data, offset=0):
+    # Returns the state and the offset after it
+    active, count = struct.unpack_from('<HH', data, offset)
+    offset += 4
+    layers = [LAYER_PROPS.unpack_from(data, offset + i * LAYER_PROPS.size) for i in range(count)]
+    return (active, layers) if count else None, offset + count * LAYER_PROPS.size
+
+
+class Layer:
+    def __init__(self, grid, visible=True, opacity=1.0):
+        self.grid = grid
+        self.visible = visible
+        self.opacity = opacity
+
+    def alpha(self):
+        # Opacity the layer is composited with
+        return self.opacity if self.visible else 0.0
+
+
+def blend(below, cells, alpha):
+    # RGBA cells at alpha over RGB values
+    cells = cells.astype(np.float32)
+    a = cells[..., 3:] * np.float32(alpha / 255)
+    return below + (cells[..., :3] - below) * a
+
+
+def flatten_below(paper, layers):
+    # (cells, alpha) layers, bottom first, flattened onto the paper as RGB
+    values = np.array(paper, dtype=np.float32)
+    for cells, alpha in layers:
+        values = blend(values, cells, alpha)
+    return values
+
+
+def flatten_above(layers):
+    # (cells, alpha) layers, bottom first, flattened into premultiplied RGBA
+    rgb = np.zeros(3, dtype=np.float32)
+    coverage = np.zeros(1, dtype=np.float32)
+    for cells, alpha in layers:
+        cells = cells.astype(np.float32)
+        a = cells[..., 3:] * np.float32(alpha / 255)
+        rgb = rgb + (cells[..., :3] - rgb) * a
+        coverage = coverage + (1 - coverage) * a
+    return np.concatenate([rgb, coverage * 255], axis=-1)
+
+
+def composite_cells(below, cells, alpha, above):
+    # The active layer between the two caches, above is None when there is
+    # nothing to show above it
+    values = blend(below.astype(np.float32), cells, alpha)
+    if above is None:
+        return values
+    above = above.astype(np.float32)
+    return above[..., :3] + values * (1 - above[..., 3:] * np.float32(1 / 255))
+
+
+def shrink(blocks):
+    # Blocks that are each a single colour are blended as a single cell
+    if all(uniform_color(block) is not None for block in blocks):
+        return [block[:1, :1] for block in blocks]
+    return blocks
+
+
+def to_cells(values, shape):
+    # Rounds blended values to uint8 cells filling shape
+    cells = np.minimum(values + 0.5, 255).astype(np.uint8)
+    if cells.shape[:2] != shape:  # Blended as a single cell, or no layers at all
+        return uniform_block(tuple(cells.reshape(-1, cells.shape[-1])[0].tolist()), shape + cells.shape[-1:])
+    return cells
+
+
+class Composite:
+    # The flattened document, read like a grid by the renderer and the
+    # image saver. Listeners hear about every change to what it shows
+    def __init__(self, stack):
+        self.stack = stack
+        self.rows = stack.rows
+        self.cols = stack.cols
+        self.color = stack.paper
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def read_region(self, row0, col0, row1, col1):
+        self.stack.flatten(row0, col0, row1, col1)
+        return self.stack.flat.read_region(row0, col0, row1, col1)
+
+    def get_cell_color(self, row, col):
+        return tuple(self.read_region(row, col, row + 1, col + 1)[0, 0].tolist())
+
+    def painted_bounds(self):
+        return self.stack.painted_bounds()
+
+
+class LayerStack:
+    def __init__(self, rows, cols, paper=BG_COLOR, backend=None, layers=1):
+        self.rows = rows
+        self.cols = cols
+        self.paper = tuple(paper)
+        self.backend = backend or GRID_BACKEND
+        # Callbacks taking (row0, col0, row1, col1), called just before
+        # cells of any layer in that region change
+        self.listeners = []
+        self.layers = [self.new_layer() for _ in range(layers)]
+        self.active = 0
+        # Caches, see the top of the file
+        # Blended colours don't fit a palette, indexed layers get dense caches
+        cache_backend = 'array' if self.backend == 'indexed' else self.backend
+        self.flat = create_grid(rows, cols, self.paper, cache_backend)
+        self.below = create_grid(rows, cols, self.paper, cache_backend)
+        self.above = create_grid(rows, cols, TRANSPARENT, cache_backend)
+        if hasattr(self.flat, 'tile_size'):
+            self.tile_size = self.flat.tile_size  # Also what History records in
+        self.chunk_size = getattr(self.flat, 'tile_size', COMPOSITE_TILE_SIZE)
+        self.stale = set()  # Chunks where other layers changed, all caches are redone
+        self.dirty = set()  # Chunks where only the active layer changed
+        self.composite = Composite(self)
+
+    @property
+    def color(self):
+        # What a cleared cell holds, across all layers
+        return TRANSPARENT * len(self.layers)
+
+    def new_layer(self):
+        layer = Layer(create_grid(self.rows, self.cols, TRANSPARENT, self.backend))
+        layer.grid.add_listener(lambda row0, col0, row1, col1: self.on_layer_change(layer, row0, col0, row1, col1))
+        return layer
+
+    def grids(self):
+        return [layer.grid for layer in self.layers]
+
+    def active_grid(self):
+        return self.layers[self.active].grid
+
+    @staticmethod
+    def layer_color(color):
+        # Colours without alpha are opaque
+        color = tuple(color)
+        return color if len(color) == 4 else color + (255,)
+
+    # Listeners and dirty chunks ------------------------------------------
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def chunk_rect(self, key):
+        size = self.chunk_size
+        top, left = key[0] * size, key[1] * size
+        return top, left, min(top + size, self.rows), min(left + size, self.cols)
+
+    def chunks_in(self, row0, col0, row1, col1):
+        size = self.chunk_size
+        return [
+            (chunk_row, chunk_col)
+            for chunk_row in range(row0 // size, (row1 - 1) // size + 1)
+            for chunk_col in range(col0 // size, (col1 - 1) // size + 1)
+        ]
+
+    def on_layer_change(self, layer, row0, col0, row1, col1):
+        if layer is self.layers[self.active]:
+            self.dirty.update(self.chunks_in(row0, col0, row1, col1))
+            for callback in self.listeners:
+                callback(row0, col0, row1, col1)
+            for callback in self.composite.listeners:
+                callback(row0, col0, row1, col1)
+        else:
+            self.mark_dirty(row0, col0, row1, col1)
+
+    def mark_dirty(self, row0, col0, row1, col1):
+        # Rectangles are half-open and clipped to the canvas
+        row0, col0 = max(row0, 0), max(col0, 0)
+        row1, col1 = min(row1, self.rows), min(col1, self.cols)
+        if row0 < row1 and col0 < col1:
+            self.stale.update(self.chunks_in(row0, col0, row1, col1))
+            for callback in self.listeners:
+                callback(row0, col0, row1, col1)
+            for callback in self.composite.listeners:
+                callback(row0, col0, row1, col1)
+
+    def mark_all_dirty(self):
+        self.mark_dirty(0, 0, self.rows, self.cols)
+
+    def mark_painted(self):
+        # Before the layers are rearranged, which moves every layer's channels
+        for rect in self.painted_rects():
+            self.mark_dirty(*rect)
+
+    def mark_shown(self):
+        # Before a visibility or an opacity changes, which changes what is
+        # shown wherever a layer is painted. Composite listeners hear of it
+        # while the old image can still be read
+        for rect in self.painted_rects():
+            for callback in self.composite.listeners:
+                callback(*rect)
+
+    def invalidate(self):
+        # The active layer, a visibility or an opacity changed: the cells
+        # stay as they are but everything painted is composited again
+        for grid in self.grids() + [self.flat, self.below, self.above]:
+            for rect in grid.painted_rects():
+                self.stale.update(self.chunks_in(*rect))
+                for callback in self.composite.listeners:
+                    callback(*rect)
+
+    # Compositing ---------------------------------------------------------
+
+    def flatten(self, row0=0, col0=0, row1=None, col1=None):
+        # Brings the cached composite up to date in the region, by default everywhere
+        if not self.stale and not self.dirty:
+            return
+        row1 = self.rows if row1 is None else row1
+        col1 = self.cols if col1 is None else col1
+        if row0 >= row1 or col0 >= col1:
+            return
+        size = self.chunk_size
+        top, left = row0 // size, col0 // size
+        bottom, right = (row1 - 1) // size + 1, (col1 - 1) // size + 1
+        for chunks, update in ((self.stale, self.rebuild), (self.dirty, self.recomposite)):
+            # Whichever of the region and the set is smaller is walked
+            if (bottom - top) * (right - left) < len(chunks):
+                keys = [(r, c) for r in range(top, bottom) for c in range(left, right) if (r, c) in chunks]
+            else:
+                keys = [key for key in chunks if top <= key[0] < bottom and left <= key[1] < right]
+            chunks.difference_update(keys)
+            if chunks is self.stale:
+                self.dirty.difference_update(keys)
+            for rect in self.runs(keys):
+                update(rect)
+
+    def runs(self, keys):
+        # Rects to blend the chunks in. Tiles are blended one by one, so a
+        # uniform one is blended as a single cell; chunks of a dense grid
+        # next to each other in a row are blended together
+        if hasattr(self.flat, 'tile_size'):
+            return [self.chunk_rect(key) for key in keys]
+        rects = []
+        for key in sorted(keys):
+            row0, col0, row1, col1 = self.chunk_rect(key)
+            if rects and rects[-1][0] == row0 and rects[-1][3] == col0:
+                rects[-1][3] = col1
+            else:
+                rects.append([row0, col0, row1, col1])
+        return rects
+
+    def rebuild(self, rect):
+        # Redoes the below and above caches from the layers
+        row0, col0, row1, col1 = rect
+        shape = (row1 - row0, col1 - col0)
+        below = [layer for layer in self.layers[:self.active] if layer.alpha() > 0]
+        above = [layer for layer in self.layers[self.active + 1:] if layer.alpha() > 0]
+        blocks = shrink([layer.grid.read_region(*rect) for layer in below])
+        values = flatten_below(self.paper, zip(blocks, [layer.alpha() for layer in below]))
+        self.below.write_region(row0, col0, to_cells(values, shape))
+        blocks = shrink([layer.grid.read_region(*rect) for layer in above])
+        values = flatten_above(zip(blocks, [layer.alpha() for layer in above]))
+        self.above.write_region(row0, col0, to_cells(values, shape))
+        self.recomposite(rect)
+
+    def recomposite(self, rect):
+        # Blends the active layer's cells between the caches
+        row0, col0, row1, col1 = rect
+        layer = self.layers[self.active]
+        blocks = [self.below.read_region(*rect), layer.grid.read_region(*rect)]
+        if any(upper.alpha() > 0 for upper in self.layers[self.active + 1:]):
+            blocks.append(self.above.read_region(*rect))
+        blocks = shrink(blocks)
+        below, cells = blocks[:2]
+        above = blocks[2] if len(blocks) == 3 else None
+        values = composite_cells(below, cells, layer.alpha(), above)
+        self.flat.write_region(row0, col0, to_cells(values, (row1 - row0, col1 - col0)))
+
+    def preview_region(self, row0, col0, cells):
+        # RGB cells the composite would show if the active layer held
+        # cells there, for previews that leave the layer as it is
+        row1, col1 = row0 + cells.shape[0], col0 + cells.shape[1]
+        self.flatten(row0, col0, row1, col1)
+        rect = (row0, col0, row1, col1)
+        above = None
+        if any(upper.alpha() > 0 for upper in self.layers[self.active + 1:]):
+            above = self.above.read_region(*rect)
+        values = composite_cells(self.below.read_region(*rect), cells, self.layers[self.active].alpha(), above)
+        return to_cells(values, cells.shape[:2])
+
+    # Layers --------------------------------------------------------------
+
+    def add_layer(self, index=None):
+        # A transparent layer, by default above the active one, which it replaces as active
+        if index is None:
+            index = self.active + 1
+        self.mark_painted()
+        self.layers.insert(index, self.new_layer())
+        self.active = index
+        self.invalidate()
+
+    def remove_layer(self, index):
+        # The last layer left is cleared instead
+        self.mark_painted()
+        self.layers.pop(index)
+        if not self.layers:
+            self.layers.append(self.new_layer())
+        if self.active > index or self.active == len(self.layers):
+            self.active -= 1
+        self.invalidate()
+
+    def set_active(self, index):
+        if index != self.active and 0 <= index < len(self.layers):
+            self.active = index
+            self.invalidate()
+
+    def set_visible(self, index, visible):
+        if visible != self.layers[index].visible:
+            self.mark_shown()
+            self.layers[index].visible = visible
+            self.invalidate()
+
+    def set_opacity(self, index, opacity):
+        opacity = min(max(opacity, 0.0), 1.0)
+        if opacity != self.layers[index].opacity:
+            self.mark_shown()
+            self.layers[index].opacity = opacity
+            self.invalidate()
+
+    def layer_state(self):
+        # (active index, [(visible, opacity) of every layer, bottom first])
+        return self.active, [(layer.visible, layer.opacity) for layer in self.layers]
+
+    def set_layer_state(self, state):
+        # A different number of layers starts over with transparent ones
+        active, layers = state
+        if (active, [tuple(layer) for layer in layers]) == self.layer_state():
+            return
+        if len(layers) != len(self.layers):
+            self.mark_painted()
+            self.layers = [self.new_layer() for _ in layers]
+        else:
+            self.mark_shown()
+        for layer, (visible, opacity) in zip(self.layers, layers):
+            layer.visible = bool(visible)
+            layer.opacity = float(opacity)
+        self.active = active
+        self.invalidate()
+
+    # Drawing, on the active layer ----------------------------------------
+
+    def set_cell_color(self, row, col, color):
+        self.active_grid().set_cell_color(row, col, self.layer_color(color))
+
+    def get_cell_color(self, row, col):
+        return self.active_grid().get_cell_color(row, col)
+
+    def set_cell_color_circle(self, center_pos, radius, color):
+        self.active_grid().set_cell_color_circle(center_pos, radius, self.layer_color(color))
+
+    def set_cell_color_line(self, pos1, pos2, brush_size, color):
+        self.active_grid().set_cell_color_line(pos1, pos2, brush_size, self.layer_color(color))
+
+    def set_cell_color_polyline(self, points, brush_sizes, color):
+        self.active_grid().set_cell_color_polyline(points, brush_sizes, self.layer_color(color))
+
+    def fill_spans(self, row0, lefts, rights, color):
+        self.active_grid().fill_spans(row0, lefts, rights, self.layer_color(color))
+
+    def soft_stroke(self, color):
+        return self.active_grid().soft_stroke(self.layer_color(color))
+
+    def flood_fill(self, pos, new_color, tolerance=0, connectivity=4):
+        # Spreads over the active layer's cells only
+        return self.active_grid().flood_fill(pos, self.layer_color(new_color), tolerance, connectivity)
+
+    # The whole document, all layers --------------------------------------
+
+    def clear(self):
+        for grid in self.grids():
+            grid.clear()
+
+    def snapshot(self):
+        return self.layer_state(), [grid.snapshot() for grid in self.grids()]
+
+    def restore(self, state):
+        layer_state, grids = state
+        self.set_layer_state(layer_state)
+        for grid, grid_state in zip(self.grids(), grids):
+            grid.restore(grid_state)
+
+    def read_region(self, row0, col0, row1, col1):
+        return self.join([grid.read_region(row0, col0, row1, col1) for grid in self.grids()])
+
+    def write_region(self, row0, col0, block):
+        for grid, part in zip(self.grids(), self.split(block)):
+            grid.write_region(row0, col0, part)
+
+    def read_cells(self, row0, col0, row1, col1):
+        # As read_region, each layer's cells in the form its grid keeps them
+        return self.join([grid.read_cells(row0, col0, row1, col1) for grid in self.grids()])
+
+    def write_cells(self, row0, col0, block):
+        for grid, part in zip(self.grids(), self.split(block)):
+            grid.write_cells(row0, col0, part)
+
+    @staticmethod
+    def join(blocks):
+        # One block per layer -> their channels side by side
+        if len(blocks) == 1:
+            return blocks[0]
+        colors = [uniform_color(block) for block in blocks]
+        if None not in colors:
+            return uniform_block(sum(colors, ()), blocks[0].shape[:2] + (sum(len(color) for color in colors),))
+        return np.concatenate(blocks, axis=2)
+
+    def split(self, block):
+        # Counterpart of join, every layer has the same number of channels
+        channels = block.shape[2] // len(self.layers)
+        return [block[:, :, index * channels:(index + 1) * channels] for index in range(len(self.layers))]
+
+    def painted_rects(self):
+        return sorted({rect for grid in self.grids() for rect in grid.painted_rects()})
+
+    def painted_bounds(self):
+        rects = self.painted_rects()
+        if not rects:
+            return None
+        return (
+            min(rect[0] for rect in rects),
+            min(rect[1] for rect in rects),
+            max(rect[2] for rect in rects),
+            max(rect[3] for rect in rects),
+        )
+
+    def painted_blocks(self):
+        for row0, col0, row1, col1 in self.painted_rects():
+            yield row0, col0, self.read_region(row0, col0, row1, col1)
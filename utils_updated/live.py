@@ -0,0 +1,196 @@
+# utils/live.py
+
+import os
+import sys
+import struct
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from .settings import ZOOM_LEVELS, LIVE_EXPORT_MAX_RECTS
+
+# Live export of the canvas into a shared memory block, for another
+# process to record, stream or analyse as it is drawn. The block holds a
+# header and the composite's cells as RGB bytes, one row after another.
+# A document larger than the window, seen through a movable viewport,
+# is mirrored only as far as the view can show at the lowest zoom, the
+# header tells where that part starts.
+#
+# The painter publishes once a frame, copying only the cells changed
+# since the last frame, and lists them in the header. The sequence
+# number is odd while a frame is being written and even once it is done
+# (a seqlock): a reader takes the sequence, reads, and reads it again,
+# if it changed or was odd what it read may be torn. Sequences go up by
+# two a frame, so a reader that sees a bigger step has missed frames and
+# should take everything in again.
+#
+# Header, little endian, the sequence 8 byte aligned so it is written whole:
+#   magic 8s | sequence Q | version H | channels H | rows I | cols I |
+#   document rows I | document cols I | origin row I | origin col I |
+#   rect count I | max rects I | cells offset I | pad I
+# then max rects (row0, col0, row1, col1) I rects in mirror cells, the
+# whole mirror when count is 0 in a published frame.
+
+MAGIC = b'PAINTLIV'
+VERSION = 1
+HEADER = struct.Struct('<8sQHHIIIIIIIIII')
+SEQUENCE = struct.Struct('<Q')
+SEQUENCE_OFFSET = 8
+COUNT = struct.Struct('<I')
+COUNT_OFFSET = 44
+RECT = struct.Struct('<IIII')
+ORIGIN = struct.Struct('<II')
+ORIGIN_OFFSET = 36
+
+
+def mirror_size(rows, cols, viewport):
+    # Rows and cols mirrored, the whole document unless the viewport moves
+    if not viewport.movable:
+        return rows, cols
+    zoom = min(ZOOM_LEVELS)
+    # A cell more each way, the view's edge cells may be cut
+    return min(rows, viewport.height // zoom + 2), min(cols, viewport.width // zoom + 2)
+
+
+class LiveCanvas:
+    # The painter's side. Listens to the composite, publish() once a frame
+    def __init__(self, composite, name, viewport, max_rects=LIVE_EXPORT_MAX_RECTS):
+        self.composite = composite
+        self.viewport = viewport
+        self.rows, self.cols = mirror_size(composite.rows, composite.cols, viewport)
+        self.max_rects = max_rects
+        self.offset = -(-(HEADER.size + max_rects * RECT.size) // 64) * 64  # Cells start on a cache line
+        size = self.offset + self.rows * self.cols * 3
+        try:
+            self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a session that crashed
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+        self.cells = np.ndarray((self.rows, self.cols, 3), dtype=np.uint8, buffer=self.memory.buf, offset=self.offset)
+        self.sequence = 0
+        self.origin = None  # (row, col) of the document at the mirror's top-left
+        self.dirty = []     # Document rects changed since the last publish
+        HEADER.pack_into(self.memory.buf, 0, MAGIC, 0, VERSION, 3, self.rows, self.cols,
+                         composite.rows, composite.cols, 0, 0, 0, max_rects, self.offset, 0)
+        composite.add_listener(self.mark_dirty)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def mark_dirty(self, row0, col0, row1, col1):
+        # Rects inside one already listed are dropped, past max_rects they
+        # are all merged into one
+        for rect in self.dirty:
+            if rect[0] <= row0 and rect[1] <= col0 and row1 <= rect[2] and col1 <= rect[3]:
+                return
+        self.dirty.append([row0, col0, row1, col1])
+        if len(self.dirty) > self.max_rects:
+            self.dirty = [[min(rect[0] for rect in self.dirty), min(rect[1] for rect in self.dirty),
+                           max(rect[2] for rect in self.dirty), max(rect[3] for rect in self.dirty)]]
+
+    def follow(self):
+        # Where the mirror starts, keeping the view's top-left corner in it
+        row, col = self.viewport.visible_cells()[:2]
+        return min(row, self.composite.rows - self.rows), min(col, self.composite.cols - self.cols)
+
+    def publish(self):
+        # Copies what changed into the block as the next frame. Returns the
+        # rects copied, in mirror cells, an empty list if nothing changed
+        origin = self.follow()
+        if origin != self.origin:
+            # The mirror moved with the view, or this is the first frame
+            self.origin = origin
+            rects = [(0, 0, self.rows, self.cols)]
+        else:
+            rects = []
+            top, left = origin
+            for row0, col0, row1, col1 in self.dirty:
+                row0, col0 = max(row0 - top, 0), max(col0 - left, 0)
+                row1, col1 = min(row1 - top, self.rows), min(col1 - left, self.cols)
+                if row0 < row1 and col0 < col1:
+                    rects.append((row0, col0, row1, col1))
+        self.dirty = []
+        if not rects:
+            return rects
+
+        buf = self.memory.buf
+        top, left = origin
+        self.sequence += 1
+        SEQUENCE.pack_into(buf, SEQUENCE_OFFSET, self.sequence)  # Odd, being written
+        ORIGIN.pack_into(buf, ORIGIN_OFFSET, top, left)
+        for row0, col0, row1, col1 in rects:
+            self.cells[row0:row1, col0:col1] = self.composite.read_region(row0 + top, col0 + left, row1 + top, col1 + left)
+        whole = rects == [(0, 0, self.rows, self.cols)]
+        COUNT.pack_into(buf, COUNT_OFFSET, 0 if whole else len(rects))
+        if not whole:
+            for i, rect in enumerate(rects):
+                RECT.pack_into(buf, HEADER.size + i * RECT.size, *rect)
+        self.sequence += 1
+        SEQUENCE.pack_into(buf, SEQUENCE_OFFSET, self.sequence)  # Even, done
+        return rects
+
+    def close(self):
+        self.composite.remove_listener(self.mark_dirty)
+        del self.cells  # The block can't close while an array uses its memory
+        self.memory.close()
+        self.memory.unlink()
+
+
+class LiveCanvasReader:
+    # The consumer's side. cells is a view straight into the block
+    def __init__(self, name):
+        # The block is the painter's, it must outlive this process
+        self.untracked = None  # Name it was taken out of this process's resource tracker by
+        if sys.version_info >= (3, 13):
+            self.memory = shared_memory.SharedMemory(name, track=False)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            if os.name == 'posix':
+                # Attaching registers it with the resource tracker too,
+                # which would remove it on exit. Windows has none, a block
+                # goes when its last handle closes
+                self.untracked = '/' + self.memory.name
+                resource_tracker.unregister(self.untracked, 'shared_memory')
+        buf = self.memory.buf
+        (magic, _, version, channels, self.rows, self.cols, self.document_rows, self.document_cols,
+         _, _, _, self.max_rects, offset, _) = HEADER.unpack_from(buf)
+        if magic != MAGIC or version != VERSION:
+            self.memory.close()
+            raise ValueError(f"{name} is not a live canvas of version {VERSION}")
+        self.cells = np.ndarray((self.rows, self.cols, channels), dtype=np.uint8, buffer=buf, offset=offset)
+        self.cells.flags.writeable = False
+        self.sequence = 0  # Last frame poll() returned
+
+    def current(self):
+        return SEQUENCE.unpack_from(self.memory.buf, SEQUENCE_OFFSET)[0]
+
+    def origin(self):
+        # (row, col) of the document at the mirror's top-left
+        return ORIGIN.unpack_from(self.memory.buf, ORIGIN_OFFSET)
+
+    def poll(self):
+        # (sequence, rects) when frames were published since the last
+        # poll, rects being what changed in mirror cells (everything when
+        # frames were missed), else None. Read cells, then check stable()
+        # to know they weren't being written meanwhile
+        sequence = self.current()
+        if sequence == self.sequence or sequence % 2:
+            return None
+        count = COUNT.unpack_from(self.memory.buf, COUNT_OFFSET)[0]
+        rects = [RECT.unpack_from(self.memory.buf, HEADER.size + i * RECT.size) for i in range(count)]
+        if self.current() != sequence:
+            return None  # A frame started meanwhile, the next poll gets it
+        if not rects or sequence != self.sequence + 2:
+            rects = [(0, 0, self.rows, self.cols)]
+        self.sequence = sequence
+        return sequence, rects
+
+    def stable(self, sequence):
+        # True if no frame was written since sequence
+        return self.current() == sequence
+
+    def close(self):
+        del self.cells
+        self.memory.close()
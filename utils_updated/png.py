@@ -0,0 +1,81 @@
+# utils/png.py
+
+import os
+import zlib
+import struct
+import numpy as np
+
+# Minimal PNG writer for 8 bit RGB images. zlib releases the GIL while it
+# compresses, so this can run on a worker thread without stalling the UI.
+# PngWriter takes the image a band of rows at a time and compresses each
+# band as it comes, so only the compressed data of one IDAT chunk is held
+# at a time, however large the image.
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CHUNK_SIZE = 1 << 20  # Compressed bytes per IDAT chunk
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+class PngWriter:
+    # Written to a temporary file first so a failed save never leaves a
+    # half written image behind. Use as a context manager, or call close()
+    # once every row was written (abort() otherwise)
+    def __init__(self, path, width, height, level=6):
+        self.path = path
+        self.temp_path = path + '.tmp'
+        self.width = width
+        self.height = height
+        self.rows = 0  # Written so far
+        self.compressor = zlib.compressobj(level)
+        self.pending = bytearray()  # Compressed, waiting for a full chunk
+        self.file = open(self.temp_path, 'wb')
+        self.file.write(PNG_SIGNATURE)
+        self.file.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        if kind is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, pixels):
+        # The next rows, (rows, width, 3) uint8. Every scanline starts with
+        # its filter type, 0 (None)
+        rows = pixels.shape[0]
+        raw = np.zeros((rows, self.width * 3 + 1), dtype=np.uint8)
+        raw[:, 1:] = pixels.reshape(rows, self.width * 3)
+        self.rows += rows
+        self.put(self.compressor.compress(raw))
+
+    def put(self, data):
+        self.pending += data
+        while len(self.pending) >= PNG_CHUNK_SIZE:
+            self.file.write(png_chunk(b'IDAT', bytes(self.pending[:PNG_CHUNK_SIZE])))
+            del self.pending[:PNG_CHUNK_SIZE]
+
+    def close(self):
+        if self.rows != self.height:
+            self.abort()
+            raise ValueError(f"{self.rows} rows written to a PNG {self.height} rows high")
+        self.put(self.compressor.flush())
+        self.file.write(png_chunk(b'IDAT', bytes(self.pending)))
+        self.file.write(png_chunk(b'IEND', b''))
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.temp_path)
+
+
+def write_png(path, pixels, level=6):
+    # pixels is a (height, width, 3) uint8 array
+    height, width = pixels.shape[:2]
+    with PngWriter(path, width, height, level) as writer:
+        writer.write(pixels)
@@ -0,0 +1,137 @@
+# utils/pointer.py
+
+import math
+import pygame
+from .settings import *
+
+# The pointer samples a stroke is drawn from. pygame's events carry no
+# time, so a sample is stamped when the event is fetched: the events of
+# one fetch arrived since the one before (a frame at most, the first wakes
+# a sleeping app), so their times are spread evenly over that span. An
+# event that already has a time attribute keeps it, as replayed or
+# synthetic input does.
+#
+# Samples go through a One-Euro filter: a low pass filter whose cutoff
+# rises with speed, so a slow hand's jitter is smoothed out while a fast
+# stroke doesn't lag behind. The speed the brush size follows is the
+# filter's own smoothed speed, it doesn't jump with the frame timing.
+# predict() extrapolates that speed a little past the last sample, for the
+# ink drawn ahead of the pointer until real samples replace it. When no
+# sample comes for a while the pointer stopped where the last one was, and
+# there is nothing to predict.
+
+STAMPED_EVENTS = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+
+
+def smoothing(cutoff, dt):
+    # Weight of a new sample in a first order low pass at cutoff Hz
+    return 1 / (1 + 1 / (2 * math.pi * cutoff * dt))
+
+
+class OneEuroFilter:
+    # Filters (x, y) samples. min_cutoff is the cutoff at rest in Hz,
+    # beta how much it rises per pixel per second of speed, d_cutoff the
+    # cutoff the speed itself is smoothed at
+    def __init__(self, min_cutoff=POINTER_MIN_CUTOFF, beta=POINTER_BETA, d_cutoff=POINTER_D_CUTOFF):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset((0, 0), 0)
+
+    def reset(self, pos, t):
+        self.pos = (float(pos[0]), float(pos[1]))
+        self.raw = self.pos  # The last sample as it came, the speed is taken from those
+        self.velocity = (0.0, 0.0)  # Pixels per second
+        self.time = t
+
+    def speed(self):
+        return math.hypot(*self.velocity)
+
+    def __call__(self, pos, t):
+        # Two samples at once would make an endless speed, a sample
+        # comes at most every POINTER_MIN_INTERVAL
+        dt = max(t - self.time, POINTER_MIN_INTERVAL)
+        self.time = max(t, self.time)
+        a = smoothing(self.d_cutoff, dt)
+        vx, vy = self.velocity
+        rx, ry = self.raw
+        self.velocity = (vx + a * ((pos[0] - rx) / dt - vx), vy + a * ((pos[1] - ry) / dt - vy))
+        self.raw = (pos[0], pos[1])
+        a = smoothing(self.min_cutoff + self.beta * self.speed(), dt)
+        x, y = self.pos
+        self.pos = (x + a * (pos[0] - x), y + a * (pos[1] - y))
+        return self.pos
+
+
+class Pointer:
+    # Stamps and filters the samples of the stroke being drawn
+    def __init__(self, lead=PREDICT_INK_MS / 1000):
+        self.filter = OneEuroFilter()
+        self.lead = lead    # Seconds predicted ink reaches past the last sample
+        self.fetched = None  # When the last events were fetched
+
+    def stamp(self, events, now):
+        # Gives pointer events without one a time, see above
+        fresh = [event for event in events if event.type in STAMPED_EVENTS and not hasattr(event, 'time')]
+        span = 0 if self.fetched is None else min(now - self.fetched, 1 / FPS)
+        for i, event in enumerate(fresh):
+            event.time = now - span * (len(fresh) - 1 - i) / len(fresh)
+        self.fetched = now
+
+    def press(self, pos, t):
+        self.filter.reset(pos, t)
+        return self.filter.pos
+
+    def move(self, pos, t):
+        # The filtered position and speed in pixels per second
+        return self.filter(pos, t), self.filter.speed()
+
+    def predict(self, now):
+        # Where the pointer should be lead seconds after the last sample,
+        # at most PREDICT_INK_MAX pixels on, None if it isn't moving or the
+        # last sample is PREDICT_INK_IDLE_MS old at now
+        if now - self.filter.time > PREDICT_INK_IDLE_MS / 1000:
+            return None
+        vx, vy = self.filter.velocity
+        distance = math.hypot(vx, vy) * self.lead
+        if distance < 1:
+            return None
+        scale = min(distance, PREDICT_INK_MAX) / distance * self.lead
+        x, y = self.filter.pos
+        return x + vx * scale, y + vy * scale
+
+
+class LatencyMeter:
+    # Input to display latency of drawn samples: from a sample's time to
+    # the end of the display update of the frame that draws its ink. The
+    # predicted ink reaches lead seconds further, so the end of the stroke
+    # on screen is that much closer to the pointer, or ahead of it
+    def __init__(self):
+        self.pending = []   # Times of samples drawn into the current frame
+        self.latencies = []  # Seconds, a sample each
+        self.lead = 0.0
+
+    def add(self, t):
+        self.pending.append(t)
+
+    def shown(self, now, lead=0.0):
+        self.latencies.extend(now - t for t in self.pending)
+        self.pending = []
+        self.lead = lead
+
+    def percentiles(self):
+        # (p50, p95, p99) in milliseconds, None before anything was drawn
+        if not self.latencies:
+            return None
+        ms = sorted(latency * 1000 for latency in self.latencies)
+        return tuple(ms[min(len(ms) * p // 100, len(ms) - 1)] for p in (50, 95, 99))
+
+    def report(self):
+        found = self.percentiles()
+        if found is None:
+            return "No strokes drawn, no latency measured."
+        p50, p95, p99 = found
+        lead = self.lead * 1000
+        return (f"Input to display latency over {len(self.latencies)} samples: p50 {p50:.2f} ms, p95 {p95:.2f} ms, "
+                f"p99 {p99:.2f} ms. With {lead:.0f} ms of predicted ink the stroke ends {p50 - lead:+.2f} ms "
+                f"from the pointer at p50")
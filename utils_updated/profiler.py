@@ -0,0 +1,142 @@
+# utils/profiler.py
+
+import os
+import json
+import time
+import threading
+from collections import deque
+import numpy as np
+import pygame
+from .settings import *
+
+
+class Scope:
+    # Records one span of the profiler's current frame
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.spans.append((self.name, self.start, time.perf_counter() - self.start))
+
+
+class NullScope:
+    # What scope() hands out while profiling is off, does nothing
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_SCOPE = NullScope()
+
+
+class Profiler:
+    # Named timing scopes grouped into frames. The last PROFILE_FRAMES
+    # frames are kept, for the overlay's percentiles and the trace export.
+    # While disabled scope() costs an attribute check and nothing is kept
+    def __init__(self, frames=PROFILE_FRAMES):
+        self.enabled = False
+        self.frames = deque(maxlen=frames)  # Lists of (name, start, seconds)
+        self.spans = []  # The current frame's
+        self.frame_start = None
+
+    def scope(self, name):
+        # with profiler.scope('stroke'): ...
+        if not self.enabled:
+            return NULL_SCOPE
+        return Scope(self, name)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.spans = []
+        self.frame_start = None
+        if not enabled:
+            self.frames.clear()
+
+    def start_frame(self):
+        if self.enabled:
+            self.spans = []
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        # The frame itself is kept as a 'frame' span around the others
+        if self.enabled and self.frame_start is not None:
+            self.spans.append(('frame', self.frame_start, time.perf_counter() - self.frame_start))
+            self.frames.append(self.spans)
+            self.spans = []
+            self.frame_start = None
+
+    def stats(self):
+        # {name: (frames, p50, p90, p99, max)} in milliseconds, over the
+        # frames the scope ran in. A scope entered twice in a frame counts
+        # as the sum
+        totals = {}
+        for spans in self.frames:
+            frame = {}
+            for name, start, seconds in spans:
+                frame[name] = frame.get(name, 0.0) + seconds
+            for name, seconds in frame.items():
+                totals.setdefault(name, []).append(seconds)
+        stats = {}
+        for name, seconds in totals.items():
+            ms = np.array(seconds) * 1000
+            p50, p90, p99 = np.percentile(ms, (50, 90, 99))
+            stats[name] = (len(ms), p50, p90, p99, ms.max())
+        return stats
+
+    def save_trace(self, path):
+        # Chrome trace event JSON, open it in chrome://tracing or Perfetto
+        pid, tid = os.getpid(), threading.get_ident()
+        events = [
+            {'name': name, 'cat': 'paint', 'ph': 'X', 'ts': round(start * 1e6, 3),
+             'dur': round(seconds * 1e6, 3), 'pid': pid, 'tid': tid}
+            for spans in self.frames for name, start, seconds in spans
+        ]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+
+class ProfilerOverlay:
+    # A table of the profiler's stats over the canvas, re-rendered at most
+    # every PROFILE_OVERLAY_INTERVAL seconds so reading it is cheap
+    def __init__(self, profiler, pos=(10, 10)):
+        self.profiler = profiler
+        self.pos = pos
+        self.surface = None
+        self.rendered_at = None
+
+    def get_surface(self):
+        now = time.perf_counter()
+        if self.surface is None or now - self.rendered_at >= PROFILE_OVERLAY_INTERVAL:
+            self.surface = self.render()
+            self.rendered_at = now
+        return self.surface
+
+    def render(self):
+        font = get_font(14)
+        rows = [('scope', 'frames', 'p50', 'p90', 'p99', 'max')]
+        for name, (count, *ms) in sorted(self.profiler.stats().items()):
+            rows.append((name, str(count)) + tuple(f"{value:.2f}" for value in ms))
+        widths = [110, 60, 55, 55, 55, 55]
+        line = font.get_linesize()
+        title = font.render(f"ms over the last {len(self.profiler.frames)} frames (F4 saves a trace)", True, WHITE)
+        surface = pygame.Surface((max(sum(widths), title.get_width()) + 10, line * (len(rows) + 1) + 10))
+        surface.fill(DARK_GREY)
+        surface.blit(title, (5, 5))
+        for i, row in enumerate(rows):
+            x = 5
+            for text, width in zip(row, widths):
+                surface.blit(font.render(text, True, YELLOW if i == 0 else WHITE), (x, 5 + line * (i + 1)))
+                x += width
+        return surface
+
+    def draw(self, win):
+        # Returns the window rect drawn to
+        return win.blit(self.get_surface(), self.pos)
@@ -0,0 +1,386 @@
+# utils/project.py
+
+import os
+import mmap
+import zlib
+import struct
+import numpy as np
+from .settings import TILE_SIZE, PROJECT_COMPRESSION
+from .grid import uniform_block, uniform_color
+from .layers import pack_layer_state, unpack_layer_state
+
+# Native document format. The canvas is stored as square tiles so a file
+# can be opened through mmap and each tile read only when it is needed,
+# and saved again by appending just the tiles that changed.
+#
+# File layout:
+#   header | tile payloads ... | index
+# The header points at the current index: the background cell, an entry
+# per stored tile
+#   tile row, tile col, payload offset, payload length, codec, colour
+# kept field by field, then the layer state. All of it is zlib
+# compressed, which packs a poster's worth of mostly uniform tiles into a
+# few kilobytes.
+# Cells are stored as the grid's read_region returns them, RGBA of every
+# layer side by side for a LayerStack (whose layers are then loaded tile
+# by tile each on their own). Tiles that are all one colour have no
+# payload, background tiles no entry. A save appends the changed payloads and a new index, syncs them,
+# then rewrites the header, so a save cut short leaves the old document.
+# Payloads no index points at any more are dropped when the file is
+# rewritten, once they take more room than the live ones.
+
+MAGIC = b'PAINTPRJ'
+VERSION = 2
+# magic, version, channels, rows, cols, tile size, index offset, index bytes, entries
+HEADER = struct.Struct('<8sHHIIIQII')
+
+RAW, ZLIB, UNIFORM = range(3)
+
+
+def entry_dtype(channels):
+    return np.dtype([
+        ('row', '<u4'), ('col', '<u4'), ('offset', '<u8'), ('length', '<u4'), ('codec', 'u1'),
+        ('color', 'u1', channels),
+    ])
+
+
+def unpack_index(data, count, channels):
+    # Field name -> array, the index stores one field after the other.
+    # Returns them and the offset after the last one
+    entry = entry_dtype(channels)
+    fields = {}
+    offset = 0
+    for name in entry.names:
+        dtype = entry.fields[name][0]
+        size = count * dtype.itemsize
+        fields[name] = np.frombuffer(data, dtype=dtype.base, count=size // dtype.base.itemsize, offset=offset)
+        fields[name] = fields[name].reshape((count,) + dtype.shape)
+        offset += size
+    return fields, offset
+
+
+class TileRef:
+    # Stands in for a tile still on disk, TiledGrid loads it on first use.
+    # layer picks a layer's channels out of a LayerStack's tile
+    __slots__ = ('project', 'key', 'layer')
+
+    def __init__(self, project, key, layer=None):
+        self.project = project
+        self.key = key
+        self.layer = layer
+
+    def load(self):
+        return self.project.load_tile(self.key, self.layer)
+
+
+def tile_keys(grid, size):
+    # Every tile that may hold something other than background
+    if getattr(grid, 'tile_size', None) == size:
+        return {(row0 // size, col0 // size) for row0, col0, _, _ in grid.painted_rects()}
+    return {(row, col) for row in range((grid.rows - 1) // size + 1) for col in range((grid.cols - 1) // size + 1)}
+
+
+class Project:
+    def __init__(self, path, rows, cols, color, tile_size=TILE_SIZE):
+        self.path = path
+        self.rows = rows
+        self.cols = cols
+        self.color = tuple(color)
+        self.tile_size = tile_size
+        self.layers = None     # Layer state of a LayerStack document
+        self.index = {}        # (tile_row, tile_col) -> (offset, length, codec, colour)
+        self.index_offset = 0  # Where the current index starts
+        self.index_size = 0
+        self.live = 0          # Payload bytes the index points at
+        self.file = None
+        self.map = None
+        self.grid = None
+        self.decoded = None    # (key, cells) of the last tile read, shared by its layers
+        # Tiles written since the document was opened or last saved
+        self.changed = set()
+
+    @classmethod
+    def open(cls, path):
+        # Reads the header and index only, tiles are loaded on demand. The
+        # file is opened read-only, so read-only files open too
+        file = open(path, 'rb')
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            file.close()
+            raise ValueError(f"{path} is not a project file")
+        magic, version, channels, rows, cols, tile_size, index_offset, index_size, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            data.close()
+            file.close()
+            raise ValueError(f"{path} is not a project file")
+
+        index = zlib.decompress(data[index_offset:index_offset + index_size])
+        project = cls(path, rows, cols, tuple(index[:channels]), tile_size)
+        project.file = file
+        project.map = data
+        project.index_offset = index_offset
+        project.index_size = index_size
+        fields, offset = unpack_index(index[channels:], count, channels)
+        project.layers = unpack_layer_state(index, channels + offset)[0]
+        rows, cols, offsets, lengths, codecs, colors = (fields[name].tolist() for name in entry_dtype(channels).names)
+        project.index = {
+            key: (offset, length, codec, tuple(color))
+            for key, offset, length, codec, color in zip(zip(rows, cols), offsets, lengths, codecs, colors)
+        }
+        project.live = int(fields['length'].sum())
+        return project
+
+    def tile_rect(self, key):
+        size = self.tile_size
+        top, left = key[0] * size, key[1] * size
+        return top, left, min(top + size, self.rows), min(left + size, self.cols)
+
+    def load_tile(self, key, layer=None):
+        # The tile as TiledGrid stores it: a full size array or a colour.
+        # With a layer, only that layer's channels
+        channels = slice(None) if layer is None else slice(4 * layer, 4 * layer + 4)
+        offset, length, codec, color = self.index[key]
+        if codec == UNIFORM:
+            return color[channels]
+        if self.decoded is None or self.decoded[0] != key:
+            payload = self.map[offset:offset + length]
+            if codec == ZLIB:
+                payload = zlib.decompress(payload)
+            row0, col0, row1, col1 = self.tile_rect(key)
+            size = self.tile_size
+            tile = np.empty((size, size, len(self.color)), dtype=np.uint8)
+            tile[...] = self.color
+            cells = np.frombuffer(payload, dtype=np.uint8).reshape(row1 - row0, col1 - col0, len(self.color))
+            tile[:row1 - row0, :col1 - col0] = cells
+            self.decoded = (key, tile)
+        tile = self.decoded[1][:, :, channels]
+        if layer is not None and (tile == tile[0, 0]).all():
+            return tuple(tile[0, 0].tolist())  # A layer with nothing of its own here
+        return tile.copy()
+
+    def load_into(self, grid):
+        # Makes grid show this document. A TiledGrid (or a LayerStack of
+        # them) with the same tiles gets references and reads each tile
+        # when it is first used, any other grid is written in full
+        if (grid.rows, grid.cols) != (self.rows, self.cols):
+            raise ValueError(f"the project is {self.rows}x{self.cols} cells, the canvas {grid.rows}x{grid.cols}")
+        layered = hasattr(grid, 'layer_state')
+        if layered != (self.layers is not None):
+            raise ValueError("the project has layers and the canvas doesn't, or the other way round")
+        if not layered and len(grid.color) != len(self.color):
+            raise ValueError(f"the project has {len(self.color)} channels, the canvas {len(grid.color)}")
+        grid.clear()
+        if layered:
+            grid.set_layer_state(self.layers)
+            grids = list(enumerate(grid.grids()))
+        else:
+            grids = [(None, grid)]
+        if all(getattr(target, 'tile_size', None) == self.tile_size for _, target in grids) and grid.color == self.color:
+            grid.mark_all_dirty()
+            for key, (offset, length, codec, color) in self.index.items():
+                for layer, target in grids:
+                    if codec == UNIFORM:
+                        target.set_tile(key, color if layer is None else color[4 * layer:4 * layer + 4])
+                    else:
+                        target.grid[key] = TileRef(self, key, layer)
+        else:
+            for key in self.index:
+                row0, col0, row1, col1 = self.tile_rect(key)
+                tile = self.load_tile(key)
+                if isinstance(tile, tuple):
+                    grid.write_region(row0, col0, uniform_block(tile, (row1 - row0, col1 - col0, len(tile))))
+                else:
+                    grid.write_region(row0, col0, tile[:row1 - row0, :col1 - col0])
+        self.track(grid)
+
+    def track(self, grid):
+        if self.grid is not grid:
+            if self.grid is not None:
+                self.grid.remove_listener(self.on_change)
+            self.grid = grid
+            grid.add_listener(self.on_change)
+        self.changed = set()
+
+    def on_change(self, row0, col0, row1, col1):
+        size = self.tile_size
+        for tile_row in range(row0 // size, (row1 - 1) // size + 1):
+            for tile_col in range(col0 // size, (col1 - 1) // size + 1):
+                self.changed.add((tile_row, tile_col))
+
+    def changed_blocks(self):
+        # (row0, col0, cells) of every tile that differs from the file
+        for key in self.changed:
+            row0, col0, row1, col1 = self.tile_rect(key)
+            yield row0, col0, self.grid.read_region(row0, col0, row1, col1)
+
+    def encode(self, cells):
+        # (codec, colour, payload) for a tile's cells
+        color = uniform_color(cells)
+        if color is None and (cells == cells[0, 0]).all():
+            color = tuple(cells[0, 0].tolist())
+        if color is not None:
+            return UNIFORM, color, b''
+        payload = np.ascontiguousarray(cells).tobytes()
+        if PROJECT_COMPRESSION:
+            packed = zlib.compress(payload, PROJECT_COMPRESSION)
+            if len(packed) < len(payload) * 0.9:
+                return ZLIB, (0,) * len(self.color), packed
+        return RAW, (0,) * len(self.color), payload
+
+    def save(self, grid=None):
+        # Writes grid (by default the one being tracked) to self.path.
+        # Returns the number of tiles written
+        if grid is not None and grid is not self.grid:
+            self.track(grid)
+            self.changed = tile_keys(grid, self.tile_size) | set(self.index)
+        grid = self.grid
+        rewrite = self.map is None
+        if tuple(grid.color) != self.color:
+            # Layers were added or removed, every tile has other channels now.
+            # Tiles still on disk are read while the old index is there
+            self.load_all()
+            self.color = tuple(grid.color)
+            self.changed = tile_keys(grid, self.tile_size) | set(self.index)
+            self.index = {}
+            rewrite = True
+        self.layers = grid.layer_state() if hasattr(grid, 'layer_state') else None
+        garbage = self.index_offset - HEADER.size - self.live
+        if rewrite or garbage > self.live or not self.writable():
+            written = len(self.changed)
+            self.rewrite()
+        else:
+            written = self.append()
+        self.changed = set()
+        return written
+
+    def load_all(self):
+        # Replaces every TileRef into this file in the tracked grid with
+        # the tile it stands for
+        grids = self.grid.grids() if hasattr(self.grid, 'layer_state') else [self.grid]
+        for target in grids:
+            tiles = getattr(target, 'grid', None)
+            if not isinstance(tiles, dict):
+                continue
+            for key, tile in tiles.items():
+                if isinstance(tile, TileRef) and tile.project is self:
+                    tiles[key] = tile.load()
+
+    def writable(self):
+        # The file is reopened for writing by the first save appending to
+        # it. One that can't be written is saved by a rewrite instead
+        if self.file.mode == 'rb':
+            try:
+                file = open(self.path, 'r+b')
+            except OSError:
+                return False
+            self.file.close()
+            self.file = file
+        return True
+
+    def append(self):
+        # Incremental save after the end of the file, nothing the current
+        # header points at is overwritten
+        end = self.file.seek(0, os.SEEK_END)
+        for key in self.changed:
+            row0, col0, row1, col1 = self.tile_rect(key)
+            codec, color, payload = self.encode(self.grid.read_region(row0, col0, row1, col1))
+            old = self.index.pop(key, None)
+            if old is not None:
+                self.live -= old[1]
+            if codec == UNIFORM and color == self.color:
+                continue  # Background, no entry
+            self.index[key] = (end, len(payload), codec, color)
+            self.file.write(payload)
+            end += len(payload)
+            self.live += len(payload)
+        self.index_offset = end
+        self.file.write(self.pack_index())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        # Only now point the header at the new index
+        self.file.seek(0)
+        self.file.write(self.pack_header())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.remap()
+        return len(self.changed)
+
+    def rewrite(self):
+        # Full save into a new file, copying unchanged payloads as they are
+        temp_path = self.path + '.tmp'
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        index = {}
+        with open(temp_path, 'wb') as f:
+            f.write(bytes(HEADER.size))
+            end = HEADER.size
+            for key in sorted(self.changed | set(self.index)):
+                if key in self.changed:
+                    row0, col0, row1, col1 = self.tile_rect(key)
+                    codec, color, payload = self.encode(self.grid.read_region(row0, col0, row1, col1))
+                else:
+                    offset, length, codec, color = self.index[key]
+                    payload = self.map[offset:offset + length]
+                if codec == UNIFORM and color == self.color:
+                    continue
+                index[key] = (end, len(payload), codec, color)
+                f.write(payload)
+                end += len(payload)
+            self.index = index
+            self.index_offset = end
+            self.live = end - HEADER.size
+            f.write(self.pack_index())
+            f.seek(0)
+            f.write(self.pack_header())
+            f.flush()
+            os.fsync(f.fileno())
+        # The old file has to be let go of before it can be replaced
+        self.close_file()
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, 'rb')
+        self.remap()
+
+    def pack_header(self):
+        return HEADER.pack(
+            MAGIC, VERSION, len(self.color), self.rows, self.cols, self.tile_size,
+            self.index_offset, self.index_size, len(self.index),
+        )
+
+    def pack_index(self):
+        entry = entry_dtype(len(self.color))
+        entries = np.zeros(len(self.index), dtype=entry)
+        if self.index:
+            keys, values = zip(*sorted(self.index.items()))
+            entries['row'], entries['col'] = zip(*keys)
+            offsets, lengths, codecs, colors = zip(*values)
+            entries['offset'] = offsets
+            entries['length'] = lengths
+            entries['codec'] = codecs
+            entries['color'] = colors
+        fields = b''.join(np.ascontiguousarray(entries[name]).tobytes() for name in entry.names)
+        data = zlib.compress(bytes(self.color) + fields + pack_layer_state(self.layers), 6)
+        self.index_size = len(data)
+        return data
+
+    def remap(self):
+        # Tiles still on disk are read through the map, it has to cover the file
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close_file(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        # Tiles that were never loaded can't be read any more afterwards
+        if self.grid is not None:
+            self.grid.remove_listener(self.on_change)
+            self.grid = None
+        self.close_file()
@@ -0,0 +1,181 @@
+# utils/renderer.py
+
+import math
+import pygame
+from .settings import *
+
+
+class CanvasRenderer:
+    def __init__(self, grid, pixel_size=PIXEL_SIZE):
+        self.grid = grid
+        self.pixel_size = pixel_size
+        # One surface pixel per cell, plus the same image at window scale
+        self.surface = pygame.Surface((grid.cols, grid.rows))
+        self.scaled = pygame.Surface((grid.cols * pixel_size, grid.rows * pixel_size))
+        self.grid_lines = None
+        # Union of the cells changed since the last refresh, half-open
+        self.dirty = None
+        grid.add_listener(self.mark_dirty)
+        self.mark_dirty(0, 0, grid.rows, grid.cols)
+
+    def mark_dirty(self, row0, col0, row1, col1):
+        if self.dirty is None:
+            self.dirty = [row0, col0, row1, col1]
+        else:
+            dirty = self.dirty
+            dirty[0] = min(dirty[0], row0)
+            dirty[1] = min(dirty[1], col0)
+            dirty[2] = max(dirty[2], row1)
+            dirty[3] = max(dirty[3], col1)
+
+    def refresh(self):
+        # Copy the changed cells into the surfaces, returns the updated window rect
+        if self.dirty is None:
+            return None
+        row0, col0, row1, col1 = self.dirty
+        self.dirty = None
+
+        pixels = pygame.surfarray.pixels3d(self.surface)
+        pixels[col0:col1, row0:row1] = self.grid.read_region(row0, col0, row1, col1).swapaxes(0, 1)
+        del pixels  # Unlock the surface before blitting from it
+
+        cell_rect = pygame.Rect(col0, row0, col1 - col0, row1 - row0)
+        size = self.pixel_size
+        scaled_rect = pygame.Rect(col0 * size, row0 * size, cell_rect.width * size, cell_rect.height * size)
+        pygame.transform.scale(
+            self.surface.subsurface(cell_rect), scaled_rect.size, self.scaled.subsurface(scaled_rect)
+        )
+        return scaled_rect
+
+    def get_surface(self):
+        # Canvas at window scale, up to date
+        self.refresh()
+        return self.scaled
+
+    def get_grid_lines(self):
+        # Built once, the grid size never changes
+        if self.grid_lines is None:
+            size = self.pixel_size
+            width, height = self.scaled.get_size()
+            self.grid_lines = pygame.Surface((width + 1, height + 1), pygame.SRCALPHA)
+            for i in range(self.grid.rows + 1):
+                pygame.draw.line(self.grid_lines, BLACK, (0, i * size), (width, i * size))
+            for j in range(self.grid.cols + 1):
+                pygame.draw.line(self.grid_lines, BLACK, (j * size, 0), (j * size, height))
+        return self.grid_lines
+
+    def draw(self, win, pos=(0, 0), areas=None):
+        # Draws the canvas, or with areas only those window rects and the
+        # part that changed since the last draw. Returns the rects drawn
+        changed = self.refresh()
+        bounds = pygame.Rect(pos, self.scaled.get_size())
+        if areas is None:
+            rects = [bounds]
+        else:
+            rects = list(areas)
+            if changed is not None:
+                rects.append(changed.move(pos))
+            rects = [rect.clip(bounds) for rect in rects]
+        clip = win.get_clip()
+        for rect in rects:
+            if not rect:
+                continue
+            win.set_clip(rect)
+            win.blit(self.scaled, pos)
+            if DRAW_GRID_LINES:
+                win.blit(self.get_grid_lines(), pos)
+        win.set_clip(clip)
+        return [rect for rect in rects if rect]
+
+
+class ViewportRenderer:
+    # Renders only the cells a Viewport shows, so the cost of a frame
+    # follows the window size whatever the size of the document
+    def __init__(self, grid, viewport):
+        self.grid = grid
+        self.viewport = viewport
+        self.view = None      # (row0, col0, row1, col1, zoom) the surfaces hold
+        self.drawn = None     # self.view and the window offset last drawn at
+        self.surface = None   # One pixel per visible cell
+        self.scaled = None
+        self.dirty = None
+        grid.add_listener(self.mark_dirty)
+
+    def mark_dirty(self, row0, col0, row1, col1):
+        if self.dirty is None:
+            self.dirty = [row0, col0, row1, col1]
+        else:
+            dirty = self.dirty
+            dirty[0] = min(dirty[0], row0)
+            dirty[1] = min(dirty[1], col0)
+            dirty[2] = max(dirty[2], row1)
+            dirty[3] = max(dirty[3], col1)
+
+    def refresh(self):
+        # Returns the rect of self.scaled that changed, all of it after a pan or zoom
+        view = self.viewport.visible_cells() + (self.viewport.zoom,)
+        top, left, bottom, right, zoom = view
+        if view != self.view:
+            # Panned a cell or zoomed, everything in view is redrawn
+            self.view = view
+            self.surface = pygame.Surface((right - left, bottom - top))
+            self.scaled = pygame.Surface(((right - left) * zoom, (bottom - top) * zoom))
+            self.dirty = None
+            row0, col0, row1, col1 = top, left, bottom, right
+        elif self.dirty is None:
+            return None
+        else:
+            # Changes outside the view are picked up when they come into it
+            row0, col0 = max(self.dirty[0], top), max(self.dirty[1], left)
+            row1, col1 = min(self.dirty[2], bottom), min(self.dirty[3], right)
+            self.dirty = None
+            if row0 >= row1 or col0 >= col1:
+                return None
+
+        pixels = pygame.surfarray.pixels3d(self.surface)
+        pixels[col0 - left:col1 - left, row0 - top:row1 - top] = (
+            self.grid.read_region(row0, col0, row1, col1).swapaxes(0, 1)
+        )
+        del pixels  # Unlock the surface before blitting from it
+
+        cell_rect = pygame.Rect(col0 - left, row0 - top, col1 - col0, row1 - row0)
+        scaled_rect = pygame.Rect(cell_rect.x * zoom, cell_rect.y * zoom, cell_rect.width * zoom, cell_rect.height * zoom)
+        pygame.transform.scale(
+            self.surface.subsurface(cell_rect), scaled_rect.size, self.scaled.subsurface(scaled_rect)
+        )
+        return scaled_rect
+
+    def draw(self, win, pos=(0, 0), areas=None):
+        # Draws the view, or with areas only those window rects and the
+        # part that changed since the last draw. Returns the rects drawn
+        changed = self.refresh()
+        viewport = self.viewport
+        area = pygame.Rect(pos, (viewport.width, viewport.height))
+        # The first visible cell is usually only partly in view. Rounded
+        # down like Viewport.to_canvas, so a pixel shows the cell it paints
+        offset = (
+            pos[0] - (math.floor(viewport.x * viewport.zoom) - self.view[1] * viewport.zoom),
+            pos[1] - (math.floor(viewport.y * viewport.zoom) - self.view[0] * viewport.zoom),
+        )
+        drawn = self.view + offset
+        if areas is None or drawn != self.drawn:
+            # Panned or zoomed, the whole area moves
+            self.drawn = drawn
+            rects = [area]
+        else:
+            rects = list(areas)
+            if changed is not None:
+                rects.append(changed.move(offset))
+            rects = [rect.clip(area) for rect in rects]
+        document = viewport.document_rect().move(pos)
+        clip = win.get_clip()
+        for rect in rects:
+            if not rect:
+                continue
+            win.set_clip(rect)
+            # Past the document edge when it is smaller than the area
+            if not document.contains(rect):
+                win.fill(UI_BG_COLOR, rect)
+            win.blit(self.scaled, offset)
+        win.set_clip(clip)
+        return [rect for rect in rects if rect]
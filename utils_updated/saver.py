@@ -0,0 +1,152 @@
+# utils/saver.py
+
+import os
+import threading
+import numpy as np
+import pygame
+from .settings import PIXEL_SIZE
+from .export import export_image
+
+# Posted to the event queue when a save ends, with `filename`, `error`
+# (None on success) and `snapshot` attributes
+SAVE_FINISHED = pygame.event.custom_type()
+# Posted when the saver thread waits for the next band of cells, the main
+# loop answers by calling BackgroundSaver.serve()
+SAVE_READ = pygame.event.custom_type()
+
+
+class CanvasSnapshot:
+    # A region of a grid as it was when the snapshot was taken, read a
+    # band of rows at a time on the thread that paints the grid. Nothing
+    # is copied up front: rows are copied just before they change (grid
+    # listeners run before a write) or when they are read, so memory
+    # stays around a band plus what is painted over during the save
+    def __init__(self, grid, row0, col0, row1, col1):
+        self.grid = grid
+        self.bounds = (row0, col0, row1, col1)
+        self.rows = row1 - row0
+        self.cols = col1 - col0
+        self.next_row = 0  # Rows above it were read already
+        self.kept = {}     # Row -> its cells from before a change, for rows not read yet
+        grid.add_listener(self.on_change)
+
+    def on_change(self, row0, col0, row1, col1):
+        top, left, bottom, right = self.bounds
+        if col1 <= left or col0 >= right:
+            return
+        missing = [row for row in range(max(row0 - top, self.next_row), min(row1 - top, self.rows))
+                   if row not in self.kept]
+        if missing:
+            cells = self.grid.read_region(top + missing[0], left, top + missing[-1] + 1, right)
+            for row in missing:
+                self.kept[row] = cells[row - missing[0]]
+
+    def read(self, row0, row1):
+        # Rows row0 to row1 of the region, read in order
+        top, left, bottom, right = self.bounds
+        cells = self.grid.read_region(top + row0, left, top + row1, right)
+        kept = [row for row in range(row0, row1) if row in self.kept]
+        if kept:
+            cells = np.array(cells)  # A uniform block is a read-only view
+            for row in kept:
+                cells[row - row0] = self.kept.pop(row)
+        self.next_row = row1
+        return cells
+
+    def close(self):
+        self.grid.remove_listener(self.on_change)
+        self.kept = {}
+
+
+class BackgroundSaver:
+    def __init__(self, scale=PIXEL_SIZE):
+        self.scale = scale
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        # Only the newest request waits, presses during a save collapse into it
+        self.pending = None
+        self.closing = False
+        self.thread = None  # Started by the first save, most sessions never save an image
+        self.request = None  # (snapshot, row0, row1) of the band the saver thread waits for
+        self.band = None
+
+    def save(self, snapshot, filename):
+        # snapshot is a CanvasSnapshot of RGB cells, closed once the save is
+        # replaced here or ends (SAVE_FINISHED). Returns False if it replaced a request that hadn't started yet
+        with self.lock:
+            replaced = self.pending is not None
+            if replaced:
+                self.pending[0].close()
+            self.pending = (snapshot, filename)
+            self.wake.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.worker, name='image-saver', daemon=True)
+                self.thread.start()
+        return not replaced
+
+    def serve(self):
+        # Main thread, on SAVE_READ: reads the band the saver thread asked for
+        with self.lock:
+            if self.request is None:
+                return
+            snapshot, row0, row1 = self.request
+            self.band = snapshot.read(row0, row1)
+            self.request = None
+            self.wake.notify_all()
+
+    def read(self, snapshot, row0, row1):
+        # Saver thread: a band is read by the main thread, which owns the
+        # grid. Once the app is closing the main thread only waits for the
+        # save and the band is read here
+        with self.lock:
+            if not self.closing:
+                self.request = (snapshot, row0, row1)
+                try:
+                    pygame.event.post(pygame.event.Event(SAVE_READ))
+                except pygame.error:
+                    self.request = None  # The display is already gone
+                while self.request is not None and not self.closing:
+                    self.wake.wait()
+                if self.request is None:
+                    band, self.band = self.band, None
+                    return band
+                self.request = None
+            return snapshot.read(row0, row1)
+
+    def close(self):
+        # Finishes the save in progress and any waiting one
+        with self.lock:
+            self.closing = True
+            self.wake.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+    def worker(self):
+        while True:
+            with self.lock:
+                while self.pending is None and not self.closing:
+                    self.wake.wait()
+                if self.pending is None:
+                    return
+                snapshot, filename = self.pending
+                self.pending = None
+
+            error = None
+            try:
+                directory = os.path.dirname(filename)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # A square of scale pixels per cell, streamed a band at a time
+                export_image(filename, lambda row0, row1: self.read(snapshot, row0, row1),
+                             snapshot.rows, snapshot.cols, self.scale)
+            except Exception as e:
+                # Whatever went wrong is reported, the thread stays up for
+                # the next save
+                error = str(e) or type(e).__name__
+
+            try:
+                # The main thread closes the snapshot, it owns the grid
+                pygame.event.post(pygame.event.Event(SAVE_FINISHED, filename=filename, error=error,
+                                                     snapshot=snapshot))
+            except pygame.error:
+                pass  # The display is already gone
@@ -0,0 +1,229 @@
+# utils/selection.py
+
+import pygame
+import numpy as np
+from .settings import *
+from .grid import uniform_block
+
+# Rectangular selection on the active layer of a LayerStack. Copying
+# keeps only the selected cells (a tiled layer hands back one shared
+# block for a tile of one colour) and pasting the same clipboard again
+# doesn't copy it. Pasted and moved cells float: they are only drawn over
+# the canvas, by SelectionOverlay, until commit() writes them in one
+# block per rect it touches, so a move can be cancelled for nothing.
+# Moving lifts the cells without clearing them, the overlay draws the
+# hole they leave until the commit clears it.
+
+
+def cells_over(top, bottom):
+    # RGBA cells composited over RGBA cells
+    top = top.astype(np.float32)
+    bottom = bottom.astype(np.float32)
+    a = top[..., 3:] * np.float32(1 / 255)
+    below = bottom[..., 3:] * np.float32(1 / 255) * (1 - a)
+    coverage = a + below
+    rgb = top[..., :3] * a + bottom[..., :3] * below
+    np.divide(rgb, coverage, out=rgb, where=coverage > 0)
+    cells = np.minimum(np.concatenate([rgb, coverage * 255], axis=-1) + 0.5, 255).astype(np.uint8)
+    cells[cells[..., 3] == 0] = 0  # Plain transparent, as the eraser leaves
+    return cells
+
+
+def intersect(rect, other):
+    # Overlap of two (row0, col0, row1, col1) rects, None if they don't
+    row0, col0 = max(rect[0], other[0]), max(rect[1], other[1])
+    row1, col1 = min(rect[2], other[2]), min(rect[3], other[3])
+    if row0 < row1 and col0 < col1:
+        return row0, col0, row1, col1
+    return None
+
+
+class Selection:
+    def __init__(self, stack):
+        self.stack = stack
+        self.rect = None      # (row0, col0, row1, col1) selected, floating cells may go past the canvas
+        self.floating = None  # Cells being pasted or moved, not on the layer yet
+        self.source = None    # Where moved cells were lifted from, cleared on commit
+        self.version = 0      # Counts changes to the floating cells, for the overlay
+
+    def canvas_rect(self):
+        return 0, 0, self.stack.rows, self.stack.cols
+
+    def select(self, start, end):
+        # The cells from one (row, col) to another, both included, clipped
+        # to the canvas. Nothing is selected if that leaves none
+        rect = (min(start[0], end[0]), min(start[1], end[1]), max(start[0], end[0]) + 1, max(start[1], end[1]) + 1)
+        self.rect = intersect(rect, self.canvas_rect())
+
+    def clear(self):
+        self.rect = None
+
+    def contains(self, row, col):
+        return self.rect is not None and self.rect[0] <= row < self.rect[2] and self.rect[1] <= col < self.rect[3]
+
+    def copy(self):
+        # The selected cells, read-only so pastes can share them
+        if self.floating is not None:
+            return self.floating
+        if self.rect is None:
+            return None
+        cells = self.stack.active_grid().read_region(*self.rect)
+        cells.flags.writeable = False
+        return cells
+
+    def lift(self):
+        # The selected cells start floating, to be moved
+        self.floating = self.copy()
+        self.source = self.rect
+        self.version += 1
+
+    def paste(self, cells, row, col):
+        # cells float with their top-left corner at (row, col)
+        self.floating = cells
+        self.source = None
+        self.rect = (row, col, row + cells.shape[0], col + cells.shape[1])
+        self.version += 1
+
+    def move_to(self, row, col):
+        # Floating cells only, nothing is written
+        self.rect = (row, col, row + self.rect[2] - self.rect[0], col + self.rect[3] - self.rect[1])
+
+    def cancel(self):
+        # Drops the floating cells, moved ones go back where they were
+        if self.floating is None:
+            return
+        self.rect = self.source
+        self.floating = None
+        self.source = None
+        self.version += 1
+
+    def commit(self, place=True):
+        # Writes the floating cells over the layer (unless place is False,
+        # which only clears where moved cells came from). Returns the rects
+        # written, one write each
+        if self.floating is None:
+            return []
+        grid = self.stack.active_grid()
+        target = intersect(self.rect, self.canvas_rect()) if place else None
+        rects = [rect for rect in (self.source, target) if rect is not None]
+        if len(rects) == 2 and intersect(*rects) is not None:
+            # Moved over itself, both go in one write
+            rects = [(min(rects[0][0], rects[1][0]), min(rects[0][1], rects[1][1]),
+                      max(rects[0][2], rects[1][2]), max(rects[0][3], rects[1][3]))]
+        for rect in rects:
+            row0, col0, row1, col1 = rect
+            shape = (row1 - row0, col1 - col0, len(grid.color))
+            if rect == self.source and (target is None or intersect(rect, target) is None):
+                grid.write_region(row0, col0, uniform_block(TRANSPARENT, shape))
+                continue
+            cells = np.array(grid.read_region(*rect))
+            hole = intersect(rect, self.source) if self.source is not None else None
+            if hole is not None:
+                top, left, bottom, right = hole
+                cells[top - row0:bottom - row0, left - col0:right - col0] = TRANSPARENT
+            top, left, bottom, right = intersect(rect, target)
+            part = self.floating[top - self.rect[0]:bottom - self.rect[0], left - self.rect[1]:right - self.rect[1]]
+            below = cells[top - row0:bottom - row0, left - col0:right - col0]
+            below[...] = cells_over(part, below)
+            grid.write_region(row0, col0, cells)
+        self.rect = target
+        self.floating = None
+        self.source = None
+        self.version += 1
+        return rects
+
+
+def cells_surface(cells, alpha=1.0):
+    # A pixel per cell, RGBA cells keep their alpha (times alpha)
+    surface = pygame.Surface((cells.shape[1], cells.shape[0]), pygame.SRCALPHA if cells.shape[2] == 4 else 0)
+    pixels = pygame.surfarray.pixels3d(surface)
+    pixels[...] = cells[..., :3].swapaxes(0, 1)
+    del pixels
+    if cells.shape[2] == 4:
+        pixels = pygame.surfarray.pixels_alpha(surface)
+        pixels[...] = (cells[..., 3] * alpha).astype(np.uint8).T
+        del pixels  # Unlock the surface before blitting from it
+    return surface
+
+
+class SelectionOverlay:
+    # Draws a Selection over the canvas a Viewport shows: the hole moved
+    # cells leave, the floating cells and a marquee. The floating cells
+    # and the hole become a surface once, and the part of them in view is
+    # scaled once per zoom, so dragging them around only blits
+    def __init__(self, selection, viewport):
+        self.selection = selection
+        self.viewport = viewport
+        self.version = None  # selection.version the surfaces were made for
+        self.surfaces = {}   # 'hole' and 'floating' -> surface, a pixel per cell
+        self.scaled = {}     # Same keys -> (part of it and zoom, scaled surface)
+
+    def window_rect(self, rect):
+        row0, col0, row1, col1 = rect
+        zoom = self.viewport.zoom
+        document = self.viewport.document_rect()
+        return pygame.Rect(document.x + col0 * zoom, document.y + row0 * zoom,
+                           (col1 - col0) * zoom, (row1 - row0) * zoom)
+
+    def view_rect(self):
+        return pygame.Rect(0, 0, self.viewport.width, self.viewport.height)
+
+    def rect(self):
+        # The window rect draw() will cover, None if there is nothing to draw
+        selection = self.selection
+        rects = [self.window_rect(rect).inflate(2, 2) for rect in (selection.rect, selection.source) if rect]
+        if not rects:
+            return None
+        rect = rects[0].unionall(rects[1:]).clip(self.view_rect())
+        return rect or None
+
+    def refresh(self):
+        selection = self.selection
+        if selection.version == self.version:
+            return
+        self.version = selection.version
+        self.surfaces.clear()
+        self.scaled.clear()
+        if selection.floating is None:
+            return
+        stack = selection.stack
+        self.surfaces['floating'] = cells_surface(selection.floating, stack.layers[stack.active].alpha())
+        if selection.source is not None:
+            row0, col0, row1, col1 = selection.source
+            hole = uniform_block(TRANSPARENT, (row1 - row0, col1 - col0, len(TRANSPARENT)))
+            self.surfaces['hole'] = cells_surface(stack.preview_region(row0, col0, hole))
+
+    def blit(self, win, name, rect):
+        target = self.window_rect(rect)
+        view = self.view_rect()
+        zoom = self.viewport.zoom
+        surface = self.surfaces[name]
+        # Only the cells in view are scaled
+        col0, row0 = max((view.x - target.x) // zoom, 0), max((view.y - target.y) // zoom, 0)
+        col1 = min(-((target.x - view.right) // zoom), surface.get_width())
+        row1 = min(-((target.y - view.bottom) // zoom), surface.get_height())
+        if col0 >= col1 or row0 >= row1:
+            return
+        key = (col0, row0, col1, row1, zoom)
+        if name not in self.scaled or self.scaled[name][0] != key:
+            part = surface.subsurface((col0, row0, col1 - col0, row1 - row0))
+            self.scaled[name] = (key, pygame.transform.scale(part, ((col1 - col0) * zoom, (row1 - row0) * zoom)))
+        win.blit(self.scaled[name][1], (target.x + col0 * zoom, target.y + row0 * zoom))
+
+    def draw(self, win):
+        selection = self.selection
+        if selection.rect is None and selection.floating is None:
+            return
+        self.refresh()
+        clip = win.get_clip()
+        win.set_clip(self.view_rect())
+        if selection.source is not None:
+            self.blit(win, 'hole', selection.source)
+        if selection.floating is not None:
+            self.blit(win, 'floating', selection.rect)
+        if selection.rect is not None:
+            # Black and white, to show on any colour
+            marquee = self.window_rect(selection.rect).inflate(2, 2)
+            pygame.draw.rect(win, BLACK, marquee, 1)
+            pygame.draw.rect(win, WHITE, marquee.inflate(-2, -2), 1)
+        win.set_clip(clip)
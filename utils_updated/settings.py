@@ -1,6 +1,9 @@
 # utils/settings.py
 
+import os
+import json
 import pygame
+from functools import lru_cache
 
 # Color constants
 WHITE = (255, 255, 255)
@@ -16,15 +19,32 @@ YELLOW = (255, 255, 0)
 CYAN   = (0, 255, 255)
 PINK   = (255, 192, 203)
 BROWN  = (165, 42, 42)
+DISABLED_COLOR = (200, 200, 200)  # Light grey for buttons that can't be used
+TRANSPARENT = (0, 0, 0, 0)  # Erased layer cells, the layers below show through
 
 # Brush dynamics
 MIN_SPEED = 50    # Minimum speed (pixels per second) corresponding to maximum brush size
 MAX_SPEED = 1000  # Maximum speed (pixels per second) corresponding to minimum brush size
 MIN_BRUSH_SIZE = 1
 MAX_BRUSH_SIZE = 20
+SOFT_BRUSH = True  # Anti-aliased strokes blended into the canvas (B toggles), False paints hard edged cells
+BRUSH_FEATHER = 1.0  # Cells the edge of the soft brush fades out over
+BRUSH_SPACING = 0.05  # How far apart soft brush stamps go: the most the stroke's edge may ripple, as a part of the feather
+BRUSH_KERNEL_CACHE = 256  # Soft brush stamp kernels kept, one per radius and reach it is stamped at
+STROKE_TILE_SIZE = 64  # A soft stroke keeps the cells it covered in tiles of this many cells square (tiled: TILE_SIZE)
+SHAPE_FILLED = False  # LINE, RECT and ELLIPSE start out drawing outlines, FILLED toggles
+POINTER_MIN_CUTOFF = 3.0  # Hz the pointer is smoothed at when still, lower takes out more of a slow hand's jitter
+POINTER_BETA = 0.05  # How fast that cutoff rises with speed (Hz per pixel per second), higher lags less on fast strokes
+POINTER_D_CUTOFF = 5.0  # Hz the pointer speed (brush size, predicted ink) is smoothed at
+POINTER_MIN_INTERVAL = 0.001  # Seconds between two pointer samples at the least, a 1000 Hz mouse
+PREDICT_INK_MS = 12  # How far ahead of the last pointer sample the stroke is drawn until real samples arrive, 0 turns it off
+PREDICT_INK_MAX = 24  # Window pixels predicted ink goes at most
+PREDICT_INK_IDLE_MS = 40  # Predicted ink is taken away when no pointer sample came for this long, the pointer stopped
+MEASURE_LATENCY = False  # Prints the input to display latency of drawn strokes on exit
 
 # Game settings
-FPS = 240
+FPS = 240  # Frame rate cap, input arriving faster is handled a frame at a time
+SCHEDULER = 'events'  # 'events' sleeps until there is input and redraws only what changed, 'poll' redraws everything every frame
 WIDTH, HEIGHT = 800, 600  # Fixed window size
 TOOLBAR_HEIGHT = 100
 PIXEL_SIZE = 4  # Adjusted PIXEL_SIZE based on new WIDTH and ROWS
@@ -35,6 +55,93 @@ UI_BG_COLOR = DARK_GREY          # Changed to DARK_GREY for better contrast
 CANVAS_BORDER_COLOR = BLACK
 CANVAS_BORDER_WIDTH = 2
 DRAW_GRID_LINES = False
+GRID_BACKEND = 'array'  # 'array' (numpy), 'list' (original list of tuples), 'tiled' (sparse, pan and zoom) or 'indexed' (palette index per cell)
+TILE_SIZE = 64  # Cells per side of a tile of the tiled backend
+DOCUMENT_ROWS, DOCUMENT_COLS = 16384, 16384  # Document size with the tiled backend
+ZOOM_LEVELS = (1, 2, 3, 4, 6, 8, 12, 16, 24, 32)  # Window pixels per cell the viewport can zoom to
+PAN_STEP = 40  # Window pixels the arrow keys pan by
+PAN_KEYS = {  # Key -> how far the document moves, the view goes the other way
+    pygame.K_LEFT: (PAN_STEP, 0),
+    pygame.K_RIGHT: (-PAN_STEP, 0),
+    pygame.K_UP: (0, PAN_STEP),
+    pygame.K_DOWN: (0, -PAN_STEP),
+}
+MAX_LAYERS = 16  # Layers a document can have
+LAYER_OPACITY_STEP = 0.1  # How much [ and ] change the active layer's opacity by
+COMPOSITE_TILE_SIZE = 32  # Cells per side of the chunks the layer composite is cached in (tiled: TILE_SIZE)
+FILL_TOLERANCE = 0  # Max RGBA distance from the clicked colour that still gets filled
+FILL_CONNECTIVITY = 4  # 4 or 8 (also spreads through diagonal gaps)
+HISTORY_BUDGET = 4 * 1024 * 1024  # Bytes of undo/redo data to keep
+HISTORY_TILE_SIZE = 16  # Undo steps store the changed tiles of this many cells square
+JOURNAL_PATH = 'recovery/canvas.journal'  # Crash recovery log, None to disable
+JOURNAL_CHECKPOINT_EVERY = 200  # Operations between full canvas checkpoints
+JOURNAL_TILE_SIZE = 64  # A checkpoint reads only the tiles of this many cells square changed since the last one (tiled: TILE_SIZE)
+JOURNAL_FLUSH_INTERVAL = 0.5  # Seconds the journal writer batches records before an fsync
+PROJECT_PATH = 'projects/canvas.paintproj'  # Where Ctrl+S saves a document that wasn't opened from a file
+PROJECT_COMPRESSION = 1  # zlib level for project tiles, 0 stores them raw
+EXPORT_SCALE = PIXEL_SIZE  # Pixels per cell of the images SAVE writes, 1 up to 32 for print
+EXPORT_FORMAT = 'png'  # 'png', 'bmp' or 'raw' (RGB bytes, no header) for SAVE
+EXPORT_BAND_BYTES = 8 * 1024 * 1024  # Image bytes scaled and encoded at a time, exports need a few times this in memory
+IMPORT_SAMPLING = 'average'  # How OPEN turns blocks of image pixels into cells: 'average' blends them, 'nearest' keeps hard edges
+IMPORT_SNAP_TO_PALETTE = False  # Snap the colours of opened images to the toolbar's colours and BG_COLOR
+FILTER_WORKERS = 0  # Threads image filters run on, 0 for one per core
+FILTER_TILE_SIZE = 128  # Cells per side of the tiles filters split the canvas into
+FILTER_BLUR_RADIUS = 2  # Cells either side the box blur averages over
+FILTER_BLUR_SIGMA = 1.5  # Spread of the Gaussian blur in cells
+FILTER_POSTERIZE_LEVELS = 4  # Values each colour channel keeps when posterized
+FILTER_BRIGHTNESS = 20  # Added to each channel by the brightness/contrast filter
+FILTER_CONTRAST = 1.2  # How much it stretches the channels away from mid grey
+FILTER_KEYS = {  # Key -> filter run over the active layer
+    pygame.K_F5: 'invert',
+    pygame.K_F6: 'grayscale',
+    pygame.K_F7: 'blur',
+    pygame.K_F8: 'gaussian_blur',
+    pygame.K_F9: 'posterize',
+    pygame.K_F10: 'brightness_contrast',
+}
+PROFILE_FRAMES = 600  # Frames the profiler keeps for the F3 overlay and the F4 trace
+PROFILE_OVERLAY_INTERVAL = 0.25  # Seconds between refreshes of the profiler overlay
+PROFILE_TRACE_DIR = 'profiles'  # Where F4 saves Chrome trace files
+LIVE_EXPORT = None  # Name of a shared memory block the canvas is mirrored into every frame, None to disable
+LIVE_EXPORT_MAX_RECTS = 64  # Changed rects a frame lists before they are merged into one
+FONT_NAME = "comicsans"  # System font the UI is drawn in, pygame's own when it isn't installed
+FONT_CACHE_PATH = 'cache/fonts.json'  # Where the font file found for FONT_NAME is kept between runs (delete it after installing fonts), None to look it up every start
 
+@lru_cache(maxsize=None)
+def font_path():
+    # The file of FONT_NAME, None for pygame's default font. Looking it up
+    # lists every font on the system, which can take longer than the rest
+    # of the start up, so the answer is kept in FONT_CACHE_PATH
+    if FONT_CACHE_PATH is not None:
+        try:
+            with open(FONT_CACHE_PATH) as f:
+                path = json.load(f)[FONT_NAME]
+            if path is None or os.path.exists(path):
+                return path
+        except (OSError, ValueError, KeyError):
+            pass  # Not looked up yet, or the font went away
+    path = pygame.font.match_font(FONT_NAME)
+    if FONT_CACHE_PATH is not None:
+        try:
+            os.makedirs(os.path.dirname(FONT_CACHE_PATH) or '.', exist_ok=True)
+            with open(FONT_CACHE_PATH + '.tmp', 'w') as f:
+                json.dump({FONT_NAME: path}, f)
+            os.replace(FONT_CACHE_PATH + '.tmp', FONT_CACHE_PATH)
+        except OSError as e:
+            print(f"Error caching the font path: {e}")
+    return path
+
+@lru_cache(maxsize=None)
 def get_font(size):
-    return pygame.font.SysFont("comicsans", size)
+    # What SysFont would give, without it listing the fonts each start
+    return pygame.font.Font(font_path(), size)
+
+@lru_cache(maxsize=512)
+def render_text(text, size, color):
+    # Rendered labels are shared between callers, don't draw onto them
+    return get_font(size).render(text, True, color)
+
+def clear_text_cache():
+    # Fonts die with pygame.font.quit(), call this before re-initialising
+    render_text.cache_clear()
+    get_font.cache_clear()
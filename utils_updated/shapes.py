@@ -0,0 +1,114 @@
+# utils/shapes.py
+
+import math
+import numpy as np
+import pygame
+from .settings import PIXEL_SIZE, BG_COLOR
+from .stroke import polyline_spans
+
+# Lines, rectangles and ellipses dragged from one canvas pixel position to
+# another and drawn with the brush size. They are rasterized as spans in
+# the form polyline_spans returns, (row0, lefts, rights) with one row of
+# lefts and rights per part of the shape, and a cell is in a shape when
+# its centre is, as for strokes. Outlines are as thick as a stroke with
+# the same brush: a rectangle is a closed polyline and an ellipse the ring
+# between the ellipses brush size pixels outside and inside its edge.
+# Filled shapes go out to the outside of their outline.
+#
+# While a shape is dragged draw_spans paints its spans on the window over
+# the canvas, the grid only gets them on release, in one fill_spans.
+
+SHAPES = ('line', 'rect', 'ellipse')
+
+
+def cell_columns(left, right, cols):
+    # Columns whose centre lies in [left, right], as [lefts, rights)
+    half = PIXEL_SIZE // 2
+    lefts = np.clip(np.ceil((left - half) / PIXEL_SIZE), 0, cols).astype(np.intp)
+    rights = np.clip(np.floor((right - half) / PIXEL_SIZE) + 1, 0, cols).astype(np.intp)
+    return lefts, rights
+
+
+def half_widths(dy, a, b):
+    # How far either side of the centre an ellipse with semi-axes a and b
+    # reaches at dy from it, NaN where it doesn't
+    with np.errstate(invalid='ignore'):
+        return a * np.sqrt(1 - (dy / b) ** 2) if b > 0 else np.full_like(dy, np.nan)
+
+
+def ellipse_spans(start, end, brush_size, filled, rows, cols):
+    (x0, y0), (x1, y1) = start, end
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    a, b = abs(x1 - x0) / 2 + brush_size, abs(y1 - y0) / 2 + brush_size
+    half = PIXEL_SIZE // 2
+    row0 = max(math.ceil((cy - b - half) / PIXEL_SIZE), 0)
+    row1 = min(math.floor((cy + b - half) / PIXEL_SIZE) + 1, rows)
+    if row0 >= row1:
+        return None
+    dy = np.arange(row0, row1) * PIXEL_SIZE + half - cy
+    outer = half_widths(dy, a, b)
+    lefts, rights = cell_columns(cx - outer, cx + outer, cols)
+    inner = half_widths(dy, a - 2 * brush_size, b - 2 * brush_size)
+    if filled or a <= 2 * brush_size:
+        return row0, lefts[None], rights[None]
+    # Rows through the hole have a part either side of it, cells whose
+    # centres are inside the inner ellipse are left out
+    hole = ~np.isnan(inner)
+    inner = np.where(hole, inner, 0)
+    before = np.where(hole, np.minimum(np.ceil((cx - inner - half) / PIXEL_SIZE), rights), rights)
+    after = np.where(hole, np.maximum(np.floor((cx + inner - half) / PIXEL_SIZE) + 1, lefts), rights)
+    before, after = np.clip(before, 0, cols).astype(np.intp), np.clip(after, 0, cols).astype(np.intp)
+    return row0, np.stack([lefts, after]), np.stack([before, rights])
+
+
+def shape_spans(shape, start, end, brush_size, filled, rows, cols):
+    # (row0, lefts, rights) of a shape from start to end, both (x, y) canvas
+    # pixel positions, None if it misses the canvas. A line is never filled
+    if shape == 'line':
+        return polyline_spans([start, end], brush_size, rows, cols)
+    if shape == 'ellipse':
+        return ellipse_spans(start, end, brush_size, filled, rows, cols)
+    (x0, y0), (x1, y1) = start, end
+    spans = polyline_spans([(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)], brush_size, rows, cols)
+    if spans is None or not filled:
+        return spans
+    row0, lefts, rights = spans
+    # The inside, one more part spanning it
+    y = np.arange(row0, row0 + lefts.shape[1]) * PIXEL_SIZE + PIXEL_SIZE // 2
+    inside = (y >= min(y0, y1)) & (y <= max(y0, y1))
+    left, right = cell_columns(np.where(inside, min(x0, x1), np.inf), np.where(inside, max(x0, x1), -np.inf), cols)
+    return row0, np.vstack([lefts, left]), np.vstack([rights, right])
+
+
+def span_runs(lefts, rights):
+    # (first row, rows, left, right) of each non-empty span of a part,
+    # rows in a row with the same span joined into one
+    change = np.flatnonzero((lefts[1:] != lefts[:-1]) | (rights[1:] != rights[:-1])) + 1
+    firsts = np.concatenate([[0], change])
+    counts = np.diff(np.concatenate([firsts, [len(lefts)]]))
+    keep = lefts[firsts] < rights[firsts]
+    return zip(firsts[keep].tolist(), counts[keep].tolist(), lefts[firsts][keep].tolist(), rights[firsts][keep].tolist())
+
+
+def draw_spans(win, viewport, spans, color):
+    # Paints spans as the viewport shows cells, over the view part of the
+    # window only. The eraser is shown in the paper colour. Returns the
+    # window rect painted, or None
+    if spans is None:
+        return None
+    row0, lefts, rights = spans
+    color = color[:3] if len(color) == 3 or color[3] else BG_COLOR
+    zoom = viewport.zoom
+    document = viewport.document_rect()
+    view = pygame.Rect(0, 0, viewport.width, viewport.height)
+    clip = win.get_clip()
+    win.set_clip(view)
+    painted = []
+    for part_lefts, part_rights in zip(lefts, rights):
+        for first, count, left, right in span_runs(part_lefts, part_rights):
+            rect = pygame.Rect(document.x + left * zoom, document.y + (row0 + first) * zoom,
+                               (right - left) * zoom, count * zoom)
+            painted.append(win.fill(color, rect))
+    win.set_clip(clip)
+    painted = [rect for rect in painted if rect]
+    return painted[0].unionall(painted[1:]) if painted else None
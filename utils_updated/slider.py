@@ -1,7 +1,7 @@
 # utils/slider.py
 
 import pygame
-from .settings import get_font, BLACK
+from .settings import render_text, BLACK
 
 class Slider:
     def __init__(self, x, y, width, height, min_val, max_val, start_val, color=BLACK, label=None):
@@ -32,9 +32,8 @@ class Slider:
             self.knob_radius,
         )
         # Draw min and max labels
-        font = get_font(12)
-        min_label = font.render(str(int(self.min_val)), True, self.color)
-        max_label = font.render(str(int(self.max_val)), True, self.color)
+        min_label = render_text(str(int(self.min_val)), 12, self.color)
+        max_label = render_text(str(int(self.max_val)), 12, self.color)
         win.blit(
             min_label,
             (self.rect.x - min_label.get_width() // 2, self.rect.y + self.rect.height + 5),
@@ -48,8 +47,7 @@ class Slider:
         )
         # Draw label if available
         if self.label:
-            label_font = get_font(14)
-            label_surface = label_font.render(self.label, True, self.color)
+            label_surface = render_text(self.label, 14, self.color)
             win.blit(
                 label_surface,
                 (
@@ -58,6 +56,12 @@ class Slider:
                 ),
             )
 
+    def get_top(self):
+        # Highest y drawn to, the label sits above the slider
+        if self.label:
+            return self.rect.y - render_text(self.label, 14, self.color).get_height() - 5
+        return self.rect.y
+
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.is_over_knob(event.pos):
@@ -0,0 +1,88 @@
+# utils/stroke.py
+
+import math
+import numpy as np
+from .settings import PIXEL_SIZE
+
+# Strokes are rasterized as capsules (a disk swept along each segment).
+# A cell is painted when its centre lies within the brush radius of the
+# segment, the same test set_cell_color_circle applies to a single point.
+# Every row of a capsule is one column span since the shape is convex, and
+# all segments of a polyline are solved together in one set of array ops.
+
+
+def polyline_segments(points, brush_sizes):
+    # Start points, end points and radii as (segments, 1) columns.
+    # brush_sizes is one size for the whole line or one per segment
+    if len(points) == 1:
+        points = [points[0], points[0]]  # A single point is a dot
+    if isinstance(brush_sizes, (int, float)):
+        brush_sizes = [brush_sizes] * (len(points) - 1)
+    coords = np.asarray(points, dtype=np.float64)
+    radii = np.asarray(brush_sizes, dtype=np.float64)[:, None]
+    return coords[:-1], coords[1:], radii
+
+
+def polyline_spans(points, brush_sizes, rows, cols):
+    # Returns (row0, lefts, rights) where lefts and rights are shaped
+    # (segments, rows): segment k covers [lefts[k, i], rights[k, i]) on
+    # row row0 + i, spans with left >= right are empty. None if no row is hit
+    start, end, radius = polyline_segments(points, brush_sizes)
+    x1, y1 = start[:, :1], start[:, 1:]
+    x2, y2 = end[:, :1], end[:, 1:]
+    half = PIXEL_SIZE // 2
+
+    row0 = max(math.ceil(((np.minimum(y1, y2) - radius).min() - half) / PIXEL_SIZE), 0)
+    row1 = min(math.floor(((np.maximum(y1, y2) + radius).max() - half) / PIXEL_SIZE) + 1, rows)
+    if row0 >= row1:
+        return None
+
+    # Centre line of every row and the x range of each capsule on it
+    y = (np.arange(row0, row1) * PIXEL_SIZE + half)[None, :]
+    left = np.full((len(radius), len(y[0])), np.inf)
+    right = np.full_like(left, -np.inf)
+
+    # The two end disks
+    for cx, cy in ((x1, y1), (x2, y2)):
+        h = radius * radius - (y - cy) ** 2
+        inside = h >= 0
+        reach = np.sqrt(np.where(inside, h, 0))
+        left = np.where(inside, np.minimum(left, cx - reach), left)
+        right = np.where(inside, np.maximum(right, cx + reach), right)
+
+    # The band between them: 0 <= along <= length and |across| <= radius
+    dx, dy = x2 - x1, y2 - y1
+    length = np.hypot(dx, dy)
+    safe_length = np.where(length > 0, length, 1)
+    ux, uy = dx / safe_length, dy / safe_length
+    low = np.full_like(left, -np.inf)
+    high = np.full_like(left, np.inf)
+    for slope, offset, lower, upper in (
+        (ux, (y - y1) * uy, 0, length),         # along the segment
+        (-uy, (y - y1) * ux, -radius, radius),  # across the segment
+    ):
+        # slope * (x - x1) + offset must lie in [lower, upper]
+        flat = np.abs(slope) < 1e-12
+        safe_slope = np.where(flat, 1, slope)
+        a = (lower - offset) / safe_slope + x1
+        b = (upper - offset) / safe_slope + x1
+        level = (offset >= lower) & (offset <= upper)
+        low = np.where(flat, np.where(level, low, np.inf), np.maximum(low, np.minimum(a, b)))
+        high = np.where(flat, high, np.minimum(high, np.maximum(a, b)))
+    band = (low <= high) & (length > 0)
+    left = np.where(band, np.minimum(left, low), left)
+    right = np.where(band, np.maximum(right, high), right)
+
+    # Columns whose centre falls inside [left, right]
+    lefts = np.clip(np.ceil((left - half) / PIXEL_SIZE), 0, cols).astype(np.intp)
+    rights = np.clip(np.floor((right - half) / PIXEL_SIZE) + 1, 0, cols).astype(np.intp)
+    return row0, lefts, rights
+
+
+def capsule_spans(pos1, pos2, radius, rows, cols):
+    # Spans of a single segment, lefts and rights are one dimensional
+    spans = polyline_spans([pos1, pos2], radius, rows, cols)
+    if spans is None:
+        return None
+    row0, lefts, rights = spans
+    return row0, lefts[0], rights[0]
@@ -0,0 +1,299 @@
+# utils/tiled_grid.py
+
+import pygame
+import numpy as np
+from collections import deque
+from .settings import *
+from .grid import uniform_block, uniform_color
+from .array_grid import ArrayGrid
+from .fill import scanline_fill, color_distance_sq
+
+# Sparse grid for documents far larger than the window. The canvas is cut
+# into square tiles that only exist once something is painted on them. A
+# tile is a (size, size, channels) uint8 array, or just a colour when all of its
+# cells share it, so a fill over untouched area stays one tuple per tile.
+# Missing tiles are background.
+
+
+class TiledGrid(ArrayGrid):
+    def __init__(self, rows, cols, color, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        super().__init__(rows, cols, tuple(color))
+
+    def init_grid(self):
+        # (tile_row, tile_col) -> array or colour
+        return {}
+
+    def tile_rect(self, key):
+        size = self.tile_size
+        top, left = key[0] * size, key[1] * size
+        return top, left, min(top + size, self.rows), min(left + size, self.cols)
+
+    def tiles_in(self, row0, col0, row1, col1):
+        # (key, top, left, r0, c0, r1, c1) for every tile overlapping the
+        # region: where the tile starts and the part of the region it holds
+        size = self.tile_size
+        for tile_row in range(row0 // size, (row1 - 1) // size + 1):
+            top = tile_row * size
+            r0, r1 = max(row0, top), min(row1, top + size)
+            for tile_col in range(col0 // size, (col1 - 1) // size + 1):
+                left = tile_col * size
+                yield (tile_row, tile_col), top, left, r0, max(col0, left), r1, min(col1, left + size)
+
+    def get_tile(self, key):
+        # Array or colour of a tile. Tiles of an opened project are read
+        # from the file the first time they are needed
+        tile = self.grid.get(key, self.color)
+        if not isinstance(tile, (tuple, np.ndarray)):
+            tile = self.grid[key] = tile.load()
+        return tile
+
+    def tile_color(self, key):
+        # The colour of a uniform tile, None for one with its own cells
+        tile = self.get_tile(key)
+        return tile if isinstance(tile, tuple) else None
+
+    def writable_tile(self, key):
+        tile = self.get_tile(key)
+        if isinstance(tile, tuple):
+            # First write to a uniform tile, give it its own cells
+            color = tile
+            tile = np.empty((self.tile_size, self.tile_size, len(self.color)), dtype=np.uint8)
+            tile[...] = color
+            self.grid[key] = tile
+        return tile
+
+    def set_tile(self, key, color):
+        # Makes a whole tile one colour, dropping its cells
+        if color == self.color:
+            self.grid.pop(key, None)
+        else:
+            self.grid[key] = color
+
+    def compact(self, key):
+        # Turns an array tile back into a colour once all its cells agree
+        tile = self.grid.get(key)
+        if isinstance(tile, np.ndarray) and (tile == tile[0, 0]).all():
+            self.set_tile(key, tuple(int(channel) for channel in tile[0, 0]))
+
+    def clear(self):
+        # Only painted tiles change, the rest already are background
+        for key in self.grid:
+            self.mark_dirty(*self.tile_rect(key))
+        self.grid = {}
+
+    def set_cell_color(self, row, col, color):
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            self.mark_dirty(row, col, row + 1, col + 1)
+            size = self.tile_size
+            self.writable_tile((row // size, col // size))[row % size, col % size] = color
+
+    def get_cell_color(self, row, col):
+        size = self.tile_size
+        tile = self.get_tile((row // size, col // size))
+        if isinstance(tile, tuple):
+            return tile
+        return tuple(int(v) for v in tile[row % size, col % size])
+
+    def snapshot(self):
+        # Colours and tiles still on disk can be shared, arrays are copied
+        return {key: tile.copy() if isinstance(tile, np.ndarray) else tile for key, tile in self.grid.items()}
+
+    def restore(self, state):
+        for key in set(self.grid) | set(state):
+            self.mark_dirty(*self.tile_rect(key))
+        self.grid = {key: tile.copy() if isinstance(tile, np.ndarray) else tile for key, tile in state.items()}
+
+    def painted_bounds(self):
+        if not self.grid:
+            return None
+        rects = self.painted_rects()
+        return (
+            min(rect[0] for rect in rects),
+            min(rect[1] for rect in rects),
+            max(rect[2] for rect in rects),
+            max(rect[3] for rect in rects),
+        )
+
+    def painted_rects(self):
+        return [self.tile_rect(key) for key in self.grid]
+
+    def read_region(self, row0, col0, row1, col1):
+        # A region inside one uniform tile comes back as a read-only
+        # broadcast view (see uniform_block), anything else as a new array
+        size = self.tile_size
+        if row0 < row1 and col0 < col1 and row0 // size == (row1 - 1) // size and col0 // size == (col1 - 1) // size:
+            tile = self.get_tile((row0 // size, col0 // size))
+            if isinstance(tile, tuple):
+                return uniform_block(tile, (row1 - row0, col1 - col0, len(self.color)))
+
+        block = np.empty((max(row1 - row0, 0), max(col1 - col0, 0), len(self.color)), dtype=np.uint8)
+        if block.size == 0:
+            return block
+        for key, top, left, r0, c0, r1, c1 in self.tiles_in(row0, col0, row1, col1):
+            tile = self.get_tile(key)
+            target = block[r0 - row0:r1 - row0, c0 - col0:c1 - col0]
+            if isinstance(tile, tuple):
+                target[...] = tile
+            else:
+                target[...] = tile[r0 - top:r1 - top, c0 - left:c1 - left]
+        return block
+
+    def write_region(self, row0, col0, block):
+        row1, col1 = row0 + block.shape[0], col0 + block.shape[1]
+        self.mark_dirty(row0, col0, row1, col1)
+        color = uniform_color(block)
+        for key, top, left, r0, c0, r1, c1 in self.tiles_in(row0, col0, row1, col1):
+            if color is not None:
+                if (r0, c0, r1, c1) == self.tile_rect(key):
+                    self.set_tile(key, color)
+                    continue
+                if self.tile_color(key) == color:
+                    continue  # Already that colour, nothing to allocate
+            tile = self.writable_tile(key)
+            tile[r0 - top:r1 - top, c0 - left:c1 - left] = block[r0 - row0:r1 - row0, c0 - col0:c1 - col0]
+            self.compact(key)
+
+    def paint_mask(self, row0, col0, mask, color):
+        row1, col1 = row0 + mask.shape[0], col0 + mask.shape[1]
+        self.mark_dirty(row0, col0, row1, col1)
+        color = tuple(color)
+        for key, top, left, r0, c0, r1, c1 in self.tiles_in(row0, col0, row1, col1):
+            part = mask[r0 - row0:r1 - row0, c0 - col0:c1 - col0]
+            if self.tile_color(key) == color or not part.any():
+                continue  # Don't allocate tiles the stroke leaves as they are
+            self.writable_tile(key)[r0 - top:r1 - top, c0 - left:c1 - left][part] = color
+
+    def flood_fill(self, pos, new_color, tolerance=0, connectivity=4):
+        # Spreads tile by tile, seeding each tile with the cells the fill
+        # enters it through. A uniform tile that matches is filled whole
+        # without looking at its cells
+        x, y = pos
+        row = y // PIXEL_SIZE
+        col = x // PIXEL_SIZE
+
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None
+
+        target_color = self.get_cell_color(row, col)
+        new_color = tuple(new_color)
+        if tolerance == 0 and target_color == new_color:
+            return None
+        limit = tolerance * tolerance
+        size = self.tile_size
+        tile_rows = (self.rows - 1) // size + 1
+        tile_cols = (self.cols - 1) // size + 1
+        neighbours = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+        if connectivity == 8:
+            neighbours += [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+        start = (row // size, col // size)
+        # Cells the fill enters each queued tile at, None for uniform tiles
+        seeds = {start: np.zeros((size, size), dtype=bool)}
+        seeds[start][row % size, col % size] = True
+        whole = set()  # Uniform tiles filled entirely
+        filled = {}    # Array tiles -> mask of their filled cells
+        queue = deque([start])
+
+        while queue:
+            key = queue.popleft()
+            seed = seeds.pop(key)
+            tile = self.get_tile(key)
+            if isinstance(tile, tuple):
+                whole.add(key)
+                region = None
+            else:
+                top, left, bottom, right = self.tile_rect(key)
+                if tolerance == 0:
+                    matches = np.all(tile == target_color, axis=2)
+                else:
+                    diff = tile.astype(np.int32) - target_color
+                    matches = np.einsum('ijk,ijk->ij', diff, diff) <= limit
+                matches[bottom - top:] = False  # Past the document edge
+                matches[:, right - left:] = False
+                done = filled.get(key)
+                if done is not None:
+                    matches &= ~done
+                open_rows = [bytearray(line) for line in matches.view(np.uint8)]
+                for seed_row, seed_col in zip(*np.nonzero(seed & matches)):
+                    scanline_fill(open_rows, seed_row, seed_col, connectivity)
+                remaining = np.frombuffer(b''.join(open_rows), dtype=np.uint8).reshape(size, size)
+                region = matches & (remaining == 0)
+                if not region.any():
+                    continue
+                filled[key] = region if done is None else done | region
+
+            for d_row, d_col in neighbours:
+                next_key = (key[0] + d_row, key[1] + d_col)
+                if not (0 <= next_key[0] < tile_rows and 0 <= next_key[1] < tile_cols) or next_key in whole:
+                    continue
+                next_tile = self.get_tile(next_key)
+                if isinstance(next_tile, tuple):
+                    # Reaching a matching uniform tile anywhere fills all of it
+                    if next_key not in seeds and color_distance_sq(next_tile, target_color) <= limit:
+                        if region is None or self.edge_cells(region, d_row, d_col, connectivity).any():
+                            seeds[next_key] = None
+                            queue.append(next_key)
+                    continue
+                if region is None:
+                    entry = np.ones(size, dtype=bool) if d_row == 0 or d_col == 0 else True
+                else:
+                    entry = self.edge_cells(region, d_row, d_col, connectivity)
+                    if not np.any(entry):
+                        continue
+                seed = seeds.get(next_key)
+                if seed is None:
+                    seed = seeds[next_key] = np.zeros((size, size), dtype=bool)
+                    queue.append(next_key)
+                # The neighbour's cells along the shared edge or corner
+                seed[-1 if d_row < 0 else 0 if d_row > 0 else slice(None),
+                     -1 if d_col < 0 else 0 if d_col > 0 else slice(None)] |= entry
+
+        if not whole and not filled:
+            return None
+        bbox = [self.rows, self.cols, 0, 0]
+        for key in whole:
+            rect = self.tile_rect(key)
+            self.mark_dirty(*rect)
+            self.set_tile(key, new_color)
+            self.grow_bbox(bbox, rect)
+        for key, region in filled.items():
+            rows = np.nonzero(region.any(axis=1))[0]
+            cols = np.nonzero(region.any(axis=0))[0]
+            top, left = key[0] * size, key[1] * size
+            rect = (top + rows[0], left + cols[0], top + rows[-1] + 1, left + cols[-1] + 1)
+            self.mark_dirty(*rect)
+            self.writable_tile(key)[region] = new_color
+            self.compact(key)
+            self.grow_bbox(bbox, rect)
+        return tuple(int(v) for v in bbox)
+
+    @staticmethod
+    def edge_cells(region, d_row, d_col, connectivity):
+        # Filled cells of a tile that touch the neighbour in direction
+        # (d_row, d_col), as a line along the shared edge or a single corner
+        if d_row and d_col:
+            return region[0 if d_row < 0 else -1, 0 if d_col < 0 else -1]
+        line = region[0 if d_row < 0 else -1] if d_row else region[:, 0 if d_col < 0 else -1]
+        if connectivity == 8:
+            # Diagonal steps across the edge
+            spread = line.copy()
+            spread[1:] |= line[:-1]
+            spread[:-1] |= line[1:]
+            return spread
+        return line
+
+    @staticmethod
+    def grow_bbox(bbox, rect):
+        bbox[0] = min(bbox[0], rect[0])
+        bbox[1] = min(bbox[1], rect[1])
+        bbox[2] = max(bbox[2], rect[2])
+        bbox[3] = max(bbox[3], rect[3])
+
+    def draw(self, win):
+        # The part of the document that fits the canvas area
+        rows, cols = min(self.rows, ROWS), min(self.cols, COLS)
+        cells = np.ascontiguousarray(self.read_region(0, 0, rows, cols))
+        surface = pygame.surfarray.make_surface(cells.swapaxes(0, 1))
+        win.blit(pygame.transform.scale(surface, (cols * PIXEL_SIZE, rows * PIXEL_SIZE)), (0, 0))
+        self.draw_grid_lines(win)
@@ -0,0 +1,54 @@
+# utils/toolbar.py
+
+import pygame
+from .settings import *
+
+
+class Toolbar:
+    def __init__(self, buttons, sliders):
+        self.buttons = buttons
+        self.sliders = sliders
+        # Slider labels reach a little above the toolbar, over the canvas
+        top = min([HEIGHT - TOOLBAR_HEIGHT] + [slider.get_top() for slider in sliders])
+        self.rect = pygame.Rect(0, top, WIDTH, HEIGHT - top)
+        # Buttons and sliders draw in window coordinates, so they paint a
+        # window sized layer and only the toolbar part of it is kept
+        self.layer = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        self.surface = self.layer.subsurface(self.rect)
+        self.state = None
+
+    def update(self, highlighted=(), disabled=()):
+        # highlighted and disabled hold button texts. Returns True if re-rendered
+        state = (
+            tuple(sorted(highlighted)),
+            tuple(sorted(disabled)),
+            tuple(slider.knob_x for slider in self.sliders),
+        )
+        changed = state != self.state
+        if changed:
+            self.state = state
+            self.render(highlighted, disabled)
+        return changed
+
+    def draw(self, win, area=None):
+        # area limits the blit to a window rect. The labels are blended over
+        # the canvas, so the canvas under area must have been drawn again
+        if area is None:
+            win.blit(self.surface, self.rect)
+            return
+        area = area.clip(self.rect)
+        if area:
+            win.blit(self.surface, area, area.move(-self.rect.x, -self.rect.y))
+
+    def render(self, highlighted, disabled):
+        self.surface.fill((0, 0, 0, 0))
+        self.layer.fill(UI_BG_COLOR, (0, HEIGHT - TOOLBAR_HEIGHT, WIDTH, TOOLBAR_HEIGHT))
+
+        for button in self.buttons:
+            # Highlight the active tool button
+            if button.text in highlighted:
+                pygame.draw.rect(self.layer, YELLOW, (button.x-2, button.y-2, button.width+4, button.height+4), 2)
+            button.draw(self.layer, enabled=button.text not in disabled)
+
+        for slider in self.sliders:
+            slider.draw(self.layer)
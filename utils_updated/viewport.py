@@ -0,0 +1,71 @@
+# utils/viewport.py
+
+import math
+import pygame
+from .settings import *
+
+
+class Viewport:
+    # The part of a rows x cols document shown in a width x height window
+    # area, at zoom window pixels per cell. Grid methods take positions in
+    # canvas pixels (PIXEL_SIZE per cell), to_canvas() converts to those
+    def __init__(self, rows, cols, width, height, zoom=PIXEL_SIZE, movable=True):
+        self.rows = rows
+        self.cols = cols
+        self.width = width
+        self.height = height
+        self.zoom = zoom
+        self.movable = movable  # False pins a document that fits the window
+        # Document position of the area's top-left corner, in cells
+        self.x = 0.0
+        self.y = 0.0
+
+    def to_canvas(self, pos):
+        # Window position -> canvas pixel position
+        return (
+            int((self.x + pos[0] / self.zoom) * PIXEL_SIZE),
+            int((self.y + pos[1] / self.zoom) * PIXEL_SIZE),
+        )
+
+    def visible_cells(self):
+        # Half-open (row0, col0, row1, col1) of the cells at least partly in view
+        return (
+            int(self.y),
+            int(self.x),
+            min(math.ceil(self.y + self.height / self.zoom), self.rows),
+            min(math.ceil(self.x + self.width / self.zoom), self.cols),
+        )
+
+    def document_rect(self):
+        # The whole document in window coordinates
+        return pygame.Rect(
+            -math.floor(self.x * self.zoom), -math.floor(self.y * self.zoom),
+            self.cols * self.zoom, self.rows * self.zoom,
+        )
+
+    def pan(self, dx, dy):
+        # Moves the document by (dx, dy) window pixels
+        if not self.movable:
+            return
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+        self.clamp()
+
+    def zoom_at(self, pos, steps):
+        # Steps through ZOOM_LEVELS keeping the cell under pos in place
+        if not self.movable:
+            return
+        levels = sorted(set(ZOOM_LEVELS) | {self.zoom})
+        index = min(max(levels.index(self.zoom) + steps, 0), len(levels) - 1)
+        zoom = levels[index]
+        if zoom == self.zoom:
+            return
+        self.x += pos[0] / self.zoom - pos[0] / zoom
+        self.y += pos[1] / self.zoom - pos[1] / zoom
+        self.zoom = zoom
+        self.clamp()
+
+    def clamp(self):
+        # Keep the document covering the area where it's big enough to
+        self.x = min(max(self.x, 0.0), max(self.cols - self.width / self.zoom, 0.0))
+        self.y = min(max(self.y, 0.0), max(self.rows - self.height / self.zoom, 0.0))